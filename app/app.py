@@ -3,66 +3,58 @@ import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse
-from sqlalchemy import insert, select
-from sqlalchemy.sql.expression import false
-
-from app.db.sessions import async_engine, create_tables
-from app.db.tables.offers import Offer
-from app.db.tables.products import Product
-from app.external_service.offer_handler import get_product_offers
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.cache.response_cache import product_cache
+from app.db.migrations import check_schema_version
+from app.db.sessions import async_engine, lock_engine
+from app.external_service.offer_handler import (client_stats, close_client,
+                                                get_client)
+from app.internal_models.encoding import DefaultResponse
+from app.jobs import offer_refresh
+from app.jobs.coordination import RefreshCoordinator
+from app.jobs.offer_refresh import refresh_offers
+from app.jobs.partition_maintenance import run_partition_maintenance
+from app.jobs.scheduler import offer_scheduler
+from app.metrics.instruments import MetricsMiddleware
+from app.metrics.query_stats import QueryStatsMiddleware, instrument_queries
+from app.metrics.registry import registry
 from app.settings.conf import settings
 
-from .router import offers, products, token
+from .router import export, offers, products, token
 
 logger = logging.getLogger()
 
 
 async def update_offers():
-    while True:
-        logger.info("Periodically job starting. Check offers..")
-        statement = select(Product).filter(Product.is_deleted == false())
-        async with async_engine.connect() as conn:
-            result = await conn.execute(statement)
-
-            for product in result.fetchall():
-                product_id = product[0]
-                logger.info(f"Check offer for productId <{product_id}>")
-                response_product_offers = await get_product_offers(id=product_id)
-
-                response_status = response_product_offers.get("status_code")
-                response_data = response_product_offers.get("data", [{}])
-                if response_status != status.HTTP_200_OK:
-                    logger.error(
-                        f"Offer update failed <{response_status}>, <{response_data}>,"
-                    )
-                    return
-                for offer in response_data:
-                    if offer:
-                        offer_id = offer.get("id")
-                        price = offer.get("price")
-                        items_in_stock = offer.get("items_in_stock")
-                        logger.info(
-                            f"Offer id <{offer_id}>, price <{price}>, \
-                                items in stock <{items_in_stock}>, productId <{product_id}>"
-                        )
-                        stmt = insert(Offer).values(
-                            price=price,
-                            items_in_stock=items_in_stock,
-                            offer_id=offer_id,
-                            product_id=product_id,
-                        )
-                        result = await conn.execute(stmt)
-                        await conn.commit()
-        await async_engine.dispose()
-        await asyncio.sleep(settings.offer_job_period)
+    async with RefreshCoordinator(lock_engine) as coordinator:
+        if settings.offer_job_schedule == "adaptive":
+            await offer_scheduler.run(coordinator)
+            return
+        while True:
+            try:
+                shard = await coordinator.claim()
+                if shard is not None:
+                    logger.info("Periodically job starting. Check offers..")
+                    await refresh_offers(shard)
+            except Exception as exc:
+                logger.error(f"Offer refresh sweep failed <{exc!r}>")
+            await asyncio.sleep(settings.offer_job_period)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_tables()
-    asyncio.create_task(update_offers())
+    await check_schema_version(async_engine)
+    get_client()
+    tasks = [
+        asyncio.create_task(update_offers()),
+        asyncio.create_task(run_partition_maintenance()),
+    ]
     yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await close_client()
 
 
 def get_application() -> FastAPI:
@@ -71,6 +63,7 @@ def get_application() -> FastAPI:
         description=settings.description,
         docs_url="/docs",
         lifespan=lifespan,
+        default_response_class=DefaultResponse,
         responses={
             status.HTTP_401_UNAUTHORIZED: {"description": "Not authenticated."},
             status.HTTP_500_INTERNAL_SERVER_ERROR: {
@@ -80,6 +73,19 @@ def get_application() -> FastAPI:
         swagger_ui_parameters={"filters": True},
     )
 
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/metrics", include_in_schema=False)
+        async def metrics():
+            return PlainTextResponse(
+                registry.render(), media_type="text/plain; version=0.0.4"
+            )
+
+    if settings.sql_instrumentation:
+        instrument_queries(async_engine)
+        app.add_middleware(QueryStatsMiddleware)
+
     @app.exception_handler(Exception)
     async def base_exception_handler(request: Request, exc: Exception) -> JSONResponse:
         return JSONResponse(
@@ -91,7 +97,22 @@ def get_application() -> FastAPI:
     async def root():
         return {"message": "Welcome to product microservice!"}
 
+    @app.get("/stats/offer-client", include_in_schema=False)
+    async def offer_client_stats():
+        return client_stats()
+
+    @app.get("/stats/refresh", include_in_schema=False)
+    async def refresh_stats():
+        if settings.offer_job_schedule == "adaptive":
+            return offer_scheduler.as_dict()
+        return offer_refresh.last_sweep.as_dict() if offer_refresh.last_sweep else {}
+
+    @app.get("/stats/product-cache", include_in_schema=False)
+    async def product_cache_stats():
+        return product_cache.stats()
+
     app.include_router(products.router, prefix=settings.api_prefix)
     app.include_router(offers.router, prefix=settings.api_prefix)
     app.include_router(token.router, prefix=settings.api_prefix)
+    app.include_router(export.router, prefix=settings.api_prefix)
     return app
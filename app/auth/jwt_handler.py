@@ -4,6 +4,7 @@ import time
 
 from jose import jwt
 
+from app.auth.token_cache import verified_tokens
 from app.db.err import EntityDoesNotExist
 from app.internal_models.models import Token
 from app.settings.conf import settings
@@ -28,8 +29,14 @@ def signJWT(email: str) -> Token:
 
 
 def decodeJWT(token: str):
+    cached = verified_tokens.get(token)
+    if cached is not None:
+        return cached
     try:
         decode_token = jwt.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHM)
-        return decode_token if decode_token["expire"] >= time.time() else None
+        if decode_token["expire"] < time.time():
+            return None
+        verified_tokens.set(token, decode_token)
+        return decode_token
     except EntityDoesNotExist:
         raise EntityDoesNotExist
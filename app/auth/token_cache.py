@@ -0,0 +1,49 @@
+# Cache of verified JWT payloads, so repeat requests skip the signature check
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.settings.conf import settings
+
+
+class VerifiedTokenCache:
+    """LRU cache of decoded payloads keyed by the token's SHA-256 digest.
+
+    Entries are only returned until the payload's ``expire`` time.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Dict]:
+        key = self._key(token)
+        payload = self._entries.get(key)
+        if payload is None:
+            return None
+        if payload["expire"] < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def set(self, token: str, payload: Dict) -> None:
+        if self.maxsize <= 0:
+            return
+        key = self._key(token)
+        self._entries[key] = payload
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+verified_tokens = VerifiedTokenCache(maxsize=settings.jwt_cache_size)
@@ -0,0 +1,31 @@
+from hashlib import sha1
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+
+def make_etag(version: str, request: Request) -> str:
+    """Strong ETag for the representation of ``request`` at resource ``version``."""
+    resource = f"{request.url.path}?{request.url.query}"
+    return f'"{version}-{sha1(resource.encode()).hexdigest()[:16]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 response when the client already holds ``etag``, otherwise None.
+
+    Only call this once the resource is known to exist, ``If-None-Match: *``
+    matches any ETag.
+    """
+    if etag_matches(request, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    return None
@@ -0,0 +1,95 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+from app.settings.conf import settings
+
+
+class ResponseCache:
+    """Size bounded LRU cache of serialized response bodies with a TTL.
+
+    Every invalidation bumps ``generation``. A body computed before an
+    invalidation is not stored, so a slow reader cannot bring stale data
+    back into the cache.
+
+    Entries also keep the version of the resource they were computed at (see
+    ProductDatabase.product_version), a lookup with another version is a miss.
+    Writes made by other processes change that version, so this cache never
+    serves a body older than the ETag derived from it.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable, version: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic() or entry[1] != version:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def set(self, key: Hashable, body: bytes, generation: int, version: str) -> None:
+        if generation != self.generation or self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, version, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def replace(self, key: Hashable, body: bytes, generation: int, version: str):
+        """Swap the body of a cached entry, keeping its expiry and LRU position."""
+        entry = self._entries.get(key)
+        if generation != self.generation or entry is None or entry[1] == version:
+            return
+        self._entries[key] = (entry[0], version, body)
+
+    def version(self, key: Hashable) -> Optional[str]:
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def keys(self, predicate=None) -> List[Hashable]:
+        return [key for key in self._entries if predicate is None or predicate(key)]
+
+    def invalidate(self, predicate) -> None:
+        self.generation += 1
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Keys are ("product", product_id) and ("products", limit, cursor)
+product_cache = ResponseCache(
+    maxsize=settings.product_cache_size, ttl=settings.product_cache_ttl
+)
+
+
+def invalidate_product(product_id) -> None:
+    """Drop the cached product and every catalog page."""
+    product_cache.invalidate(
+        lambda key: key[0] == "products" or key == ("product", product_id)
+    )
+
+
+def invalidate_catalog() -> None:
+    """Drop every catalog page, for example after new products were added."""
+    product_cache.invalidate(lambda key: key[0] == "products")
@@ -0,0 +1,79 @@
+# Rebuilds cached response bodies after offers were refreshed, so hot products
+# and catalog pages keep being served from the cache instead of missing once
+# after every refresh. Only entries still in the cache are rebuilt, they keep
+# their expiry, so entries nobody reads still age out.
+
+import asyncio
+import logging
+from typing import Hashable, Iterable, Optional, Set
+
+from app.cache.response_cache import product_cache
+from app.db.err import EntityDoesNotExist, InvalidCursor
+from app.db.product_database import ProductDatabase
+from app.db.sessions import async_session
+from app.internal_models.encoding import dumps
+
+logger = logging.getLogger()
+
+_pending: Set[Hashable] = set()
+_worker: Optional[asyncio.Task] = None
+
+
+async def _rebuild(database: ProductDatabase, key: Hashable) -> None:
+    # Keys are ("product", product_id) and ("products", limit, cursor)
+    generation = product_cache.generation
+    if key[0] == "product":
+        version = await database.product_version(key[1])
+    else:
+        version = await database.products_version(limit=key[1], cursor=key[2])
+    if version is None:
+        raise EntityDoesNotExist
+    if version == product_cache.version(key):
+        return
+    if key[0] == "product":
+        response = await database.get(product_id=key[1])
+    else:
+        response = await database.get_all(limit=key[1], cursor=key[2])
+    product_cache.replace(key, dumps(response), generation, version)
+
+
+async def rewarm(keys: Iterable[Hashable]) -> None:
+    """Rebuild the cached bodies of ``keys`` that changed since they were cached."""
+    async with async_session() as session:
+        database = ProductDatabase(session)
+        for key in keys:
+            try:
+                await _rebuild(database, key)
+            except (EntityDoesNotExist, InvalidCursor):
+                product_cache.invalidate(lambda cached: cached == key)
+
+
+async def _drain() -> None:
+    while _pending:
+        keys = list(_pending)
+        _pending.clear()
+        await rewarm(keys)
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Response cache rewarm failed <{task.exception()!r}>")
+
+
+def schedule_rewarm(keys: Iterable[Hashable]) -> None:
+    """Rewarm ``keys`` in the background, requests made meanwhile are merged."""
+    global _worker
+    _pending.update(keys)
+    if _pending and (_worker is None or _worker.done()):
+        _worker = asyncio.create_task(_drain())
+        _worker.add_done_callback(_log_failure)
+
+
+def product_keys(product_ids) -> list:
+    """Cached entries showing any of ``product_ids``: the products and the
+    catalog pages."""
+    product_ids = set(product_ids)
+    return product_cache.keys(
+        lambda key: key[0] == "products"
+        or (key[0] == "product" and key[1] in product_ids)
+    )
@@ -0,0 +1,108 @@
+# Compacts existing offer history into change-only runs.
+#
+# Consecutive snapshots of an offer with the same price and stock are merged
+# into the first row of the run, which keeps the run's last_confirmed_at and
+# the number of snapshots it stands for. Like live ingestion, runs never cross
+# a partition period (OFFER_PARTITION_MONTHS). current_offers is rebuilt
+# afterwards so it points at the surviving rows.
+
+import asyncio
+import logging
+
+from sqlalchemy import text
+
+from app.db.current_offers import rebuild_current_offers
+from app.db.sessions import async_engine
+from app.db.versioning import bump_data_version
+from app.settings.conf import settings
+
+logger = logging.getLogger()
+
+MARK_RUNS = """
+CREATE TEMPORARY TABLE offer_runs ON COMMIT DROP AS
+WITH marked AS (
+    SELECT
+        id,
+        product_id,
+        offer_id,
+        created_at,
+        samples,
+        coalesce(last_confirmed_at, created_at) AS confirmed_at,
+        {period} AS period,
+        CASE
+            WHEN (price, items_in_stock) IS NOT DISTINCT FROM (
+                lag(price) OVER offer_window,
+                lag(items_in_stock) OVER offer_window
+            ) THEN 0
+            ELSE 1
+        END AS run_start
+    FROM offers
+    WINDOW offer_window AS (
+        PARTITION BY product_id, offer_id, {period} ORDER BY created_at, id
+    )
+),
+numbered AS (
+    SELECT
+        *,
+        sum(run_start) OVER (
+            PARTITION BY product_id, offer_id, period ORDER BY created_at, id
+        ) AS run
+    FROM marked
+)
+SELECT
+    id,
+    first_value(id) OVER run_window AS keep_id,
+    max(confirmed_at) OVER run_window AS confirmed_at,
+    sum(samples) OVER run_window AS samples
+FROM numbered
+WINDOW run_window AS (
+    PARTITION BY product_id, offer_id, period, run
+    ORDER BY created_at, id
+    ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+)
+"""
+
+UPDATE_RUNS = """
+UPDATE offers
+SET last_confirmed_at = offer_runs.confirmed_at, samples = offer_runs.samples
+FROM offer_runs
+WHERE offers.id = offer_runs.id AND offer_runs.id = offer_runs.keep_id
+"""
+
+DELETE_MERGED = """
+DELETE FROM offers
+USING offer_runs
+WHERE offers.id = offer_runs.id AND offer_runs.id <> offer_runs.keep_id
+"""
+
+
+def mark_runs_statement() -> str:
+    # Index of the partition period, the same floor partition_start() uses
+    months = max(settings.offer_partition_months, 1)
+    period = (
+        "(extract(year FROM created_at)::int * 12"
+        f" + extract(month FROM created_at)::int - 1) / {months}"
+    )
+    return MARK_RUNS.format(period=period)
+
+
+async def compact_offer_history(conn) -> int:
+    """Merge runs of identical snapshots, returning the number of rows removed."""
+    await conn.execute(text(mark_runs_statement()))
+    await conn.execute(text(UPDATE_RUNS))
+    deleted = await conn.execute(text(DELETE_MERGED))
+    await rebuild_current_offers(conn)
+    return deleted.rowcount
+
+
+async def main():
+    async with async_engine.begin() as conn:
+        removed = await compact_offer_history(conn)
+    async with async_engine.begin() as conn:
+        await bump_data_version(conn)
+    await async_engine.dispose()
+    logger.info(f"Offer history compacted, {removed} rows merged into runs")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
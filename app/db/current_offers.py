@@ -0,0 +1,96 @@
+# Maintains the current_offers table from the append-only offers history
+
+import asyncio
+import logging
+from typing import Dict, List
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db.sessions import async_engine
+from app.db.tables.current_offers import CurrentOffer
+from app.db.tables.offers import Offer
+from app.db.versioning import bump_data_version
+
+logger = logging.getLogger()
+
+# Six columns per row, keep well below asyncpg's 32767 bind parameters
+MAX_ROWS_PER_STATEMENT = 5000
+
+
+async def upsert_current_offers(conn, rows: List[Dict]) -> None:
+    """Upsert snapshot rows into current_offers, keeping the newest per offer."""
+    # ON CONFLICT cannot touch the same row twice in one statement
+    latest = {}
+    for row in rows:
+        latest[(row["product_id"], row["offer_id"])] = row
+    rows = list(latest.values())
+
+    for start in range(0, len(rows), MAX_ROWS_PER_STATEMENT):
+        stmt = insert(CurrentOffer).values(
+            [
+                {
+                    "product_id": row["product_id"],
+                    "offer_id": row["offer_id"],
+                    "price": row["price"],
+                    "items_in_stock": row["items_in_stock"],
+                    "created_at": row["created_at"],
+                    "history_id": row["history_id"],
+                }
+                for row in rows[start : start + MAX_ROWS_PER_STATEMENT]
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CurrentOffer.product_id, CurrentOffer.offer_id],
+            set_={
+                "price": stmt.excluded.price,
+                "items_in_stock": stmt.excluded.items_in_stock,
+                "created_at": stmt.excluded.created_at,
+                "history_id": stmt.excluded.history_id,
+            },
+            where=CurrentOffer.created_at <= stmt.excluded.created_at,
+        )
+        await conn.execute(stmt)
+
+
+async def rebuild_current_offers(conn) -> None:
+    """Regenerate current_offers from the full offers history."""
+    latest = (
+        select(
+            Offer.product_id,
+            Offer.offer_id,
+            Offer.price,
+            Offer.items_in_stock,
+            func.coalesce(Offer.last_confirmed_at, Offer.created_at),
+            Offer.id,
+        )
+        .distinct(Offer.product_id, Offer.offer_id)
+        .order_by(Offer.product_id, Offer.offer_id, Offer.created_at.desc())
+    )
+    await conn.execute(delete(CurrentOffer))
+    await conn.execute(
+        insert(CurrentOffer).from_select(
+            [
+                "product_id",
+                "offer_id",
+                "price",
+                "items_in_stock",
+                "created_at",
+                "history_id",
+            ],
+            latest,
+        )
+    )
+
+
+async def main():
+    async with async_engine.begin() as conn:
+        await rebuild_current_offers(conn)
+    async with async_engine.begin() as conn:
+        await bump_data_version(conn)
+    await async_engine.dispose()
+    logger.info("Current offers rebuilt from history")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
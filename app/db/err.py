@@ -12,3 +12,15 @@ class EntityDoesNotCreatedByOffers(Exception):
 
 class StartTimeAfterEndTime(Exception):
     ...
+
+
+class OffersNotFetched(Exception):
+    ...
+
+
+class InvalidCursor(Exception):
+    ...
+
+
+class SchemaOutdated(Exception):
+    ...
@@ -0,0 +1,98 @@
+# Newline delimited JSON exports read with server side cursors
+
+from datetime import datetime
+from typing import AsyncIterator
+from uuid import UUID
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.sql.expression import false
+
+from app.db.offer_ingest import history_window
+from app.db.sessions import async_engine
+from app.db.tables.current_offers import CurrentOffer
+from app.db.tables.offers import Offer
+from app.db.tables.products import Product
+from app.internal_models.encoding import dumps_value
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def _line(item: dict) -> bytes:
+    return dumps_value(item) + b"\n"
+
+
+async def stream_catalog() -> AsyncIterator[bytes]:
+    """One line per undeleted product with its current offers."""
+    statement = (
+        select(
+            Product.id,
+            Product.name,
+            Product.description,
+            CurrentOffer.offer_id,
+            CurrentOffer.price,
+            CurrentOffer.items_in_stock,
+            CurrentOffer.created_at,
+        )
+        .outerjoin(CurrentOffer, CurrentOffer.product_id == Product.id)
+        .filter(Product.is_deleted == false())
+        .order_by(Product.id, CurrentOffer.offer_id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    async with async_engine.connect() as conn:
+        result = await conn.stream(statement)
+        product = None
+        async for row in result:
+            if product is None or product["id"] != row.id:
+                if product is not None:
+                    yield _line(product)
+                product = {
+                    "id": row.id,
+                    "name": row.name,
+                    "description": row.description,
+                    "offers": [],
+                }
+            if row.offer_id is not None:
+                product["offers"].append(
+                    {
+                        "offer_id": row.offer_id,
+                        "price": row.price,
+                        "items_in_stock": row.items_in_stock,
+                        "created_at": row.created_at,
+                    }
+                )
+        if product is not None:
+            yield _line(product)
+
+
+async def stream_offer_history(
+    offer_id: UUID,
+    start_time: datetime = datetime.min,
+    end_time: datetime = datetime.max,
+) -> AsyncIterator[bytes]:
+    """One line per history row of the offer, oldest first."""
+    statement = (
+        select(
+            Offer.created_at,
+            Offer.price,
+            Offer.items_in_stock,
+            func.coalesce(Offer.last_confirmed_at, Offer.created_at).label(
+                "last_confirmed_at"
+            ),
+        )
+        .join(Product)
+        .filter(
+            and_(
+                Offer.offer_id == offer_id,
+                *history_window(start_time, end_time),
+                Product.is_deleted == false(),
+            )
+        )
+        .order_by(Offer.created_at.asc(), Offer.id.asc())
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    async with async_engine.connect() as conn:
+        result = await conn.stream(statement)
+        async for row in result:
+            yield _line(dict(row._mapping))
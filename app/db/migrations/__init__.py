@@ -0,0 +1,89 @@
+# Versioned schema migrations.
+#
+# Every vNNNN_<name>.py module holds DESCRIPTION and either STATEMENTS or an
+# upgrade(conn) function for migrations that need Python logic. Migrations
+# are applied in order by "python -m app.db.migrations", each in its own
+# transaction, and recorded in the schema_version table.
+
+import logging
+from importlib import import_module
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+from app.db.err import SchemaOutdated
+
+logger = logging.getLogger()
+
+MIGRATIONS: List[Tuple[int, str]] = [
+    (1, "v0001_initial"),
+    (2, "v0002_hot_path_indexes"),
+    (3, "v0003_offer_rollups"),
+    (4, "v0004_offer_runs"),
+    (5, "v0005_partition_offers"),
+    (6, "v0006_data_version"),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Arbitrary key for the advisory lock serialising concurrent migration runs
+MIGRATION_LOCK_KEY = 7461001
+
+CREATE_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER NOT NULL PRIMARY KEY,
+    description VARCHAR NOT NULL,
+    applied_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now() NOT NULL
+)
+"""
+
+CURRENT_VERSION = "SELECT coalesce(max(version), 0) FROM schema_version"
+
+
+def migrate(engine) -> int:
+    """Apply pending migrations with a sync engine and return the schema version."""
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_VERSION_TABLE))
+
+    version = 0
+    for migration_version, module_name in MIGRATIONS:
+        migration = import_module(f"{__name__}.{module_name}")
+        with engine.begin() as conn:
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+            )
+            version = conn.execute(text(CURRENT_VERSION)).scalar()
+            if migration_version <= version:
+                continue
+            logger.info(
+                f"Applying migration {migration_version} <{migration.DESCRIPTION}>"
+            )
+            if hasattr(migration, "upgrade"):
+                migration.upgrade(conn)
+            else:
+                for statement in migration.STATEMENTS:
+                    conn.execute(text(statement))
+            conn.execute(
+                text(
+                    "INSERT INTO schema_version (version, description) "
+                    "VALUES (:version, :description)"
+                ),
+                {"version": migration_version, "description": migration.DESCRIPTION},
+            )
+            version = migration_version
+    return version
+
+
+async def check_schema_version(async_engine) -> int:
+    """Fail fast when the database schema is behind the application."""
+    async with async_engine.connect() as conn:
+        exists = await conn.execute(text("SELECT to_regclass('schema_version')"))
+        version = 0
+        if exists.scalar() is not None:
+            version = (await conn.execute(text(CURRENT_VERSION))).scalar()
+    if version < LATEST_VERSION:
+        raise SchemaOutdated(
+            f"Database schema version {version}, application needs {LATEST_VERSION}. "
+            "Run: python -m app.db.migrations"
+        )
+    return version
@@ -0,0 +1,6 @@
+from app.db.migrations import migrate
+from app.db.sessions import engine
+
+if __name__ == "__main__":
+    version = migrate(engine)
+    print(f"Database schema at version {version}")
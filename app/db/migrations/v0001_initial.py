@@ -0,0 +1,38 @@
+# Baseline schema, matching what create_all produced before migrations existed
+
+DESCRIPTION = "initial schema"
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        name VARCHAR NOT NULL,
+        description VARCHAR NOT NULL,
+        id UUID NOT NULL PRIMARY KEY,
+        is_deleted BOOLEAN NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_products_id ON products (id)",
+    """
+    CREATE TABLE IF NOT EXISTS offers (
+        created_at TIMESTAMP WITHOUT TIME ZONE
+            DEFAULT current_timestamp(0) NOT NULL,
+        price INTEGER NOT NULL,
+        items_in_stock INTEGER NOT NULL,
+        id UUID NOT NULL PRIMARY KEY,
+        product_id UUID REFERENCES products (id),
+        offer_id UUID
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_offers_id ON offers (id)",
+    """
+    CREATE TABLE IF NOT EXISTS current_offers (
+        created_at TIMESTAMP WITHOUT TIME ZONE
+            DEFAULT current_timestamp(0) NOT NULL,
+        price INTEGER NOT NULL,
+        items_in_stock INTEGER NOT NULL,
+        product_id UUID NOT NULL REFERENCES products (id),
+        offer_id UUID NOT NULL,
+        PRIMARY KEY (product_id, offer_id)
+    )
+    """,
+]
@@ -0,0 +1,16 @@
+DESCRIPTION = "indexes for offer history and live product lookups"
+
+STATEMENTS = [
+    """
+    CREATE INDEX IF NOT EXISTS ix_offers_offer_id_created_at
+        ON offers (offer_id, created_at)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_offers_product_id_offer_id_created_at
+        ON offers (product_id, offer_id, created_at)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_products_not_deleted
+        ON products (id) WHERE is_deleted = false
+    """,
+]
@@ -0,0 +1,22 @@
+DESCRIPTION = "per bucket OHLC rollups of offer snapshots"
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS offer_rollups (
+        offer_id UUID NOT NULL,
+        bucket VARCHAR NOT NULL,
+        bucket_start TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        product_id UUID NOT NULL REFERENCES products (id),
+        open_price INTEGER NOT NULL,
+        high_price INTEGER NOT NULL,
+        low_price INTEGER NOT NULL,
+        close_price INTEGER NOT NULL,
+        min_stock INTEGER NOT NULL,
+        max_stock INTEGER NOT NULL,
+        samples INTEGER NOT NULL,
+        open_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        close_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (offer_id, bucket, bucket_start)
+    )
+    """,
+]
@@ -0,0 +1,7 @@
+DESCRIPTION = "change-only offer history: runs of identical snapshots"
+
+STATEMENTS = [
+    "ALTER TABLE offers ADD COLUMN IF NOT EXISTS last_confirmed_at TIMESTAMP",
+    "ALTER TABLE offers ADD COLUMN IF NOT EXISTS samples INTEGER DEFAULT 1 NOT NULL",
+    "ALTER TABLE current_offers ADD COLUMN IF NOT EXISTS history_id UUID",
+]
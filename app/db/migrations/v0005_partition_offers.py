@@ -0,0 +1,81 @@
+# Moves the offers history into range partitions on created_at.
+#
+# The existing heap is renamed, a partitioned offers table is created with
+# partitions covering its whole time span plus the upcoming periods, and the
+# rows are copied over.
+
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.db.partitions import (create_partition_statement, partition_ranges,
+                               upcoming_ranges)
+
+DESCRIPTION = "range partition offers by created_at"
+
+COLUMNS = (
+    "id, product_id, offer_id, price, items_in_stock, "
+    "created_at, last_confirmed_at, samples"
+)
+
+RENAME_LEGACY = [
+    "ALTER TABLE offers RENAME TO offers_legacy",
+    "ALTER TABLE offers_legacy RENAME CONSTRAINT offers_pkey TO offers_legacy_pkey",
+    "ALTER INDEX IF EXISTS ix_offers_id RENAME TO ix_offers_legacy_id",
+    """
+    ALTER INDEX IF EXISTS ix_offers_offer_id_created_at
+        RENAME TO ix_offers_legacy_offer_id_created_at
+    """,
+    """
+    ALTER INDEX IF EXISTS ix_offers_product_id_offer_id_created_at
+        RENAME TO ix_offers_legacy_product_id_offer_id_created_at
+    """,
+]
+
+CREATE_PARTITIONED = [
+    """
+    CREATE TABLE offers (
+        created_at TIMESTAMP WITHOUT TIME ZONE
+            DEFAULT current_timestamp(0) NOT NULL,
+        price INTEGER NOT NULL,
+        items_in_stock INTEGER NOT NULL,
+        id UUID NOT NULL,
+        product_id UUID REFERENCES products (id),
+        offer_id UUID,
+        last_confirmed_at TIMESTAMP,
+        samples INTEGER DEFAULT 1 NOT NULL,
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at)
+    """,
+    "CREATE TABLE offers_default PARTITION OF offers DEFAULT",
+    "CREATE INDEX ix_offers_id ON offers (id)",
+    "CREATE INDEX ix_offers_offer_id_created_at ON offers (offer_id, created_at)",
+    """
+    CREATE INDEX ix_offers_product_id_offer_id_created_at
+        ON offers (product_id, offer_id, created_at)
+    """,
+]
+
+
+def upgrade(conn):
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = 'offers'")
+    ).scalar()
+    if relkind == "p":
+        return
+
+    for statement in RENAME_LEGACY + CREATE_PARTITIONED:
+        conn.execute(text(statement))
+
+    now = datetime.utcnow()
+    oldest = conn.execute(text("SELECT min(created_at) FROM offers_legacy")).scalar()
+    if oldest is not None:
+        for lower, upper in partition_ranges(oldest, now):
+            conn.execute(text(create_partition_statement(lower, upper)))
+    for lower, upper in upcoming_ranges(now):
+        conn.execute(text(create_partition_statement(lower, upper)))
+
+    conn.execute(
+        text(f"INSERT INTO offers ({COLUMNS}) SELECT {COLUMNS} FROM offers_legacy")
+    )
+    conn.execute(text("DROP TABLE offers_legacy"))
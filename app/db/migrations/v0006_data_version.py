@@ -0,0 +1,5 @@
+DESCRIPTION = "data version sequence for ETags"
+
+STATEMENTS = [
+    "CREATE SEQUENCE IF NOT EXISTS data_version",
+]
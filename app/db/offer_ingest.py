@@ -0,0 +1,219 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from sqlalchemy import bindparam, func, insert, select, tuple_, update
+
+from app.db.current_offers import upsert_current_offers
+from app.db.offer_rollups import upsert_offer_rollups
+from app.db.partitions import partition_start
+from app.db.sessions import async_engine
+from app.db.tables.current_offers import CurrentOffer
+from app.db.tables.offers import Offer
+from app.settings.conf import settings
+
+logger = logging.getLogger()
+
+# asyncpg allows at most 32767 bind parameters per statement
+MAX_ROWS_PER_STATEMENT = 5000
+
+
+def _offer_key(row) -> Tuple[str, str]:
+    return str(row["product_id"]), str(row["offer_id"])
+
+
+def history_window(start_time: datetime, end_time: datetime) -> List:
+    """Filters for the history rows of offers overlapping start_time..end_time.
+
+    A row covers created_at..last_confirmed_at, runs stay within one partition
+    so the created_at lower bound lets the planner prune. In "full" mode every
+    row is a single snapshot and created_at alone bounds it, sargably.
+    """
+    filters = [
+        func.coalesce(Offer.last_confirmed_at, Offer.created_at) >= start_time,
+        Offer.created_at >= partition_start(start_time),
+        Offer.created_at <= end_time,
+    ]
+    if settings.offer_history_mode == "full":
+        filters.append(Offer.created_at >= start_time)
+    return filters
+
+
+async def _current_runs(conn, rows: List[Dict]) -> Dict[Tuple[str, str], Tuple]:
+    # (price, items_in_stock, history_id, last confirmation) per offer
+    keys = list({_offer_key(row) for row in rows})
+    runs = {}
+    for start in range(0, len(keys), MAX_ROWS_PER_STATEMENT):
+        statement = select(
+            CurrentOffer.product_id,
+            CurrentOffer.offer_id,
+            CurrentOffer.price,
+            CurrentOffer.items_in_stock,
+            CurrentOffer.history_id,
+            CurrentOffer.created_at,
+        ).filter(
+            tuple_(CurrentOffer.product_id, CurrentOffer.offer_id).in_(
+                keys[start : start + MAX_ROWS_PER_STATEMENT]
+            )
+        )
+        results = await conn.execute(statement)
+        for product_id, offer_id, *run in results:
+            runs[(str(product_id), str(offer_id))] = tuple(run)
+    return runs
+
+
+async def insert_offer_rows(conn, rows: List[Dict]) -> None:
+    """Insert offer snapshot rows with multi-row INSERT statements on ``conn``.
+
+    In "changes" history mode a snapshot equal to the current run of its offer
+    only bumps that run's last_confirmed_at and samples. The current_offers
+    table and the OHLC rollups are upserted in the same transaction.
+    """
+    now = datetime.utcnow()
+    rows = sorted(
+        ({"created_at": now, **row} for row in rows), key=lambda row: row["created_at"]
+    )
+
+    collapse = settings.offer_history_mode == "changes"
+    runs = await _current_runs(conn, rows) if collapse else {}
+
+    new_rows, confirmations = [], []
+    for row in rows:
+        key = _offer_key(row)
+        price, items_in_stock, history_id, confirmed_at = runs.get(
+            key, (None, None, None, None)
+        )
+        # Runs never cross a partition boundary, which keeps reads prunable
+        if (
+            history_id
+            and (price, items_in_stock) == (row["price"], row["items_in_stock"])
+            and partition_start(confirmed_at) == partition_start(row["created_at"])
+        ):
+            row["history_id"] = history_id
+            confirmations.append(
+                {
+                    "b_history_id": history_id,
+                    "b_confirmed_at": row["created_at"],
+                    "b_partition_start": partition_start(row["created_at"]),
+                }
+            )
+            runs[key] = (price, items_in_stock, history_id, row["created_at"])
+            continue
+        row["history_id"] = uuid4()
+        new_rows.append(
+            {
+                "id": row["history_id"],
+                "product_id": row["product_id"],
+                "offer_id": row["offer_id"],
+                "price": row["price"],
+                "items_in_stock": row["items_in_stock"],
+                "created_at": row["created_at"],
+                "last_confirmed_at": row["created_at"],
+            }
+        )
+        if collapse:
+            runs[key] = (
+                row["price"],
+                row["items_in_stock"],
+                row["history_id"],
+                row["created_at"],
+            )
+
+    for start in range(0, len(new_rows), MAX_ROWS_PER_STATEMENT):
+        await conn.execute(
+            insert(Offer).values(new_rows[start : start + MAX_ROWS_PER_STATEMENT])
+        )
+    if confirmations:
+        await conn.execute(
+            update(Offer)
+            .where(
+                Offer.id == bindparam("b_history_id"),
+                # The run is in the partition of its confirmation, prune the rest
+                Offer.created_at >= bindparam("b_partition_start"),
+            )
+            .values(
+                last_confirmed_at=bindparam("b_confirmed_at"),
+                samples=Offer.samples + 1,
+            ),
+            confirmations,
+        )
+    await upsert_current_offers(conn, rows)
+    await upsert_offer_rollups(conn, rows)
+
+
+class OfferIngestor:
+    """Buffer offer snapshot rows and write them in batches, one transaction each.
+
+    A batch is flushed when it reaches ``batch_size`` rows or when
+    ``flush_interval`` seconds have passed since the last flush. A failed
+    batch is split by product and retried, so only the products whose rows
+    cannot be written reach ``on_error``.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = settings.offer_ingest_batch_size,
+        flush_interval: float = settings.offer_ingest_flush_interval,
+        on_error: Optional[Callable[[List[Dict], Exception], None]] = None,
+        on_written: Optional[Callable[[List[Dict]], None]] = None,
+    ):
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.on_written = on_written
+        self.written = 0
+        self._buffer: List[Dict] = []
+        self._lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "OfferIngestor":
+        if self.flush_interval > 0:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._flusher:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush()
+
+    async def add(self, rows: List[Dict]) -> None:
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            while self._buffer:
+                batch = self._buffer[: self.batch_size]
+                del self._buffer[: self.batch_size]
+                await self._write(batch)
+
+    async def _write(self, batch: List[Dict]) -> None:
+        try:
+            async with async_engine.begin() as conn:
+                await insert_offer_rows(conn, batch)
+        except Exception as exc:
+            product_ids = list(dict.fromkeys(row["product_id"] for row in batch))
+            if len(product_ids) == 1:
+                logger.error(
+                    f"Offer rows of productId <{product_ids[0]}> failed <{exc!r}>"
+                )
+                if self.on_error:
+                    self.on_error(batch, exc)
+                return
+            # Bisect by product, a bad product costs log2(products) retries
+            half = set(product_ids[: len(product_ids) // 2])
+            await self._write([row for row in batch if row["product_id"] in half])
+            await self._write([row for row in batch if row["product_id"] not in half])
+            return
+        self.written += len(batch)
+        if self.on_written:
+            self.on_written(batch)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
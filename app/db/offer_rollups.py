@@ -0,0 +1,96 @@
+# Incrementally maintained OHLC rollups of offer snapshots
+
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db.tables.offer_rollups import OfferRollup
+
+# No minute buckets: with a refresh period of a minute or more they would
+# hold one row per snapshot and grow as fast as the history itself
+BUCKETS: Dict[str, timedelta] = {
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+# Thirteen columns per row, keep below asyncpg's 32767 bind parameters
+MAX_ROWS_PER_STATEMENT = 2000
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(created_at: datetime, bucket: str) -> datetime:
+    size = BUCKETS[bucket]
+    return _EPOCH + ((created_at - _EPOCH) // size) * size
+
+
+def _aggregate(rows: List[Dict]) -> List[Dict]:
+    rollups = {}
+    for row in sorted(rows, key=lambda row: row["created_at"]):
+        price, stock = row["price"], row["items_in_stock"]
+        for bucket in BUCKETS:
+            key = (row["offer_id"], bucket, bucket_start(row["created_at"], bucket))
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollups[key] = {
+                    "offer_id": row["offer_id"],
+                    "bucket": bucket,
+                    "bucket_start": key[2],
+                    "product_id": row["product_id"],
+                    "open_price": price,
+                    "high_price": price,
+                    "low_price": price,
+                    "close_price": price,
+                    "min_stock": stock,
+                    "max_stock": stock,
+                    "samples": 1,
+                    "open_at": row["created_at"],
+                    "close_at": row["created_at"],
+                }
+                continue
+            rollup["high_price"] = max(rollup["high_price"], price)
+            rollup["low_price"] = min(rollup["low_price"], price)
+            rollup["close_price"] = price
+            rollup["min_stock"] = min(rollup["min_stock"], stock)
+            rollup["max_stock"] = max(rollup["max_stock"], stock)
+            rollup["samples"] += 1
+            rollup["close_at"] = row["created_at"]
+    return list(rollups.values())
+
+
+async def upsert_offer_rollups(conn, rows: List[Dict]) -> None:
+    """Fold snapshot rows into the rollups of every bucket size."""
+    rollups = _aggregate(rows)
+    for start in range(0, len(rollups), MAX_ROWS_PER_STATEMENT):
+        stmt = insert(OfferRollup).values(
+            rollups[start : start + MAX_ROWS_PER_STATEMENT]
+        )
+        excluded = stmt.excluded
+        current = OfferRollup
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                OfferRollup.offer_id,
+                OfferRollup.bucket,
+                OfferRollup.bucket_start,
+            ],
+            set_={
+                "open_price": case(
+                    (excluded.open_at < current.open_at, excluded.open_price),
+                    else_=current.open_price,
+                ),
+                "open_at": func.least(current.open_at, excluded.open_at),
+                "close_price": case(
+                    (excluded.close_at >= current.close_at, excluded.close_price),
+                    else_=current.close_price,
+                ),
+                "close_at": func.greatest(current.close_at, excluded.close_at),
+                "high_price": func.greatest(current.high_price, excluded.high_price),
+                "low_price": func.least(current.low_price, excluded.low_price),
+                "min_stock": func.least(current.min_stock, excluded.min_stock),
+                "max_stock": func.greatest(current.max_stock, excluded.max_stock),
+                "samples": current.samples + excluded.samples,
+            },
+        )
+        await conn.execute(stmt)
@@ -0,0 +1,124 @@
+# Monthly (OFFER_PARTITION_MONTHS) range partitions of the offers history
+
+import logging
+import re
+from datetime import datetime
+from typing import Iterator, Tuple
+
+from sqlalchemy import text
+
+from app.settings.conf import settings
+
+logger = logging.getLogger()
+
+PARTITION_NAME = re.compile(r"^offers_p(\d{4})(\d{2})$")
+
+LIST_PARTITIONS = """
+SELECT child.relname, obj_description(child.oid, 'pg_class')
+FROM pg_inherits
+JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE parent.relname = 'offers'
+"""
+
+DOWNSAMPLED = "downsampled"
+
+
+def _add_months(moment: datetime, months: int) -> datetime:
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_start(moment: datetime) -> datetime:
+    """Start of the partition period containing ``moment``."""
+    months = max(settings.offer_partition_months, 1)
+    index = moment.year * 12 + moment.month - 1
+    index -= index % months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_ranges(
+    start: datetime, end: datetime
+) -> Iterator[Tuple[datetime, datetime]]:
+    """Partition periods covering ``start`` up to and including ``end``."""
+    months = max(settings.offer_partition_months, 1)
+    lower = partition_start(start)
+    while lower <= end:
+        upper = _add_months(lower, months)
+        yield lower, upper
+        lower = upper
+
+
+def partition_name(lower: datetime) -> str:
+    return f"offers_p{lower:%Y%m}"
+
+
+def create_partition_statement(lower: datetime, upper: datetime) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(lower)} PARTITION OF offers "
+        f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    )
+
+
+def upcoming_ranges(now: datetime) -> Iterator[Tuple[datetime, datetime]]:
+    months = max(settings.offer_partition_months, 1)
+    return partition_ranges(
+        now, _add_months(now, months * settings.offer_partition_premake)
+    )
+
+
+async def ensure_partitions(conn, now: datetime) -> None:
+    """Create the current partition and the configured number of upcoming ones."""
+    for lower, upper in upcoming_ranges(now):
+        await conn.execute(text(create_partition_statement(lower, upper)))
+
+
+async def apply_retention(conn, now: datetime) -> int:
+    """Drop or downsample partitions older than OFFER_RETENTION_MONTHS.
+
+    Returns the number of partitions changed.
+    """
+    if settings.offer_retention_months <= 0:
+        return 0
+    changed = 0
+    cutoff = _add_months(partition_start(now), -settings.offer_retention_months)
+    months = max(settings.offer_partition_months, 1)
+
+    results = await conn.execute(text(LIST_PARTITIONS))
+    for name, comment in results.fetchall():
+        match = PARTITION_NAME.match(name)
+        if not match:
+            continue
+        lower = datetime(int(match.group(1)), int(match.group(2)), 1)
+        if _add_months(lower, months) > cutoff:
+            continue
+
+        if settings.offer_retention_mode == "downsample":
+            if comment == DOWNSAMPLED:
+                continue
+            # Keep the first snapshot of every offer per day, the OHLC rollups
+            # still hold the finer detail
+            await conn.execute(
+                text(
+                    f"""
+                    DELETE FROM {name} USING (
+                        SELECT id, row_number() OVER (
+                            PARTITION BY
+                                product_id, offer_id, date_trunc('day', created_at)
+                            ORDER BY created_at, id
+                        ) AS position
+                        FROM {name}
+                    ) ranked
+                    WHERE {name}.id = ranked.id AND ranked.position > 1
+                    """
+                )
+            )
+            await conn.execute(text(f"COMMENT ON TABLE {name} IS '{DOWNSAMPLED}'"))
+            logger.info(f"Offer partition <{name}> downsampled")
+            changed += 1
+        else:
+            await conn.execute(text(f"ALTER TABLE offers DETACH PARTITION {name}"))
+            await conn.execute(text(f"DROP TABLE {name}"))
+            logger.info(f"Offer partition <{name}> dropped")
+            changed += 1
+    return changed
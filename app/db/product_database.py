@@ -1,26 +1,43 @@
+import asyncio
+from collections import defaultdict
 from datetime import datetime
-from typing import List, Optional
+from hashlib import sha1
+from typing import Dict, List, Optional, Tuple
 from uuid import UUID
 
-from fastapi import status
-from sqlalchemy import and_, func, select
+from fastapi import HTTPException, status
+from sqlalchemy import Float, and_, cast, func, insert, select, tuple_
 from sqlalchemy.sql.expression import false
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.cache.response_cache import invalidate_catalog, invalidate_product
 from app.db.err import (EntityDoesNotCreatedByOffers,
                         EntityDoesNotCreatedByRegistration, EntityDoesNotExist,
-                        StartTimeAfterEndTime)
+                        InvalidCursor, StartTimeAfterEndTime)
+from app.db.offer_ingest import (MAX_ROWS_PER_STATEMENT, history_window,
+                                 insert_offer_rows)
+from app.db.offer_rollups import bucket_start
+from app.db.refresh_requests import request_refresh, request_refreshes
+from app.db.tables.current_offers import CurrentOffer
+from app.db.tables.offer_rollups import OfferRollup
 from app.db.tables.offers import Offer
 from app.db.tables.products import Product
+from app.db.versioning import data_version_column
 from app.external_service.offer_handler import (get_product_offers,
                                                 register_product)
-from app.internal_models.models import (CreateProductRequest,
-                                        CreateProductResponse,
-                                        DeleteProductResponse, OfferB,
+from app.internal_models.encoding import build_model
+from app.internal_models.models import (BulkCreateItemResult,
+                                        CreateProductRequest,
+                                        CreateProductResponse, CursorPaging,
+                                        DeleteProductResponse,
+                                        OfferCandle, OfferCandlesResponse,
                                         OfferHistoryPagingResponse,
-                                        OfferResponse, ProductOfferResponse,
+                                        OfferResponse, OfferSnapshot, Paging,
+                                        ProductOfferResponse,
+                                        ProductPagingResponse,
                                         UpdateProductRequest, UpdateProductResponse)
-from app.paging.paging import Pagination
+from app.paging.paging import Pagination, decode_cursor, encode_cursor
+from app.settings.conf import settings
 
 
 class ProductDatabase:
@@ -35,33 +52,122 @@ class ProductDatabase:
         response = results.scalars().first()
         return response
 
-    async def _get_instances(self):
+    async def _get_instances(self, limit: int, after_id: Optional[UUID] = None):
         statement = select(Product).filter(Product.is_deleted == false())
+        if after_id:
+            statement = statement.filter(Product.id > after_id)
+        statement = statement.order_by(Product.id).limit(limit)
         results = await self.session.exec(statement)
         response = results.scalars().all()
         return response
 
     async def _get_offer_instances(self, product_id):
-        subquery = (
-            select(Offer.offer_id, func.max(Offer.created_at).label("max_created_at"))
+        stmt = (
+            select(CurrentOffer)
             .join(Product)
             .filter(and_(Product.id == product_id, Product.is_deleted == false()))
-            .group_by(Offer.offer_id)
-            .subquery()
         )
 
-        stmt = select(Offer).join(
-            subquery,
-            and_(
-                Offer.offer_id == subquery.c.offer_id,
-                Offer.created_at == subquery.c.max_created_at,
-            ),
+        results = await self.session.exec(stmt)
+        response = results.scalars().all()
+        return response
+
+    async def _get_all_offer_instances(
+        self, product_ids: List[UUID]
+    ) -> Dict[UUID, List[CurrentOffer]]:
+        # Current state of every offer of the given products in a single query
+        stmt = (
+            select(CurrentOffer)
+            .filter(CurrentOffer.product_id.in_(product_ids))
+            .order_by(CurrentOffer.product_id, CurrentOffer.offer_id)
         )
 
         results = await self.session.exec(stmt)
-        response = results.fetchall()
+        response = defaultdict(list)
+        for offer in results.scalars().all():
+            response[offer.product_id].append(offer)
         return response
 
+    # Rows coming from the database are trusted, with FAST_RESPONSES response
+    # models are built without a second round of validation
+    @staticmethod
+    def _offer_response(offer: CurrentOffer) -> OfferResponse:
+        return build_model(
+            OfferResponse,
+            created_at=offer.created_at,
+            price=offer.price,
+            items_in_stock=offer.items_in_stock,
+            offer_id=offer.offer_id,
+        )
+
+    @staticmethod
+    def _product_response(
+        product: Product, offers: List[OfferResponse]
+    ) -> ProductOfferResponse:
+        return build_model(
+            ProductOfferResponse,
+            name=product.name,
+            description=product.description,
+            id=product.id,
+            offers=offers,
+        )
+
+    async def _product_changed(self, product_id: UUID):
+        invalidate_product(product_id)
+
+    # Versions digest the rows a response is built from, so they change with
+    # the resource and nothing else. They drive ETags and the response cache.
+    async def _version(self, statement) -> Tuple[List, str]:
+        results = await self.session.execute(statement)
+        rows = [tuple(row) for row in results.all()]
+        return rows, sha1(repr(rows).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _products_state(products):
+        # Product fields, newest offer snapshot and offer count per product
+        return (
+            select(
+                products.c.id,
+                products.c.name,
+                products.c.description,
+                func.max(CurrentOffer.created_at),
+                func.count(CurrentOffer.offer_id),
+                data_version_column,
+            )
+            .select_from(products)
+            .outerjoin(CurrentOffer, CurrentOffer.product_id == products.c.id)
+            .group_by(products.c.id, products.c.name, products.c.description)
+            .order_by(products.c.id)
+        )
+
+    async def product_version(self, product_id: UUID) -> Optional[str]:
+        """Version of the product response, None when get() would not find it."""
+        product = (
+            select(Product.id, Product.name, Product.description)
+            .filter(and_(Product.id == product_id, Product.is_deleted == false()))
+            .subquery()
+        )
+        rows, version = await self._version(self._products_state(product))
+        if not rows or not rows[0][4]:
+            return None
+        return version
+
+    async def products_version(
+        self, limit: int, cursor: Optional[str] = None
+    ) -> Optional[str]:
+        """Version of a catalog page, None when get_all() would not find it."""
+        after_id = self._decode_products_cursor(cursor) if cursor else None
+        page = select(Product.id, Product.name, Product.description).filter(
+            Product.is_deleted == false()
+        )
+        if after_id:
+            page = page.filter(Product.id > after_id)
+        page = page.order_by(Product.id).limit(limit + 1).subquery()
+        rows, version = await self._version(self._products_state(page))
+        if not rows and not cursor:
+            return None
+        return version
+
     async def create(
         self, product_create: CreateProductRequest
     ) -> CreateProductResponse:
@@ -80,21 +186,101 @@ class ProductDatabase:
 
         if response_product_offers.get("status_code") != status.HTTP_200_OK:
             raise EntityDoesNotCreatedByOffers
-        else:
-            for offer_data in response_product_offers.get("data", []):
-                offer = Offer(
-                    offer_id=offer_data.get("id", 0),
-                    price=offer_data.get("price", 0),
-                    items_in_stock=offer_data.get("items_in_stock", 0),
-                )
-                product.offers.append(offer)
+
+        offer_rows = self._offer_rows(product.id, response_product_offers)
 
         self.session.add(product)
+        await self.session.flush()
+        await insert_offer_rows(self.session, offer_rows)
 
         await self.session.commit()
         await self.session.refresh(product)
+        await self._product_changed(product.id)
+        await request_refresh(self.session, product.id)
         return CreateProductResponse(**product.dict(exclude={"is_deleted"}))
 
+    @staticmethod
+    def _offer_rows(product_id: UUID, response_product_offers: Dict) -> List[Dict]:
+        return [
+            {
+                "offer_id": offer_data.get("id", 0),
+                "price": offer_data.get("price", 0),
+                "items_in_stock": offer_data.get("items_in_stock", 0),
+                "product_id": product_id,
+            }
+            for offer_data in response_product_offers.get("data", [])
+        ]
+
+    async def _register_with_offers(
+        self, product: Product, semaphore: asyncio.Semaphore
+    ) -> List[Dict]:
+        async with semaphore:
+            response_register_product = await register_product(
+                id=product.id, name=product.name, description=product.description
+            )
+            if response_register_product != status.HTTP_201_CREATED:
+                raise EntityDoesNotCreatedByRegistration
+
+            response_product_offers = await get_product_offers(id=product.id)
+            if response_product_offers.get("status_code") != status.HTTP_200_OK:
+                raise EntityDoesNotCreatedByOffers
+
+        return self._offer_rows(product.id, response_product_offers)
+
+    async def bulk_create(
+        self, products_create: List[Tuple[int, CreateProductRequest]]
+    ) -> List[BulkCreateItemResult]:
+        """Register a batch concurrently and insert the successful products in bulk.
+
+        Takes (index, request) pairs and returns one result per pair.
+        """
+        indexes = [index for index, _ in products_create]
+        products = [Product.from_orm(request) for _, request in products_create]
+        semaphore = asyncio.Semaphore(max(settings.bulk_create_concurrency, 1))
+        outcomes = await asyncio.gather(
+            *(self._register_with_offers(product, semaphore) for product in products),
+            return_exceptions=True,
+        )
+
+        created, offer_rows, results = [], [], []
+        for index, product, outcome in zip(indexes, products, outcomes):
+            if isinstance(outcome, EntityDoesNotCreatedByRegistration):
+                detail = "Product registration in offer service failed."
+            elif isinstance(outcome, EntityDoesNotCreatedByOffers):
+                detail = "Product offers could not be fetched."
+            elif isinstance(outcome, HTTPException):
+                detail = outcome.detail
+            elif isinstance(outcome, Exception):
+                detail = repr(outcome)
+            else:
+                created.append(product)
+                offer_rows.extend(outcome)
+                results.append(
+                    BulkCreateItemResult(index=index, status="created", id=product.id)
+                )
+                continue
+            results.append(
+                BulkCreateItemResult(index=index, status="failed", detail=detail)
+            )
+
+        if created:
+            for start in range(0, len(created), MAX_ROWS_PER_STATEMENT):
+                await self.session.execute(
+                    insert(Product).values(
+                        [
+                            product.dict()
+                            for product in created[
+                                start : start + MAX_ROWS_PER_STATEMENT
+                            ]
+                        ]
+                    )
+                )
+            await insert_offer_rows(self.session, offer_rows)
+            await self.session.commit()
+            invalidate_catalog()
+            await request_refreshes(self.session, [product.id for product in created])
+        return results
+
     async def update(
         self, product_id: UUID, product_update=UpdateProductRequest
     ) -> UpdateProductResponse:
@@ -109,6 +295,8 @@ class ProductDatabase:
         self.session.add(product)
         await self.session.commit()
         await self.session.refresh(product)
+        await self._product_changed(product.id)
+        await request_refresh(self.session, product.id)
 
         return UpdateProductResponse(**product.dict(exclude={"id", "is_deleted"}))
 
@@ -121,6 +309,7 @@ class ProductDatabase:
         self.session.add(product)
         await self.session.commit()
         await self.session.refresh(product)
+        await self._product_changed(product.id)
         return DeleteProductResponse(**product.dict(exclude={"is_deleted"}))
 
     async def get(self, product_id: UUID) -> Optional[ProductOfferResponse]:
@@ -137,36 +326,83 @@ class ProductDatabase:
         offers = []
 
         for o in offers_db:
-            offers.append(OfferResponse(**o[0].dict(exclude={"id", "product_id"})))
+            offers.append(self._offer_response(o))
 
-        return ProductOfferResponse(
-            **product.dict(exclude={"is_deleted"}), offers=offers
-        )
+        return self._product_response(product, offers)
+
+    @staticmethod
+    def _decode_products_cursor(cursor: str) -> UUID:
+        values = decode_cursor(cursor)
+        try:
+            (after_id,) = values
+            return UUID(after_id)
+        except (ValueError, TypeError):
+            raise InvalidCursor
+
+    async def get_all(
+        self, limit: int, cursor: Optional[str] = None
+    ) -> Optional[ProductPagingResponse]:
+        after_id = self._decode_products_cursor(cursor) if cursor else None
 
-    async def get_all(self) -> Optional[List[ProductOfferResponse]]:
-        products = await self._get_instances()
+        # One extra row tells whether another page follows
+        products = await self._get_instances(limit=limit + 1, after_id=after_id)
 
-        if not products:
+        if not products and not cursor:
             raise EntityDoesNotExist
 
+        has_more = len(products) > limit
+        products = products[:limit]
+        offers_by_product = await self._get_all_offer_instances(
+            [product.id for product in products]
+        )
+
         response = []
         for product in products:
-            offers_db = await self._get_offer_instances(product.id)
-
             offers = []
-            for o in offers_db:
-                offers.append(
-                    OfferResponse(**o[0].dict(exclude={"id", "product_id"}))
-                )
+            for o in offers_by_product.get(product.id, []):
+                offers.append(self._offer_response(o))
 
-            response.append(
-                ProductOfferResponse(
-                    **product.dict(exclude={"is_deleted"}), offers=offers
-                )
-            )
-        return response
+            response.append(self._product_response(product, offers))
+
+        next_cursor = encode_cursor(products[-1].id) if has_more else None
+        return build_model(
+            ProductPagingResponse,
+            products=response,
+            paging=build_model(CursorPaging, limit=limit, next_cursor=next_cursor),
+        )
 
     # Offers
+    @staticmethod
+    def _offer_window(offer_id: UUID, start_time: datetime, end_time: datetime):
+        return [
+            Offer.offer_id == offer_id,
+            *history_window(start_time, end_time),
+            Product.is_deleted == false(),
+        ]
+
+    async def offer_history_version(
+        self, offer_id: UUID, start_time: datetime, end_time: datetime
+    ) -> Optional[str]:
+        """Version of the offer history in the window, None when it is empty."""
+        if start_time > end_time:
+            return None
+        # New snapshots land at the end of the window, the latest row and its
+        # confirmation cover every change short of a bulk rewrite
+        statement = (
+            select(
+                Offer.id,
+                func.coalesce(Offer.last_confirmed_at, Offer.created_at),
+                Offer.samples,
+                data_version_column,
+            )
+            .join(Product)
+            .filter(*self._offer_window(offer_id, start_time, end_time))
+            .order_by(Offer.created_at.desc(), Offer.id.desc())
+            .limit(1)
+        )
+        rows, version = await self._version(statement)
+        return version if rows else None
+
     async def _get_offer_history(
         self,
         offer_id: UUID,
@@ -175,44 +411,189 @@ class ProductDatabase:
         limit: int = 10,
         offset: int = 0,
         calc_percentage_change=False,
+        cursor: Optional[str] = None,
     ) -> Optional[OfferHistoryPagingResponse]:
         if start_time > end_time:
             raise StartTimeAfterEndTime
 
+        conditions = self._offer_window(offer_id, start_time, end_time)
+        # Keyset pages skip the count, it scans the whole window on every page
+        keyset = bool(cursor) and not calc_percentage_change
+
+        total_items = None
+        if not keyset:
+            count_statement = (
+                select(func.count())
+                .select_from(Offer)
+                .join(Product)
+                .filter(*conditions)
+            )
+            count_results = await self.session.exec(count_statement)
+            total_items = count_results.scalar_one()
+            if not total_items:
+                raise EntityDoesNotExist
+
         statement = (
             select(Offer)
             .join(Product)
+            .filter(*conditions)
+            .order_by(Offer.created_at.asc(), Offer.id.asc())
+        )
+        if not calc_percentage_change:
+            if keyset:
+                # Keyset pagination: continue right after the previous page
+                created_at, last_id = self._decode_history_cursor(cursor)
+                statement = statement.filter(
+                    tuple_(Offer.created_at, Offer.id) > tuple_(created_at, last_id)
+                )
+            else:
+                statement = statement.offset(offset)
+            statement = statement.limit(limit)
+
+        results = await self.session.exec(statement)
+        offers_page = results.scalars().all()
+
+        offers = []
+        for offer in offers_page:
+            offers.append(
+                build_model(
+                    OfferSnapshot,
+                    created_at=offer.created_at,
+                    price=offer.price,
+                    items_in_stock=offer.items_in_stock,
+                    last_confirmed_at=offer.last_confirmed_at or offer.created_at,
+                )
+            )
+
+        next_cursor = None
+        if not calc_percentage_change and offers_page and len(offers_page) == limit:
+            last = offers_page[-1]
+            next_cursor = encode_cursor(last.created_at.isoformat(), last.id)
+
+        if keyset:
+            paging = build_model(
+                Paging,
+                page=None,
+                limit=limit,
+                offset=None,
+                total_pages=None,
+                next_cursor=next_cursor,
+            )
+        else:
+            pagination = Pagination(
+                total_items=total_items, offset=offset, limit=limit
+            )
+            paging = build_model(
+                Paging,
+                page=pagination.page,
+                limit=pagination.limit,
+                offset=pagination.offset,
+                total_pages=pagination.total_pages,
+                next_cursor=next_cursor,
+            )
+        return build_model(
+            OfferHistoryPagingResponse, id=offer_id, history=offers, paging=paging
+        )
+
+    async def _get_offer_trend(
+        self,
+        offer_id: UUID,
+        start_time: datetime = datetime.min,
+        end_time: datetime = datetime.max,
+    ):
+        if start_time > end_time:
+            raise StartTimeAfterEndTime
+
+        conditions = self._offer_window(offer_id, start_time, end_time)
+
+        # First and last price come from the (offer_id, created_at) index,
+        # the statistics from one aggregate pass over the window. Rows are
+        # weighted by the number of identical snapshots they stand for.
+        window = select(Offer.price).join(Product).filter(*conditions).correlate(None)
+        first_price = window.order_by(Offer.created_at.asc()).limit(1)
+        last_price = window.order_by(Offer.created_at.desc()).limit(1)
+
+        price = cast(Offer.price, Float)
+        samples = func.sum(Offer.samples)
+        total = func.sum(price * Offer.samples)
+        squares = func.sum(price * price * Offer.samples)
+        variance = (squares - total * total / samples) / func.nullif(samples - 1, 0)
+
+        statement = (
+            select(
+                first_price.scalar_subquery().label("first_price"),
+                last_price.scalar_subquery().label("last_price"),
+                func.min(Offer.price).label("min_price"),
+                func.max(Offer.price).label("max_price"),
+                (total / samples).label("mean_price"),
+                func.sqrt(func.greatest(variance, 0)).label("stddev_price"),
+                samples.label("samples"),
+            )
+            .select_from(Offer)
+            .join(Product)
+            .filter(*conditions)
+        )
+
+        results = await self.session.exec(statement)
+        trend = results.one()
+        if not trend.samples:
+            raise EntityDoesNotExist
+        return trend
+
+    async def _get_offer_candles(
+        self,
+        offer_id: UUID,
+        bucket: str,
+        start_time: datetime = datetime.min,
+        end_time: datetime = datetime.max,
+    ) -> OfferCandlesResponse:
+        if start_time > end_time:
+            raise StartTimeAfterEndTime
+
+        statement = (
+            select(OfferRollup)
+            .join(Product)
             .filter(
                 and_(
-                    Offer.offer_id == offer_id,
-                    Offer.created_at >= start_time,
-                    Offer.created_at <= end_time,
+                    OfferRollup.offer_id == offer_id,
+                    OfferRollup.bucket == bucket,
+                    OfferRollup.bucket_start >= bucket_start(start_time, bucket),
+                    OfferRollup.bucket_start <= end_time,
                     Product.is_deleted == false(),
                 )
             )
-            .order_by(Offer.created_at.asc())
+            .order_by(OfferRollup.bucket_start.asc())
         )
 
         results = await self.session.exec(statement)
-        offers_all = results.scalars().all()
+        rollups = results.scalars().all()
+        if not rollups:
+            raise EntityDoesNotExist
 
-        offers = []
-        for offer in offers_all:
-            offers.append(
-                OfferB(**offer.dict(exclude={"id", "product_id", "offer_id"}))
+        candles = []
+        for rollup in rollups:
+            candles.append(
+                build_model(
+                    OfferCandle,
+                    bucket_start=rollup.bucket_start,
+                    open_price=rollup.open_price,
+                    high_price=rollup.high_price,
+                    low_price=rollup.low_price,
+                    close_price=rollup.close_price,
+                    min_stock=rollup.min_stock,
+                    max_stock=rollup.max_stock,
+                    samples=rollup.samples,
+                )
             )
-        paging = Pagination(total_items=len(offers_all), offset=offset, limit=limit)
-        if not offers:
-            raise EntityDoesNotExist
-        return OfferHistoryPagingResponse(
-            id=offer_id,
-            history=offers[offset : offset + limit]
-            if not calc_percentage_change
-            else offers,
-            paging={
-                "page": paging.page,
-                "limit": paging.limit,
-                "offset": paging.offset,
-                "total_pages": paging.total_pages,
-            },
+        return build_model(
+            OfferCandlesResponse, id=offer_id, bucket=bucket, candles=candles
         )
+
+    @staticmethod
+    def _decode_history_cursor(cursor: str):
+        values = decode_cursor(cursor)
+        try:
+            created_at, last_id = values
+            return datetime.fromisoformat(created_at), UUID(last_id)
+        except (ValueError, TypeError):
+            raise InvalidCursor
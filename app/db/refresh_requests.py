@@ -0,0 +1,28 @@
+from typing import List
+from uuid import UUID
+
+from sqlalchemy import Text, cast, func, select
+
+from app.db.offer_ingest import MAX_ROWS_PER_STATEMENT
+from app.db.tables.products import Product
+
+# Postgres NOTIFY channel the offer refresh scheduler listens on
+REFRESH_CHANNEL = "offer_refresh"
+
+
+async def request_refresh(conn, product_id: UUID) -> None:
+    """Ask whichever replica schedules ``product_id`` to refresh it first.
+
+    The notification is delivered when the transaction commits.
+    """
+    await conn.execute(select(func.pg_notify(REFRESH_CHANNEL, str(product_id))))
+
+
+async def request_refreshes(conn, product_ids: List[UUID]) -> None:
+    """Like request_refresh() for many products, one notification each."""
+    for start in range(0, len(product_ids), MAX_ROWS_PER_STATEMENT):
+        await conn.execute(
+            select(func.pg_notify(REFRESH_CHANNEL, cast(Product.id, Text))).filter(
+                Product.id.in_(product_ids[start : start + MAX_ROWS_PER_STATEMENT])
+            )
+        )
@@ -1,9 +1,11 @@
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlmodel import create_engine, SQLModel
+from sqlalchemy.pool import NullPool
+from sqlmodel import create_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.metrics.instruments import TimedAsyncQueuePool, instrument_engine
 from app.settings.conf import settings
 
 engine = create_engine(
@@ -15,6 +17,18 @@ async_engine = create_async_engine(
     url=settings.async_database_url,
     echo=settings.db_echo_log,
     future=True,
+    poolclass=TimedAsyncQueuePool,
+)
+if settings.metrics_enabled:
+    instrument_engine(async_engine)
+
+# Connections held for the lifetime of a job: advisory lock holders and the
+# LISTEN connection. Unpooled, so they never take slots from async_engine.
+lock_engine = create_async_engine(
+    url=settings.async_database_url,
+    echo=settings.db_echo_log,
+    future=True,
+    poolclass=NullPool,
 )
 
 async_session = sessionmaker(
@@ -33,8 +47,3 @@ def get_database(repository):
         return repository(session)
 
     return _get_repository
-
-
-def create_tables():
-    SQLModel.metadata.drop_all(engine)
-    SQLModel.metadata.create_all(engine)
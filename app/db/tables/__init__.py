@@ -1,7 +1,11 @@
+from .current_offers import CurrentOffer
+from .offer_rollups import OfferRollup
 from .offers import Offer
 from .products import Product
 
 __all__ = (
+    "CurrentOffer",
     "Offer",
+    "OfferRollup",
     "Product",
 )
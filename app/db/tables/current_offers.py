@@ -0,0 +1,17 @@
+from typing import Optional
+from uuid import UUID
+
+from sqlmodel import Field
+
+from app.db.tables.base import TimestampModel
+from app.db.tables.offers import OfferBase
+
+
+class CurrentOffer(OfferBase, TimestampModel, table=True):
+    """Latest snapshot of each offer, maintained alongside the offers history."""
+
+    __tablename__ = "current_offers"
+    product_id: UUID = Field(foreign_key="products.id", primary_key=True)
+    offer_id: UUID = Field(primary_key=True)
+    # offers row holding the current run of this offer
+    history_id: Optional[UUID] = Field(default=None)
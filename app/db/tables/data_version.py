@@ -0,0 +1,6 @@
+from sqlalchemy import Sequence
+from sqlmodel import SQLModel
+
+# Bumped after bulk rewrites of offers (compaction, retention, rebuilds) that
+# change responses without leaving newer rows behind, part of every ETag
+data_version = Sequence("data_version", metadata=SQLModel.metadata)
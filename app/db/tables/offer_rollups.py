@@ -0,0 +1,23 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlmodel import Field, SQLModel
+
+
+class OfferRollup(SQLModel, table=True):
+    """Open/high/low/close price and stock range of an offer per time bucket."""
+
+    __tablename__ = "offer_rollups"
+    offer_id: UUID = Field(primary_key=True)
+    bucket: str = Field(primary_key=True)
+    bucket_start: datetime = Field(primary_key=True)
+    product_id: UUID = Field(foreign_key="products.id", nullable=False)
+    open_price: int = Field(nullable=False)
+    high_price: int = Field(nullable=False)
+    low_price: int = Field(nullable=False)
+    close_price: int = Field(nullable=False)
+    min_stock: int = Field(nullable=False)
+    max_stock: int = Field(nullable=False)
+    samples: int = Field(nullable=False)
+    open_at: datetime = Field(nullable=False)
+    close_at: datetime = Field(nullable=False)
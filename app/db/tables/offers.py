@@ -1,6 +1,8 @@
+from datetime import datetime
 from typing import Optional
 from uuid import UUID
 
+from sqlalchemy import Index, text
 from sqlmodel import Field, Relationship, SQLModel
 
 from app.db.tables.base import TimestampModel, UUIDModel
@@ -14,6 +16,20 @@ class OfferBase(SQLModel):
 
 class Offer(OfferBase, UUIDModel, TimestampModel, table=True):
     __tablename__ = "offers"
+    __table_args__ = (
+        Index("ix_offers_offer_id_created_at", "offer_id", "created_at"),
+        Index(
+            "ix_offers_product_id_offer_id_created_at",
+            "product_id",
+            "offer_id",
+            "created_at",
+        ),
+    )
     product_id: UUID = Field(default=None, foreign_key="products.id")
     offer_id: UUID = Field(default=None)
+    # A row stands for a run of identical snapshots in "changes" history mode
+    last_confirmed_at: Optional[datetime] = Field(default=None)
+    samples: int = Field(
+        default=1, nullable=False, sa_column_kwargs={"server_default": text("1")}
+    )
     product: Optional[Product] = Relationship(back_populates="offers")
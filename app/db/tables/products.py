@@ -1,5 +1,6 @@
 from typing import List
 
+from sqlalchemy import Index, text
 from sqlmodel import Field, Relationship, SQLModel
 
 from app.db.tables.base import UUIDModel
@@ -12,6 +13,13 @@ class ProductBase(SQLModel):
 
 class Product(ProductBase, UUIDModel, table=True):
     __tablename__ = "products"
+    __table_args__ = (
+        Index(
+            "ix_products_not_deleted",
+            "id",
+            postgresql_where=text("is_deleted = false"),
+        ),
+    )
     is_deleted: bool = Field(default=False)
     offers: List["Offer"] = Relationship(
         sa_relationship_kwargs={"cascade": "all, delete"}, back_populates="product"
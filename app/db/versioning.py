@@ -0,0 +1,16 @@
+from sqlalchemy import literal_column, select
+
+from app.db.tables.data_version import data_version
+
+# last_value is already 1 before the first nextval(), which also returns 1
+CURRENT_DATA_VERSION = (
+    "SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM data_version"
+)
+
+# The data version as a column, to read it along with the state of a resource
+data_version_column = literal_column(f"({CURRENT_DATA_VERSION})")
+
+
+async def bump_data_version(conn) -> None:
+    # Sequences are not transactional, call this once the write has committed
+    await conn.execute(select(data_version.next_value()))
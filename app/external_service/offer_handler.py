@@ -1,65 +1,312 @@
+import asyncio
 import json
-from typing import Dict
+import logging
+import time
+from typing import Dict, Optional
 from uuid import UUID
 
 from fastapi import FastAPI, HTTPException, status
 
 import httpx
+from app.external_service.rate_limit import TokenBucket
+from app.external_service.resilience import (HALF_OPEN, OPEN, CircuitBreaker,
+                                             backoff_delay)
+from app.metrics.instruments import (offer_service_latency,
+                                     offer_service_pool_wait,
+                                     offer_service_retries)
+from app.metrics.registry import registry
 from app.settings.conf import settings
 
+logger = logging.getLogger()
+
 app = FastAPI()
 
 API_URL = settings.offer_ms_api_url
 
 
-async def authorize() -> Dict:
-    headers = {"Bearer": settings.refresh_token}
-    async with httpx.AsyncClient() as client:
-        response = await client.post(API_URL + "auth", headers=headers)
+class PooledTransport(httpx.AsyncHTTPTransport):
+    """Keep-alive transport which records how long requests wait for a connection."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.monotonic()
+        acquired = None
+
+        # The first trace event fires once the pool has handed out a connection
+        async def trace(event_name, info):
+            nonlocal acquired
+            if acquired is None:
+                acquired = time.monotonic()
+
+        request.extensions["trace"] = trace
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            waited = (acquired or time.monotonic()) - started
+            self.requests += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+            offer_service_pool_wait.observe(waited)
+
+    def stats(self) -> Dict:
+        connections = getattr(self._pool, "connections", [])
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {
+            "open_connections": len(connections),
+            "idle_connections": idle,
+            "requests": self.requests,
+            "wait_time_avg": self.wait_time_total / self.requests
+            if self.requests
+            else 0.0,
+            "wait_time_max": self.wait_time_max,
+        }
+
+
+_client: Optional[httpx.AsyncClient] = None
+_transport: Optional[PooledTransport] = None
+
+
+def _http2_enabled() -> bool:
+    if not settings.offer_client_http2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning(
+            "HTTP/2 requested for offer service but h2 is not installed, "
+            "install httpx[http2]"
+        )
+        return False
+    return True
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared offer service client, creating it on first use."""
+    global _client, _transport
+    if _client is None or _client.is_closed:
+        limits = httpx.Limits(
+            max_connections=settings.offer_client_max_connections,
+            max_keepalive_connections=settings.offer_client_max_keepalive,
+            keepalive_expiry=settings.offer_client_keepalive_expiry,
+        )
+        http2 = _http2_enabled()
+        _transport = PooledTransport(limits=limits, http2=http2)
+        _client = httpx.AsyncClient(
+            transport=_transport,
+            timeout=httpx.Timeout(
+                settings.offer_client_timeout, pool=settings.offer_client_pool_timeout
+            ),
+            http2=http2,
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client, _transport
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _transport = None
+
+
+def client_stats() -> Dict:
+    if _transport is None:
+        stats = {"open_connections": 0, "idle_connections": 0, "requests": 0}
+    else:
+        stats = _transport.stats()
+    stats["circuit"] = offer_circuit.stats()
+    stats["token_refreshes"] = token_manager.refreshes
+    return stats
+
+
+async def _send(endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+    started = time.perf_counter()
+    status_code = "error"
+    try:
+        response = await get_client().request(method, url, **kwargs)
+        status_code = response.status_code
+        return response
+    finally:
+        offer_service_latency.labels(endpoint, status_code).observe(
+            time.perf_counter() - started
+        )
+
+
+class TokenManager:
+    """Offer service access token shared by every call.
+
+    Concurrent refreshes collapse into one auth call. A token close to
+    expiry is refreshed in the background, an expired or rejected one is
+    refreshed before the call goes out.
+    """
+
+    def __init__(self, ttl: float, refresh_margin: float):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.token: Optional[str] = (
+            str(settings.access_token) if settings.access_token else None
+        )
+        # Unknown for a configured token, it is refreshed once rejected
+        self.expires_at: Optional[float] = None
+        self.refreshes = 0
+        self._refresh: Optional[asyncio.Task] = None
+
+    async def get(self) -> Optional[str]:
+        if self.token is None:
+            return await self.refresh()
+        if self.expires_at is not None:
+            remaining = self.expires_at - time.monotonic()
+            if remaining <= 0:
+                return await self.refresh()
+            if remaining <= self.refresh_margin:
+                self._start_refresh()
+        return self.token
+
+    async def refresh(self, stale: Optional[str] = None) -> Optional[str]:
+        """Get a new token, unless ``stale`` has been replaced meanwhile."""
+        if stale is not None and stale != self.token:
+            return self.token
+        # A cancelled caller must not cancel the refresh others are waiting on
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._authorize())
+            self._refresh.add_done_callback(_log_refresh_failure)
+        return self._refresh
+
+    async def _authorize(self) -> Optional[str]:
+        headers = {"Bearer": settings.refresh_token}
+        response = await _call(
+            "auth", "POST", API_URL + "auth", headers=headers, authorized=False
+        )
         if response.status_code != status.HTTP_201_CREATED:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="Lost external token for offer service..wait a moment and try again",
             )
-        settings.access_token = response.json().get("access_token")
-        return response.status_code
+        body = response.json()
+        self.token = body.get("access_token")
+        self.expires_at = time.monotonic() + float(body.get("expires_in", self.ttl))
+        self.refreshes += 1
+        settings.access_token = self.token
+        return self.token
 
 
-async def register_product(id: UUID, name: str, description: str) -> int:
-    try_count = 3
-    async with httpx.AsyncClient() as client:
-        payload = json.dumps({"id": str(id), "name": name, "description": description})
-
-        while try_count > 0:
-            headers = {"Bearer": settings.access_token}
-            response = await client.post(
-                API_URL + "products/register", content=payload, headers=headers
+def _log_refresh_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Offer service token refresh failed <{task.exception()!r}>")
+
+
+token_manager = TokenManager(
+    ttl=settings.offer_token_ttl, refresh_margin=settings.offer_token_refresh_margin
+)
+offer_circuit = CircuitBreaker(
+    failure_threshold=settings.offer_circuit_failures,
+    reset_timeout=settings.offer_circuit_reset,
+)
+_limiter = TokenBucket(
+    rate=settings.offer_client_rate, burst=settings.offer_client_burst
+)
+
+registry.gauge(
+    "offer_service_circuit_state",
+    "Offer service circuit breaker, 0 closed, 1 half open, 2 open.",
+    function=lambda: {OPEN: 2, HALF_OPEN: 1}.get(offer_circuit.state, 0),
+)
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    delay = backoff_delay(
+        attempt, settings.offer_client_backoff_base, settings.offer_client_backoff_max
+    )
+    too_many = status.HTTP_429_TOO_MANY_REQUESTS
+    if response is not None and response.status_code == too_many:
+        try:
+            delay = max(delay, float(response.headers.get("Retry-After", 0)))
+        except ValueError:
+            pass
+    return delay
+
+
+async def _call(
+    endpoint: str,
+    method: str,
+    url: str,
+    headers: Optional[Dict] = None,
+    authorized: bool = True,
+    **kwargs,
+) -> httpx.Response:
+    """Call the offer service through the circuit breaker and rate limiter.
+
+    5xx, 429 and transport errors count as failures and are retried with
+    exponential backoff and jitter. A 401 refreshes the token and retries
+    once straight away. Raises ``CircuitOpen`` while the circuit is open.
+    """
+    attempt = 0
+    token_refreshed = False
+    while True:
+        request_headers = dict(headers or {})
+        token = None
+        if authorized:
+            # Before the circuit check, an expired token is refreshed by an
+            # auth call that must be able to take the half open probe itself
+            token = request_headers["Bearer"] = await token_manager.get()
+        offer_circuit.before_call()
+        await _limiter.acquire()
+
+        response = None
+        try:
+            response = await _send(
+                endpoint, method, url, headers=request_headers, **kwargs
             )
-            if response.status_code == status.HTTP_201_CREATED:
-                break
+        except httpx.TransportError:
+            offer_circuit.record_failure()
+            if attempt >= settings.offer_client_retries:
+                raise
+        else:
+            if (
+                response.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR
+                or response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+            ):
+                offer_circuit.record_failure()
+                if attempt >= settings.offer_client_retries:
+                    return response
             else:
-                if response.status_code == status.HTTP_401_UNAUTHORIZED:
-                    await authorize()
-                try_count -= 1
+                offer_circuit.record_success()
+                if (
+                    response.status_code != status.HTTP_401_UNAUTHORIZED
+                    or not authorized
+                    or token_refreshed
+                ):
+                    return response
+                token_refreshed = True
+                await token_manager.refresh(stale=token)
+                continue
 
-        return response.status_code
+        offer_service_retries.labels(endpoint).inc()
+        await asyncio.sleep(_retry_delay(attempt, response))
+        attempt += 1
 
 
-async def get_product_offers(id: UUID) -> Dict:
-    try_count = 3
-    async with httpx.AsyncClient() as client:
-        while try_count > 0:
-            headers = {"Bearer": settings.access_token}
+async def authorize() -> int:
+    await token_manager.refresh()
+    return status.HTTP_201_CREATED
 
-            response = await client.get(
-                API_URL + f"products/{id}/offers", headers=headers
-            )
 
-            if response.status_code == status.HTTP_200_OK:
-                break
-            else:
-                if response.status_code == status.HTTP_401_UNAUTHORIZED:
-                    await authorize()
-                try_count -= 1
+async def register_product(id: UUID, name: str, description: str) -> int:
+    payload = json.dumps({"id": str(id), "name": name, "description": description})
+    response = await _call(
+        "register", "POST", API_URL + "products/register", content=payload
+    )
+    return response.status_code
 
-        return {"status_code": response.status_code, "data": response.json()}
+
+async def get_product_offers(id: UUID) -> Dict:
+    response = await _call("offers", "GET", API_URL + f"products/{id}/offers")
+    return {"status_code": response.status_code, "data": response.json()}
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Token bucket allowing ``rate`` calls per second with bursts up to ``burst``.
+
+    A rate of zero or less disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float) -> None:
+        # Tokens earned so far count at the old rate
+        self._refill()
+        self.rate = rate
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        # Waiters are served in arrival order
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
@@ -0,0 +1,92 @@
+import random
+import time
+
+from fastapi import HTTPException, status
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(HTTPException):
+    """Raised instead of calling a service whose circuit is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Offer service is unavailable..wait a moment and try again",
+            headers={"Retry-After": str(max(int(retry_after + 0.999), 1))},
+        )
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Open after ``failure_threshold`` consecutive failures and fail fast for
+    ``reset_timeout`` seconds, then let one probe call through (half open).
+    A successful probe closes the circuit, a failed one opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = None
+        self._probe_started_at = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def before_call(self) -> None:
+        """Raise ``CircuitOpen`` unless the call may go ahead."""
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == OPEN:
+            raise CircuitOpen(self.retry_after())
+        # One probe at a time, a probe that never reported back (cancelled)
+        # is replaced after reset_timeout
+        now = time.monotonic()
+        if (
+            self._probe_started_at is not None
+            and now - self._probe_started_at < self.reset_timeout
+        ):
+            raise CircuitOpen(self.reset_timeout - (now - self._probe_started_at))
+        self._probe_started_at = now
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        probe_failed = self._probe_started_at is not None
+        if probe_failed or self.failures >= self.failure_threshold:
+            if probe_failed or self._opened_at is None:
+                self.opened += 1
+            self._opened_at = time.monotonic()
+            self._probe_started_at = None
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "retry_after": self.retry_after(),
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter for retry number ``attempt`` (0 based)."""
+    return random.uniform(0, min(cap, base * 2**attempt))
@@ -0,0 +1,52 @@
+# JSON encoding of response models, orjson when installed and enabled
+
+import json
+from typing import Any, Dict, Optional, Type, TypeVar
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel
+
+from app.settings.conf import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+FAST_JSON = orjson is not None and settings.fast_responses
+
+DefaultResponse = ORJSONResponse if FAST_JSON else JSONResponse
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+def build_model(model_class: Type[Model], **values) -> Model:
+    """Build a response model, without validation when fast responses are on.
+
+    Only for values read from our own tables, which already fit the model.
+    """
+    if settings.fast_responses:
+        return model_class.construct(**values)
+    return model_class(**values)
+
+
+def dumps(model: BaseModel) -> bytes:
+    if FAST_JSON:
+        return orjson.dumps(model.dict())
+    return model.json().encode()
+
+
+def dumps_value(value: Any) -> bytes:
+    """Serialize plain data holding UUIDs and datetimes like dumps() does."""
+    if FAST_JSON:
+        return orjson.dumps(value)
+    return json.dumps(jsonable_encoder(value)).encode()
+
+
+def json_response(model: BaseModel, headers: Optional[Dict] = None) -> Response:
+    """Serialize ``model`` directly, skipping FastAPI's response_model validation."""
+    return Response(
+        content=dumps(model), media_type="application/json", headers=headers
+    )
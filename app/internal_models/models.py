@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 from pydantic import BaseModel, EmailStr, Extra, Field
 
@@ -27,6 +27,21 @@ class CreateProductResponse(ProductResponse):
     ...
 
 
+class BulkCreateItemResult(BaseInterfaceModel):
+    index: int = Field(example=0)
+    status: str = Field(example="created")
+    id: Optional[UUID] = Field(
+        default=None, example="a38269b5-1d44-434f-94f4-6c3ffb2a2ee6"
+    )
+    detail: Optional[str] = Field(default=None, example="Product registration failed.")
+
+
+class BulkCreateResponse(BaseInterfaceModel):
+    created: int = Field(example=2)
+    failed: int = Field(example=1)
+    results: List[BulkCreateItemResult]
+
+
 class UpdateProductRequest(ProductRequest):
     ...
 
@@ -45,6 +60,10 @@ class OfferB(BaseInterfaceModel):
     items_in_stock: int = Field(example=30)
 
 
+class OfferSnapshot(OfferB):
+    last_confirmed_at: datetime = Field(example="2011-08-12T23:17:46.384")
+
+
 class OfferBase(OfferB):
     offer_id: UUID = Field(example="a38269b5-1d44-434f-94f4-6c3ffb2a2ee6")
 
@@ -58,23 +77,61 @@ class ProductOfferResponse(ProductResponse):
 
 
 class Paging(BaseInterfaceModel):
-    page: int = Field(example=10)
+    # page, offset and total_pages are None on cursor pages, which skip the count
+    page: Optional[int] = Field(default=None, example=10)
     limit: int = Field(example=100)
-    offset: int = Field(example=10)
-    total_pages: int = Field(example=10)
+    offset: Optional[int] = Field(default=None, example=10)
+    total_pages: Optional[int] = Field(default=None, example=10)
+    next_cursor: Optional[str] = Field(default=None, example="WyIyMDExLTA4LTEy")
+
+
+class CursorPaging(BaseInterfaceModel):
+    limit: int = Field(example=100)
+    next_cursor: Optional[str] = Field(default=None, example="WyIxNmJlNWE4Mi")
+
+
+class ProductPagingResponse(BaseInterfaceModel):
+    products: List[ProductOfferResponse]
+    paging: CursorPaging
 
 
 class OfferHistoryResponse(BaseInterfaceModel):
     id: UUID = Field(example="a38269b5-1d44-434f-94f4-6c3ffb2a2ee6")
-    history: List[OfferB]
+    history: List[OfferSnapshot]
 
 
 class OfferHistoryPagingResponse(OfferHistoryResponse):
     paging: Paging
 
 
-class OfferTrendResponse(OfferHistoryResponse):
+class OfferTrendResponse(BaseInterfaceModel):
+    id: UUID = Field(example="a38269b5-1d44-434f-94f4-6c3ffb2a2ee6")
     price_trend: float = Field(example=12.5)
+    first_price: int = Field(example=100)
+    last_price: int = Field(example=112)
+    min_price: int = Field(example=95)
+    max_price: int = Field(example=120)
+    mean_price: float = Field(example=106.4)
+    stddev_price: Optional[float] = Field(default=None, example=6.2)
+    samples: int = Field(example=288)
+    history: Optional[List[OfferSnapshot]] = Field(default=None)
+
+
+class OfferCandle(BaseInterfaceModel):
+    bucket_start: datetime = Field(example="2011-08-12T20:00:00")
+    open_price: int = Field(example=100)
+    high_price: int = Field(example=120)
+    low_price: int = Field(example=95)
+    close_price: int = Field(example=112)
+    min_stock: int = Field(example=3)
+    max_stock: int = Field(example=30)
+    samples: int = Field(example=12)
+
+
+class OfferCandlesResponse(BaseInterfaceModel):
+    id: UUID = Field(example="a38269b5-1d44-434f-94f4-6c3ffb2a2ee6")
+    bucket: str = Field(example="1h")
+    candles: List[OfferCandle]
 
 
 class Token(BaseInterfaceModel):
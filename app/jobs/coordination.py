@@ -0,0 +1,160 @@
+# Coordination of the offer refresh job across replicas.
+#
+# Every uvicorn worker and container runs the job, so they agree on who
+# sweeps what through Postgres session level advisory locks, held on one
+# dedicated connection per replica. A replica that dies drops its
+# connection and Postgres releases its locks, no extra service is needed.
+#
+# "leader": the replica holding the leader lock sweeps the whole catalog,
+#           the others retry the lock every period.
+# "sharded": every replica holds one slot lock. The live slots are read
+#            from pg_locks before each sweep, a replica takes the product ids
+#            hashing to its position, so shards rebalance on the next sweep
+#            after a replica joins or dies.
+# "none": no coordination, every replica sweeps everything.
+#
+# Other once-per-cluster jobs, like partition maintenance, use their own
+# leader lock id.
+#
+# Each coordinator pins its connection for as long as the job runs, two per
+# replica plus the adaptive scheduler's LISTEN connection. Give them
+# app.db.sessions.lock_engine, which does not pool, so they do not eat into
+# the request pool (5 + 10 overflow per worker by default).
+
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.settings.conf import settings
+
+logger = logging.getLogger()
+
+# Two-key advisory locks, (class, id), apart from the migration lock
+LEADER_LOCK_CLASS = 7461002
+SHARD_LOCK_CLASS = 7461003
+
+# Object ids of the leader locks
+OFFER_REFRESH_LEADER = 0
+PARTITION_MAINTENANCE_LEADER = 1
+
+TRY_LOCK = text("SELECT pg_try_advisory_lock(:class_id, :object_id)")
+
+LIVE_SLOTS = text(
+    """
+    SELECT objid::int FROM pg_locks
+    WHERE locktype = 'advisory'
+      AND granted
+      AND classid::bigint = :class_id
+      AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+    ORDER BY objid::int
+    """
+)
+
+
+@dataclass(frozen=True)
+class Shard:
+    """The part of the catalog this replica sweeps: product ids hashing to index."""
+
+    index: int = 0
+    count: int = 1
+
+
+class RefreshCoordinator:
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        mode: Optional[str] = None,
+        leader_id: int = OFFER_REFRESH_LEADER,
+    ):
+        mode = mode or settings.offer_job_coordination
+        if mode not in ("leader", "sharded", "none"):
+            raise ValueError(f"Unknown offer job coordination mode <{mode}>")
+        self.engine = engine
+        self.mode = mode
+        self.leader_id = leader_id
+        self.slot: Optional[int] = None
+        self._conn: Optional[AsyncConnection] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.release()
+
+    async def _connection(self) -> AsyncConnection:
+        if self._conn is not None:
+            try:
+                await self._conn.execute(text("SELECT 1"))
+                return self._conn
+            except Exception as exc:
+                # Locks held on a broken connection are gone with it
+                logger.warning(f"Offer job lock connection lost <{exc!r}>")
+                await self._discard()
+        conn = await self.engine.connect()
+        # Locks outlive transactions, do not keep one open for the job lifetime
+        self._conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        return self._conn
+
+    async def _discard(self):
+        if self._conn is not None:
+            try:
+                await self._conn.invalidate()
+            finally:
+                self._conn = None
+                self.slot = None
+
+    async def _try_lock(self, conn: AsyncConnection, class_id: int, object_id: int):
+        result = await conn.execute(
+            TRY_LOCK, {"class_id": class_id, "object_id": object_id}
+        )
+        return result.scalar()
+
+    async def _live_slots(self, conn: AsyncConnection) -> List[int]:
+        result = await conn.execute(LIVE_SLOTS, {"class_id": SHARD_LOCK_CLASS})
+        return list(result.scalars())
+
+    async def claim(self) -> Optional[Shard]:
+        """Return the shard to sweep now, or None when another replica owns it."""
+        if self.mode == "none":
+            return Shard()
+
+        conn = await self._connection()
+        if self.mode == "leader":
+            if self.slot is None:
+                if not await self._try_lock(conn, LEADER_LOCK_CLASS, self.leader_id):
+                    return None
+                self.slot = self.leader_id
+                logger.info(f"Leader lock <{self.leader_id}> acquired")
+            return Shard()
+
+        if self.slot is None:
+            for slot in range(settings.offer_job_max_replicas):
+                if await self._try_lock(conn, SHARD_LOCK_CLASS, slot):
+                    self.slot = slot
+                    logger.info(f"Offer job shard slot <{slot}> acquired")
+                    break
+            else:
+                logger.warning("Every offer job shard slot is taken, replica idles")
+                return None
+
+        live = await self._live_slots(conn)
+        if self.slot not in live:
+            # Lock lost without the connection failing, claim again next time
+            self.slot = None
+            return None
+        return Shard(index=live.index(self.slot), count=len(live))
+
+    async def release(self):
+        if self._conn is None:
+            return
+        try:
+            # Session locks would otherwise stay with the pooled connection
+            await self._conn.execute(text("SELECT pg_advisory_unlock_all()"))
+            await self._conn.close()
+            self._conn = None
+            self.slot = None
+        except Exception:
+            await self._discard()
@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from fastapi import status
+from sqlalchemy import Text, cast, func, select
+from sqlalchemy.sql.expression import false
+
+from app.cache.response_cache import product_cache
+from app.cache.warmup import schedule_rewarm
+from app.db.err import OffersNotFetched
+from app.db.offer_ingest import OfferIngestor
+from app.db.sessions import async_engine
+from app.db.tables.products import Product
+from app.external_service.offer_handler import get_product_offers, offer_circuit
+from app.external_service.resilience import CircuitOpen, backoff_delay
+from app.jobs.coordination import Shard
+from app.metrics.instruments import (record_sweep, refresh_failed,
+                                     refresh_products, refresh_retries)
+from app.settings.conf import settings
+
+logger = logging.getLogger()
+
+# Product ids read per keyset page while walking a shard
+PRODUCT_ID_BATCH_SIZE = 1000
+
+
+class SweepStats:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.finished_at_wall = None
+        self.products = 0
+        self.offers = 0
+        self.retries = 0
+        self.circuit_waits = 0
+        self.failed: Dict[UUID, str] = {}
+
+    @property
+    def duration(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        # Products per second
+        if self.duration <= 0:
+            return 0.0
+        return self.products / self.duration
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+        self.finished_at_wall = time.time()
+
+    def as_dict(self) -> Dict:
+        return {
+            "products": self.products,
+            "offers": self.offers,
+            "retries": self.retries,
+            "circuit_waits": self.circuit_waits,
+            "circuit": offer_circuit.state,
+            "failed": len(self.failed),
+            "duration": self.duration,
+            "throughput": self.throughput,
+            "finished_at": self.finished_at_wall,
+        }
+
+
+last_sweep: SweepStats | None = None
+
+
+def product_ids_statement(shard: Shard):
+    """Ids of the live products belonging to ``shard``."""
+    statement = select(Product.id).filter(Product.is_deleted == false())
+    if shard.count > 1:
+        # hashtext is stable across replicas, the mask keeps it non negative
+        product_hash = func.hashtext(cast(Product.id, Text)).op("&")(0x7FFFFFFF)
+        statement = statement.filter(product_hash % shard.count == shard.index)
+    return statement
+
+
+def record_failed_rows(stats: SweepStats, rows: List[Dict], exc: Exception):
+    """Mark the products of rows that could not be written as failed."""
+    product_ids = {row["product_id"] for row in rows}
+    for product_id in product_ids:
+        stats.failed[product_id] = repr(exc)
+    refresh_failed.inc(len(product_ids))
+
+
+async def product_id_batches(
+    shard: Shard, batch_size: int = PRODUCT_ID_BATCH_SIZE
+) -> AsyncIterator[List[UUID]]:
+    """Yield the product ids of ``shard`` in id order, one keyset page at a time.
+
+    Each page runs on its own short-lived connection, so a slow consumer holds
+    neither a pooled connection nor an open transaction between pages.
+    """
+    last_id = None
+    while True:
+        statement = product_ids_statement(shard)
+        if last_id is not None:
+            statement = statement.filter(Product.id > last_id)
+        statement = statement.order_by(Product.id).limit(batch_size)
+        async with async_engine.connect() as conn:
+            product_ids = list((await conn.execute(statement)).scalars())
+        if product_ids:
+            yield product_ids
+        if len(product_ids) < batch_size:
+            return
+        last_id = product_ids[-1]
+
+
+async def _produce(fetch_queue: asyncio.Queue, shard: Shard):
+    async for product_ids in product_id_batches(shard):
+        for product_id in product_ids:
+            await fetch_queue.put(product_id)
+
+
+async def _fetch_offers(product_id: UUID, stats: SweepStats) -> List[Dict]:
+    attempt = 0
+    while True:
+        try:
+            response_product_offers = await get_product_offers(id=product_id)
+            response_status = response_product_offers.get("status_code")
+            response_data = response_product_offers.get("data", [{}])
+            if response_status != status.HTTP_200_OK:
+                raise OffersNotFetched(f"<{response_status}>, <{response_data}>")
+            return response_data
+        except CircuitOpen as exc:
+            # The offer service is down, not this product: wait for the circuit
+            # instead of using up retries
+            stats.circuit_waits += 1
+            await asyncio.sleep(max(exc.retry_after, settings.offer_job_retry_delay))
+        except Exception as exc:
+            if attempt >= settings.offer_job_retries:
+                raise
+            stats.retries += 1
+            refresh_retries.inc()
+            logger.warning(
+                f"Offer fetch for productId <{product_id}> failed <{exc!r}>, "
+                f"retry {attempt + 1}"
+            )
+            await asyncio.sleep(
+                backoff_delay(
+                    attempt,
+                    settings.offer_job_retry_delay,
+                    settings.offer_client_backoff_max,
+                )
+            )
+            attempt += 1
+
+
+async def _fetcher(
+    fetch_queue: asyncio.Queue,
+    write_queue: asyncio.Queue,
+    stats: SweepStats,
+    on_fetched: Optional[Callable[[UUID, List[Dict]], None]] = None,
+    on_failed: Optional[Callable[[UUID], None]] = None,
+):
+    while True:
+        product_id = await fetch_queue.get()
+        try:
+            logger.info(f"Check offer for productId <{product_id}>")
+            offers = await _fetch_offers(product_id, stats)
+            if on_fetched:
+                on_fetched(product_id, offers)
+            await write_queue.put((product_id, offers))
+        except Exception as exc:
+            stats.failed[product_id] = repr(exc)
+            refresh_failed.inc()
+            if on_failed:
+                on_failed(product_id)
+            logger.error(f"Offer update failed for productId <{product_id}>, <{exc!r}>")
+        finally:
+            fetch_queue.task_done()
+
+
+async def _writer(
+    write_queue: asyncio.Queue, ingestor: OfferIngestor, stats: SweepStats
+):
+    while True:
+        item: Tuple[UUID, List[Dict]] = await write_queue.get()
+        product_id, response_data = item
+        try:
+            rows = [
+                {
+                    "price": offer.get("price"),
+                    "items_in_stock": offer.get("items_in_stock"),
+                    "offer_id": offer.get("id"),
+                    "product_id": product_id,
+                }
+                for offer in response_data
+                if offer
+            ]
+            await ingestor.add(rows)
+            stats.products += 1
+            refresh_products.inc()
+        except Exception as exc:
+            stats.failed[product_id] = repr(exc)
+            refresh_failed.inc()
+            logger.error(f"Offer write failed for productId <{product_id}>, <{exc!r}>")
+        finally:
+            write_queue.task_done()
+
+
+async def refresh_offers(shard: Shard = Shard()) -> SweepStats:
+    """Run one sweep over ``shard``: page through product ids, fetch offers
+    concurrently, persist them."""
+    global last_sweep
+
+    stats = SweepStats()
+    concurrency = max(settings.offer_job_concurrency, 1)
+    fetch_queue = asyncio.Queue(maxsize=concurrency * 2)
+    write_queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    def _record_failed_batch(rows: List[Dict], exc: Exception):
+        record_failed_rows(stats, rows, exc)
+
+    async with OfferIngestor(on_error=_record_failed_batch) as ingestor:
+        workers = [
+            asyncio.create_task(_fetcher(fetch_queue, write_queue, stats))
+            for _ in range(concurrency)
+        ]
+        workers.append(asyncio.create_task(_writer(write_queue, ingestor, stats)))
+        try:
+            await _produce(fetch_queue, shard)
+            await fetch_queue.join()
+            await write_queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    stats.offers = ingestor.written
+    stats.finish()
+    # Cached bodies carry the offers of the previous sweep, rebuild them
+    schedule_rewarm(product_cache.keys())
+    last_sweep = stats
+    record_sweep(stats)
+    logger.info(
+        f"Offer refresh sweep of shard <{shard.index + 1}/{shard.count}> "
+        f"done in {stats.duration:.2f}s, "
+        f"products <{stats.products}>, offers <{stats.offers}>, "
+        f"failed <{len(stats.failed)}>, retries <{stats.retries}>, "
+        f"{stats.throughput:.1f} products/s"
+    )
+    return stats
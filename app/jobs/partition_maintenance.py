@@ -0,0 +1,37 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from app.db.partitions import apply_retention, ensure_partitions
+from app.db.sessions import async_engine, lock_engine
+from app.db.versioning import bump_data_version
+from app.jobs.coordination import PARTITION_MAINTENANCE_LEADER, RefreshCoordinator
+from app.settings.conf import settings
+
+logger = logging.getLogger()
+
+
+async def maintain_partitions() -> None:
+    """Create upcoming offers partitions and apply the retention policy."""
+    now = datetime.utcnow()
+    async with async_engine.begin() as conn:
+        await ensure_partitions(conn, now)
+    async with async_engine.begin() as conn:
+        changed = await apply_retention(conn, now)
+    if changed:
+        async with async_engine.begin() as conn:
+            await bump_data_version(conn)
+
+
+async def run_partition_maintenance():
+    """Maintain partitions forever, on the replica holding the maintenance lock."""
+    async with RefreshCoordinator(
+        lock_engine, mode="leader", leader_id=PARTITION_MAINTENANCE_LEADER
+    ) as coordinator:
+        while True:
+            try:
+                if await coordinator.claim() is not None:
+                    await maintain_partitions()
+            except Exception as exc:
+                logger.error(f"Offer partition maintenance failed <{exc!r}>")
+            await asyncio.sleep(settings.offer_partition_check_period)
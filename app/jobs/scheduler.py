@@ -0,0 +1,379 @@
+# Adaptive offer refresh.
+#
+# Instead of sweeping the catalog every offer_job_period, every product has
+# its own refresh interval and next-due time, kept in a heap. A fetch that
+# finds changed prices or stock halves the interval (down to
+# offer_schedule_min_interval), an unchanged one grows it by half (up to
+# offer_schedule_max_interval). Dispatch is paced by a token bucket so the
+# offer service never gets more than offer_schedule_budget products/s from
+# all replicas together, sharded replicas split the budget evenly.
+#
+# request_refresh() in app.db.refresh_requests sends a NOTIFY, the replica
+# scheduling the product moves it to the front of the queue.
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Dict, List, Optional, Set
+from uuid import UUID
+
+from app.cache.warmup import product_keys, schedule_rewarm
+from app.db.offer_ingest import OfferIngestor
+from app.db.refresh_requests import REFRESH_CHANNEL
+from app.db.sessions import async_engine, lock_engine
+from app.db.tables.products import Product
+from app.external_service.offer_handler import offer_circuit
+from app.external_service.rate_limit import TokenBucket
+from app.external_service.resilience import OPEN
+from app.jobs.coordination import RefreshCoordinator, Shard
+from app.jobs.offer_refresh import (SweepStats, _fetcher, _writer,
+                                    product_id_batches, product_ids_statement,
+                                    record_failed_rows)
+from app.metrics.instruments import refresh_throughput, set_refresh_lag_source
+from app.metrics.registry import registry
+from app.settings.conf import settings
+
+logger = logging.getLogger()
+
+SHRINK = 0.5
+GROWTH = 1.5
+# Spread of due times, so products added together do not stay in lockstep
+JITTER = 0.1
+
+
+class ProductSchedule:
+    __slots__ = ("interval", "due", "fingerprint", "in_flight", "requested")
+
+    def __init__(self, interval: float, due: float):
+        self.interval = interval
+        self.due = due
+        self.fingerprint: Optional[int] = None
+        self.in_flight = False
+        self.requested = False
+
+
+def offers_fingerprint(offers: List[Dict]) -> int:
+    return hash(
+        frozenset(
+            (offer.get("id"), offer.get("price"), offer.get("items_in_stock"))
+            for offer in offers
+            if offer
+        )
+    )
+
+
+class RefreshScheduler:
+    """Per product next-due times, the earliest due product is dispatched first."""
+
+    def __init__(
+        self,
+        min_interval: float = settings.offer_schedule_min_interval,
+        max_interval: float = settings.offer_schedule_max_interval,
+        initial_interval: float = settings.offer_job_period,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.initial_interval = min(
+            max(initial_interval, self.min_interval), self.max_interval
+        )
+        self.products: Dict[UUID, ProductSchedule] = {}
+        self.stats = SweepStats()
+        self.changed = 0
+        self.unchanged = 0
+        self.throughput = 0.0
+        self._throughput_at = time.monotonic()
+        self._throughput_products = 0
+        self._heap: list = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._requested: Set[UUID] = set()
+
+    def _push(self, product_id: UUID, schedule: ProductSchedule) -> None:
+        heapq.heappush(self._heap, (schedule.due, next(self._counter), product_id))
+        self._wakeup.set()
+
+    def _jittered(self, interval: float) -> float:
+        return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def add(self, product_id: UUID, due: Optional[float] = None) -> None:
+        if product_id in self.products:
+            return
+        if due is None:
+            # New products are spread over one interval instead of all due now
+            due = time.monotonic() + random.uniform(0, self.initial_interval)
+        schedule = self.products[product_id] = ProductSchedule(
+            self.initial_interval, due
+        )
+        self._push(product_id, schedule)
+
+    def sync(self, product_ids: Set[UUID]) -> None:
+        """Track exactly ``product_ids``, for example after a shard change."""
+        for product_id in set(self.products) - product_ids:
+            del self.products[product_id]
+        for product_id in product_ids:
+            self.add(product_id)
+        # Entries of removed products are skipped when popped, compact once
+        # they dominate the heap
+        if len(self._heap) > 2 * len(self.products) + 1024:
+            self._heap = [entry for entry in self._heap if self._is_current(entry)]
+            heapq.heapify(self._heap)
+
+    def clear(self) -> None:
+        self.products.clear()
+        self._heap.clear()
+
+    def push_front(self, product_id: UUID) -> None:
+        """Refresh ``product_id`` before every other product."""
+        schedule = self.products.get(product_id)
+        if schedule is None:
+            self.add(product_id, due=float("-inf"))
+        elif schedule.in_flight:
+            schedule.requested = True
+        else:
+            schedule.due = float("-inf")
+            self._push(product_id, schedule)
+
+    def request(self, product_id: UUID) -> None:
+        """Queue a refresh request, it is checked against the shard before use."""
+        self._requested.add(product_id)
+        self._wakeup.set()
+
+    def _is_current(self, entry) -> bool:
+        due, _, product_id = entry
+        schedule = self.products.get(product_id)
+        return schedule is not None and not schedule.in_flight and schedule.due == due
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> Optional[UUID]:
+        due = self.next_due()
+        if due is None or due > now:
+            return None
+        _, _, product_id = heapq.heappop(self._heap)
+        self.products[product_id].in_flight = True
+        return product_id
+
+    def _reschedule(self, product_id: UUID, schedule: ProductSchedule) -> None:
+        schedule.in_flight = False
+        if schedule.requested:
+            schedule.requested = False
+            schedule.due = float("-inf")
+        else:
+            schedule.due = time.monotonic() + self._jittered(schedule.interval)
+        self._push(product_id, schedule)
+
+    def record(self, product_id: UUID, offers: List[Dict]) -> None:
+        schedule = self.products.get(product_id)
+        if schedule is None:
+            return
+        self.stats.failed.pop(product_id, None)
+        fingerprint = offers_fingerprint(offers)
+        if schedule.fingerprint is not None:
+            if fingerprint != schedule.fingerprint:
+                schedule.interval = max(self.min_interval, schedule.interval * SHRINK)
+                self.changed += 1
+            else:
+                schedule.interval = min(self.max_interval, schedule.interval * GROWTH)
+                self.unchanged += 1
+        schedule.fingerprint = fingerprint
+        self._reschedule(product_id, schedule)
+
+    def record_failure(self, product_id: UUID) -> None:
+        schedule = self.products.get(product_id)
+        if schedule is None:
+            return
+        # Keep the interval, but come back soon instead of waiting it out
+        schedule.in_flight = False
+        schedule.due = time.monotonic() + self._jittered(self.min_interval)
+        self._push(product_id, schedule)
+
+    def overdue(self) -> float:
+        """Seconds the most overdue product has been waiting."""
+        due = self.next_due()
+        if due is None or due == float("-inf"):
+            return 0.0
+        return max(time.monotonic() - due, 0.0)
+
+    def _record_throughput(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._throughput_at
+        if elapsed > 0:
+            products = self.stats.products - self._throughput_products
+            self.throughput = products / elapsed
+            refresh_throughput.set(self.throughput)
+        self._throughput_at = now
+        self._throughput_products = self.stats.products
+
+    def as_dict(self) -> Dict:
+        intervals = [schedule.interval for schedule in self.products.values()]
+        # There are no sweeps, products and failures count since startup
+        stats = self.stats.as_dict()
+        del stats["duration"], stats["finished_at"]
+        return {
+            **stats,
+            "throughput": self.throughput,
+            "scheduled": len(self.products),
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            "overdue": self.overdue(),
+            "interval_min": min(intervals, default=0.0),
+            "interval_avg": sum(intervals) / len(intervals) if intervals else 0.0,
+            "interval_max": max(intervals, default=0.0),
+        }
+
+    async def _wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _sync(self, coordinator: RefreshCoordinator) -> Optional[Shard]:
+        shard = await coordinator.claim()
+        if shard is None:
+            self.clear()
+            return None
+        product_ids = set()
+        async for batch in product_id_batches(shard):
+            product_ids.update(batch)
+        self.sync(product_ids)
+        return shard
+
+    def _apply_budget(self, budget: TokenBucket, shard: Shard) -> None:
+        rate = settings.offer_schedule_budget / shard.count
+        budget.set_rate(rate)
+        # Every product must be fetched once per max_interval at least
+        if rate > 0 and len(self.products) / rate > self.max_interval:
+            logger.warning(
+                f"Offer schedule budget <{rate:.2f}> products/s cannot refresh "
+                f"<{len(self.products)}> products every "
+                f"<{self.max_interval:.0f}>s, raise OFFER_SCHEDULE_BUDGET"
+            )
+
+    async def _apply_requests(self, shard: Shard) -> None:
+        requested, self._requested = self._requested, set()
+        unknown = requested - set(self.products)
+        if unknown:
+            # New products, keep the ones that belong to this shard
+            statement = product_ids_statement(shard).filter(Product.id.in_(unknown))
+            async with async_engine.connect() as conn:
+                owned = set((await conn.execute(statement)).scalars())
+            requested = (requested - unknown) | owned
+        for product_id in requested:
+            self.push_front(product_id)
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            self.request(UUID(payload))
+        except ValueError:
+            logger.warning(f"Ignoring offer refresh request <{payload}>")
+
+    async def _listen(self):
+        conn = await lock_engine.connect()
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.add_listener(REFRESH_CHANNEL, self._on_notify)
+        return conn, raw.driver_connection
+
+    async def run(self, coordinator: RefreshCoordinator) -> None:
+        """Refresh offers forever, dispatching products as they fall due."""
+        concurrency = max(settings.offer_job_concurrency, 1)
+        budget = TokenBucket(rate=settings.offer_schedule_budget, burst=concurrency)
+        fetch_queue = asyncio.Queue(maxsize=concurrency)
+        write_queue = asyncio.Queue(maxsize=concurrency * 2)
+
+        def _on_written(rows: List[Dict]):
+            self.stats.offers += len(rows)
+            schedule_rewarm(product_keys(row["product_id"] for row in rows))
+
+        def _on_error(rows: List[Dict], exc: Exception):
+            record_failed_rows(self.stats, rows, exc)
+
+        listener = driver_connection = None
+        shard: Optional[Shard] = None
+        synced_at = float("-inf")
+        set_refresh_lag_source(self.overdue)
+        async with OfferIngestor(
+            on_written=_on_written, on_error=_on_error
+        ) as ingestor:
+            workers = [
+                asyncio.create_task(
+                    _fetcher(
+                        fetch_queue,
+                        write_queue,
+                        self.stats,
+                        on_fetched=self.record,
+                        on_failed=self.record_failure,
+                    )
+                )
+                for _ in range(concurrency)
+            ]
+            workers.append(
+                asyncio.create_task(_writer(write_queue, ingestor, self.stats))
+            )
+            try:
+                while True:
+                    try:
+                        # Clear before reading requests and the heap, a wake-up
+                        # arriving after that is kept for the next _wait()
+                        self._wakeup.clear()
+                        now = time.monotonic()
+                        if now - synced_at >= settings.offer_schedule_sync_period:
+                            if listener is None or driver_connection.is_closed():
+                                if listener is not None:
+                                    await listener.invalidate()
+                                listener, driver_connection = await self._listen()
+                            shard = await self._sync(coordinator)
+                            synced_at = now
+                            self._record_throughput()
+                            if shard is not None:
+                                self._apply_budget(budget, shard)
+                        if shard is None:
+                            await self._wait(settings.offer_schedule_sync_period)
+                            continue
+                        if self._requested:
+                            await self._apply_requests(shard)
+
+                        if offer_circuit.state == OPEN:
+                            # Fetches would fail fast, keep products queued
+                            await self._wait(offer_circuit.retry_after())
+                            continue
+
+                        product_id = self.pop_due(time.monotonic())
+                        if product_id is None:
+                            wake = synced_at + settings.offer_schedule_sync_period
+                            due = self.next_due()
+                            if due is not None:
+                                wake = min(due, wake)
+                            await self._wait(wake - time.monotonic())
+                            continue
+                        await budget.acquire()
+                        await fetch_queue.put(product_id)
+                    except Exception as exc:
+                        logger.error(f"Offer refresh scheduling failed <{exc!r}>")
+                        synced_at = float("-inf")
+                        await asyncio.sleep(settings.offer_schedule_min_interval)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                if listener is not None:
+                    await listener.close()
+
+
+offer_scheduler = RefreshScheduler()
+
+registry.gauge(
+    "offer_schedule_products",
+    "Products tracked by the adaptive offer refresh scheduler.",
+    function=lambda: len(offer_scheduler.products),
+)
+registry.gauge(
+    "offer_schedule_overdue_seconds",
+    "Seconds the most overdue product has been waiting for a refresh.",
+    function=offer_scheduler.overdue,
+)
@@ -0,0 +1,154 @@
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.metrics.registry import registry
+
+SWEEP_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+request_latency = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status code.",
+    ("method", "route", "status"),
+)
+db_query_latency = registry.histogram(
+    "db_query_duration_seconds",
+    "Database statement latency by statement verb.",
+    ("operation",),
+)
+db_pool_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the async_engine pool.",
+)
+offer_service_latency = registry.histogram(
+    "offer_service_request_duration_seconds",
+    "Offer service call latency by endpoint and status code.",
+    ("endpoint", "status"),
+)
+offer_service_pool_wait = registry.histogram(
+    "offer_service_pool_wait_seconds",
+    "Time offer service calls wait for a pooled connection.",
+)
+offer_service_retries = registry.counter(
+    "offer_service_retries",
+    "Offer service calls repeated after a failed response.",
+    ("endpoint",),
+)
+refresh_sweep_duration = registry.histogram(
+    "offer_refresh_sweep_duration_seconds",
+    "Duration of completed offer refresh sweeps.",
+    buckets=SWEEP_BUCKETS,
+)
+refresh_throughput = registry.gauge(
+    "offer_refresh_products_per_second",
+    "Products refreshed per second in the last completed sweep, or the last "
+    "sync period of the adaptive schedule.",
+)
+refresh_products = registry.counter(
+    "offer_refresh_products", "Products refreshed by the offer job."
+)
+refresh_failed = registry.counter(
+    "offer_refresh_failed_products", "Products the offer job failed to refresh."
+)
+refresh_retries = registry.counter(
+    "offer_refresh_retries", "Offer fetches retried by the offer job."
+)
+refresh_last_finished = registry.gauge(
+    "offer_refresh_last_finished_timestamp_seconds",
+    "Unix time the last offer refresh sweep finished.",
+)
+
+
+_lag_source = None
+
+
+def set_refresh_lag_source(function) -> None:
+    """Report ``function()`` as the refresh lag, for schedules without sweeps."""
+    global _lag_source
+    _lag_source = function
+
+
+def _refresh_lag():
+    if _lag_source is not None:
+        return _lag_source()
+    finished = refresh_last_finished.labels().value
+    return time.time() - finished if finished else None
+
+
+registry.gauge(
+    "offer_refresh_lag_seconds",
+    "Seconds since the last offer refresh sweep finished, with the adaptive "
+    "schedule seconds the most overdue product has been waiting.",
+    function=_refresh_lag,
+)
+
+
+def record_sweep(stats) -> None:
+    # Products, failures and retries are counted as they happen
+    refresh_sweep_duration.observe(stats.duration)
+    refresh_throughput.set(stats.throughput)
+    refresh_last_finished.set(stats.finished_at_wall)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request.
+
+    Requests are labelled with the matched route template, never the raw
+    path, so the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_latency.labels(scope["method"], route, status_code).observe(
+                time.perf_counter() - started
+            )
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool which records how long checkouts wait for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    operation = statement.lstrip()[:6].lower()
+    if operation not in ("select", "insert", "update", "delete"):
+        operation = "other"
+    db_query_latency.labels(operation).observe(
+        time.perf_counter() - context._query_started
+    )
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement run by ``engine``, sync or async."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
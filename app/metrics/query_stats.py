@@ -0,0 +1,145 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+
+from app.settings.conf import settings
+
+logger = logging.getLogger()
+
+_current: ContextVar[Optional["QueryStats"]] = ContextVar("query_stats", default=None)
+
+# Bind placeholders and literals, so statements differing only in values
+# (or in the length of an expanded IN list) share a shape
+_VALUE = r"(?:\$\d+|%s|%\(\w+\)s|\?|'[^']*'|\b\d+\b)"
+_PLACEHOLDERS = re.compile(rf"{_VALUE}(?:\s*,\s*{_VALUE})*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    return _PLACEHOLDERS.sub("?", _WHITESPACE.sub(" ", statement).strip())
+
+
+class QueryStats:
+    """Statements run by one HTTP request or one tracked block."""
+
+    def __init__(self):
+        self.statements = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        self.statements += 1
+        self.total_time += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = statement
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Statement shapes run more than ``threshold`` times, likely N+1 loops."""
+        return [
+            (shape, count) for shape, count in self.shapes.items() if count > threshold
+        ]
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.total_time * 1000:.2f};desc="{self.statements} queries", '
+            f"db-slowest;dur={self.slowest_time * 1000:.2f}"
+        )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._query_stats_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, "_query_stats_started", None)
+    if stats is not None and started is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+def instrument_queries(engine) -> None:
+    """Attribute statements run by ``engine`` to the tracked request, idempotent."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def track_queries():
+    """Collect the statements run inside the block into a ``QueryStats``."""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def query_budget(statements: int, repeats: Optional[int] = None):
+    """Fail when the block runs more than ``statements`` statements, or one
+    statement shape more than ``repeats`` times.
+
+    The engine has to be passed to ``instrument_queries`` first.
+    """
+    with track_queries() as stats:
+        yield stats
+    assert stats.statements <= statements, (
+        f"{stats.statements} statements, budget is {statements}: "
+        f"{dict(stats.shapes)}"
+    )
+    if repeats is not None:
+        repeated = stats.repeated(repeats)
+        assert not repeated, f"statements repeated over {repeats} times: {repeated}"
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware attributing statements to the HTTP request.
+
+    Adds a ``Server-Timing`` header, logs one line per request and warns
+    when a statement shape repeats more than ``sql_repeat_threshold`` times.
+    Statements run after the response started, for example while streaming,
+    are logged but cannot be part of the header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with track_queries() as stats:
+            await self.app(scope, receive, send_with_timing)
+
+        route = getattr(scope.get("route"), "path", scope["path"])
+        logger.info(
+            f"SQL method=<{scope['method']}> route=<{route}> "
+            f"statements=<{stats.statements}> db_ms=<{stats.total_time * 1000:.2f}> "
+            f"slowest_ms=<{stats.slowest_time * 1000:.2f}> "
+            f"slowest=<{_WHITESPACE.sub(' ', stats.slowest_statement or '')[:200]}>"
+        )
+        for shape, count in stats.repeated(settings.sql_repeat_threshold):
+            logger.warning(
+                f"Possible N+1 on route <{route}>: "
+                f"statement ran {count} times <{shape}>"
+            )
@@ -1,3 +1,10 @@
+import base64
+import json
+from typing import List
+
+from app.db.err import InvalidCursor
+
+
 class Pagination:
     def __init__(self, total_items: int, offset: int = 1, limit: int = 10):
         self.total_items = total_items
@@ -19,3 +26,23 @@ class Pagination:
 
         page_number = (self.offset // self.limit) + 1
         return page_number
+
+
+def encode_cursor(*values) -> str:
+    # Opaque cursor: urlsafe base64 of the keyset values
+    raw = json.dumps([str(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor
+    # encode_cursor only writes strings, anything else was crafted
+    if not isinstance(values, list) or not all(
+        isinstance(value, str) for value in values
+    ):
+        raise InvalidCursor
+    return values
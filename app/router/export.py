@@ -0,0 +1,57 @@
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from app.auth.jwt_bearer import jwtBearer
+from app.db.export import stream_catalog, stream_offer_history
+
+router = APIRouter()
+
+NDJSON = "application/x-ndjson"
+
+
+@router.get(
+    "/export/products",
+    tags=["export"],
+    dependencies=[Depends(jwtBearer())],
+    summary="Export catalog.",
+    description="Stream all undeleted products with their current offers as NDJSON.",
+    responses={
+        status.HTTP_200_OK: {"description": "Catalog stream.", "content": {NDJSON: {}}},
+    },
+)
+async def export_products() -> StreamingResponse:
+    return StreamingResponse(stream_catalog(), media_type=NDJSON)
+
+
+@router.get(
+    "/export/offer/{offer_id}/history",
+    tags=["export"],
+    dependencies=[Depends(jwtBearer())],
+    summary="Export offer history.",
+    description="Stream the full history of an offer as NDJSON, oldest first.",
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Offer history stream.",
+            "content": {NDJSON: {}},
+        },
+        status.HTTP_400_BAD_REQUEST: {"description": "Start time after end time."},
+    },
+)
+async def export_offer_history(
+    offer_id: UUID,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+) -> StreamingResponse:
+    start_time = start_time or datetime.min
+    end_time = end_time or datetime.max
+    if start_time > end_time:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Start time after end time."
+        )
+    return StreamingResponse(
+        stream_offer_history(offer_id, start_time, end_time), media_type=NDJSON
+    )
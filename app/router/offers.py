@@ -2,13 +2,19 @@ from datetime import datetime
 from typing import Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import (APIRouter, Depends, HTTPException, Path, Query, Request,
+                     status)
 
 from app.auth.jwt_bearer import jwtBearer
-from app.db.err import EntityDoesNotExist, StartTimeAfterEndTime
+from app.cache.etag import make_etag, not_modified
+from app.db.err import (EntityDoesNotExist, InvalidCursor,
+                        StartTimeAfterEndTime)
 from app.db.product_database import ProductDatabase
 from app.db.sessions import get_database
-from app.internal_models.models import (OfferHistoryPagingResponse,
+from app.internal_models.encoding import build_model, json_response
+from app.db.offer_rollups import BUCKETS
+from app.internal_models.models import (OfferCandlesResponse,
+                                        OfferHistoryPagingResponse,
                                         OfferTrendResponse)
 
 router = APIRouter()
@@ -19,24 +25,64 @@ router = APIRouter()
     tags=["offers"],
     dependencies=[Depends(jwtBearer())],
     summary="Get offer history by id.",
-    description="Get offer history by id.",
+    description=(
+        "Get offer history by id. Pass the returned next_cursor to walk deep pages, "
+        "cursor pages skip the count and leave page, offset and total_pages empty. "
+        "With OFFER_HISTORY_MODE=changes every item is a run of identical "
+        "snapshots from created_at to last_confirmed_at, so limit, offset and "
+        "total_pages count runs, not snapshots."
+    ),
     responses={
         status.HTTP_200_OK: {
             "description": "Offer history was successfully retrieved."
         },
+        status.HTTP_304_NOT_MODIFIED: {"description": "Offer history not modified."},
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Start time after end time or invalid cursor."
+        },
         status.HTTP_404_NOT_FOUND: {"description": "Offer history not found"},
     },
     response_model=OfferHistoryPagingResponse,
 )
 async def get_offer(
     offer_id: UUID,
-    limit: int = 10,
-    offset: int = 0,
+    request: Request,
+    limit: int = Path(ge=1),
+    offset: int = Path(ge=0),
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    cursor: Optional[str] = None,
     database: ProductDatabase = Depends(get_database(ProductDatabase)),
 ) -> Optional[OfferHistoryPagingResponse]:
+    start_time = start_time or datetime.min
+    end_time = end_time or datetime.max
+    etag = None
+    version = await database.offer_history_version(offer_id, start_time, end_time)
+    if version is not None:
+        etag = make_etag(version, request)
+        response_not_modified = not_modified(request, etag)
+        if response_not_modified:
+            return response_not_modified
+
     try:
-        return await database._get_offer_history(
-            offer_id=offer_id, limit=limit, offset=offset
+        offer_history = await database._get_offer_history(
+            offer_id=offer_id,
+            start_time=start_time,
+            end_time=end_time,
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+        )
+        return json_response(
+            offer_history, headers={"ETag": etag} if etag else None
+        )
+    except StartTimeAfterEndTime:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Start time after end time."
+        )
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor."
         )
     except EntityDoesNotExist:
         raise HTTPException(
@@ -49,7 +95,7 @@ async def get_offer(
     tags=["offers"],
     dependencies=[Depends(jwtBearer())],
     summary="Get offer trend.",
-    description="Get offer trend.",
+    description="Get offer trend with price statistics. Set include_history to also return the snapshots.",
     responses={
         status.HTTP_200_OK: {"description": "Offer trend was successfully retrieved."},
         status.HTTP_400_BAD_REQUEST: {"description": "Start time after end time."},
@@ -61,28 +107,85 @@ async def get_offer_trend(
     offer_id: UUID,
     start_time: datetime = datetime.utcnow(),
     end_time: datetime =  datetime.utcnow(),
+    include_history: bool = False,
     database: ProductDatabase = Depends(get_database(ProductDatabase)),
 ) -> Optional[OfferTrendResponse]:
     try:
-        offer_history = await database._get_offer_history(
-            offer_id=offer_id,
-            start_time=start_time,
-            end_time=end_time,
-            calc_percentage_change=True,
+        trend = await database._get_offer_trend(
+            offer_id=offer_id, start_time=start_time, end_time=end_time
         )
 
-        if offer_history.history:
-            last_val = offer_history.history[-1].price
-            first_val = offer_history.history[0].price
-            percentage_change = ((last_val - first_val) / first_val) * 100
+        history = None
+        if include_history:
+            offer_history = await database._get_offer_history(
+                offer_id=offer_id,
+                start_time=start_time,
+                end_time=end_time,
+                calc_percentage_change=True,
+            )
+            history = offer_history.history
+
+        percentage_change = 0.0
+        if trend.first_price:
+            percentage_change = (
+                (trend.last_price - trend.first_price) / trend.first_price
+            ) * 100
 
-            return OfferTrendResponse(
-                id=offer_history.id,
-                history=offer_history.history,
-                price_trend=f"{percentage_change:.2f}",
+        return json_response(
+            build_model(
+                OfferTrendResponse,
+                id=offer_id,
+                price_trend=round(percentage_change, 2),
+                first_price=trend.first_price,
+                last_price=trend.last_price,
+                min_price=trend.min_price,
+                max_price=trend.max_price,
+                mean_price=float(trend.mean_price),
+                stddev_price=float(trend.stddev_price)
+                if trend.stddev_price is not None
+                else None,
+                samples=trend.samples,
+                history=history,
             )
-        else:
-            raise EntityDoesNotExist
+        )
+    except StartTimeAfterEndTime:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Start time after end time."
+        )
+    except EntityDoesNotExist:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Offer history not found."
+        )
+
+
+@router.get(
+    "/offer/{offer_id}/candles",
+    tags=["offers"],
+    dependencies=[Depends(jwtBearer())],
+    summary="Get offer price candles.",
+    description=f"Get open/high/low/close price and stock range per time bucket ({', '.join(BUCKETS)}).",
+    responses={
+        status.HTTP_200_OK: {"description": "Offer candles were successfully retrieved."},
+        status.HTTP_400_BAD_REQUEST: {"description": "Start time after end time."},
+        status.HTTP_404_NOT_FOUND: {"description": "Offer history not found."},
+    },
+    response_model=OfferCandlesResponse,
+)
+async def get_offer_candles(
+    offer_id: UUID,
+    bucket: str = Query(default="1h", regex="^(" + "|".join(BUCKETS) + ")$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    database: ProductDatabase = Depends(get_database(ProductDatabase)),
+) -> Optional[OfferCandlesResponse]:
+    try:
+        offer_candles = await database._get_offer_candles(
+            offer_id=offer_id,
+            bucket=bucket,
+            start_time=start or datetime.min,
+            end_time=end or datetime.max,
+        )
+        return json_response(offer_candles)
     except StartTimeAfterEndTime:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Start time after end time."
@@ -1,17 +1,28 @@
+import json
+from typing import Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Body, Depends, HTTPException, status
-from typing import List
+from fastapi import (APIRouter, Body, Depends, HTTPException, Query, Request,
+                     Response, status)
+from pydantic import ValidationError
+
 from app.auth.jwt_bearer import jwtBearer
-from app.db.err import EntityDoesNotExist
+from app.cache.etag import make_etag, not_modified
+from app.cache.response_cache import product_cache
+from app.db.err import EntityDoesNotExist, InvalidCursor
 from app.db.product_database import ProductDatabase
 from app.db.sessions import get_database
-from app.internal_models.models import (CreateProductRequest,
+from app.internal_models.models import (BulkCreateItemResult,
+                                        BulkCreateResponse,
+                                        CreateProductRequest,
                                         CreateProductResponse,
                                         DeleteProductResponse, ProductResponse,
                                         ProductOfferResponse,
+                                        ProductPagingResponse,
                                         UpdateProductRequest,
                                         UpdateProductResponse)
+from app.internal_models.encoding import dumps
+from app.settings.conf import settings
 
 router = APIRouter()
 
@@ -38,6 +49,62 @@ async def create_products(
     return await database.create(product_create=create_request)
 
 
+@router.post(
+    "/products/bulk",
+    tags=["products"],
+    dependencies=[Depends(jwtBearer())],
+    summary="Create products in bulk.",
+    description="Create a batch of products sent as a JSON array or as NDJSON "
+    "(Content-Type: application/x-ndjson). Every item gets its own result.",
+    responses={
+        status.HTTP_200_OK: {"description": "Batch was processed."},
+        status.HTTP_400_BAD_REQUEST: {"description": "Batch could not be parsed."},
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {"description": "Batch too large."},
+    },
+    response_model=BulkCreateResponse,
+)
+async def bulk_create_products(
+    request: Request,
+    database: ProductDatabase = Depends(get_database(ProductDatabase)),
+) -> BulkCreateResponse:
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON batch."
+        )
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Expected a list of products.",
+        )
+    if len(items) > settings.bulk_create_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.bulk_create_max_items} products per batch.",
+        )
+
+    valid, results = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, CreateProductRequest.parse_obj(item)))
+        except ValidationError as exc:
+            results.append(
+                BulkCreateItemResult(index=index, status="failed", detail=str(exc))
+            )
+
+    results.extend(await database.bulk_create(products_create=valid))
+    results.sort(key=lambda result: result.index)
+    created = sum(1 for result in results if result.status == "created")
+    return BulkCreateResponse(
+        created=created, failed=len(results) - created, results=results
+    )
+
+
 @router.put(
     "/product/{product_id}",
     tags=["products"],
@@ -96,15 +163,40 @@ async def delete_product(
     description="Get product.",
     responses={
         status.HTTP_200_OK: {"description": "Product was retrieved."},
+        status.HTTP_304_NOT_MODIFIED: {"description": "Product not modified."},
         status.HTTP_404_NOT_FOUND: {"description": "Product not found."},
     },
     response_model=ProductOfferResponse,
 )
 async def get_product(
-    product_id: UUID, database: ProductDatabase = Depends(get_database(ProductDatabase))
+    product_id: UUID,
+    request: Request,
+    database: ProductDatabase = Depends(get_database(ProductDatabase)),
 ) -> ProductOfferResponse:
+    version = await database.product_version(product_id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Product not found."
+        )
+    etag = make_etag(version, request)
+    response_not_modified = not_modified(request, etag)
+    if response_not_modified:
+        return response_not_modified
+
+    key = ("product", product_id)
+    body = product_cache.get(key, version)
+    if body is not None:
+        return Response(
+            content=body, media_type="application/json", headers={"ETag": etag}
+        )
     try:
-        return await database.get(product_id=product_id)
+        generation = product_cache.generation
+        product = await database.get(product_id=product_id)
+        body = dumps(product)
+        product_cache.set(key, body, generation, version)
+        return Response(
+            content=body, media_type="application/json", headers={"ETag": etag}
+        )
     except EntityDoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Product not found."
@@ -116,18 +208,48 @@ async def get_product(
     tags=["products"],
     dependencies=[Depends(jwtBearer())],
     summary="Get all products info.",
-    description="Get all undeleted products.",
+    description="Get undeleted products page by page. Pass the returned next_cursor to get the next page.",
     responses={
         status.HTTP_200_OK: {"description": "Products was retrieved."},
+        status.HTTP_304_NOT_MODIFIED: {"description": "Products not modified."},
+        status.HTTP_400_BAD_REQUEST: {"description": "Invalid cursor."},
         status.HTTP_404_NOT_FOUND: {"description": "Products not found."},
     },
-    response_model=List[ProductOfferResponse],
+    response_model=ProductPagingResponse,
 )
 async def get_products(
+    request: Request,
+    limit: Optional[int] = Query(default=None, ge=1),
+    cursor: Optional[str] = None,
     database: ProductDatabase = Depends(get_database(ProductDatabase)),
-) -> List[ProductOfferResponse]:
+) -> ProductPagingResponse:
+    limit = min(limit or settings.products_page_size, settings.products_page_size_max)
     try:
-        return await database.get_all()
+        version = await database.products_version(limit=limit, cursor=cursor)
+        if version is None:
+            raise EntityDoesNotExist
+        etag = make_etag(version, request)
+        response_not_modified = not_modified(request, etag)
+        if response_not_modified:
+            return response_not_modified
+
+        key = ("products", limit, cursor)
+        body = product_cache.get(key, version)
+        if body is not None:
+            return Response(
+                content=body, media_type="application/json", headers={"ETag": etag}
+            )
+        generation = product_cache.generation
+        products = await database.get_all(limit=limit, cursor=cursor)
+        body = dumps(products)
+        product_cache.set(key, body, generation, version)
+        return Response(
+            content=body, media_type="application/json", headers={"ETag": etag}
+        )
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor."
+        )
     except EntityDoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Products not found."
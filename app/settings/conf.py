@@ -26,6 +26,36 @@ class Config(BaseConfig):
     debug: bool = os.environ.get("DEBUG")
     offer_ms_api_url: str = os.environ.get("OFFER_MS_URL")
     refresh_token: str = os.environ.get("OFFER_REFRESH_TOKEN")
+    offer_client_max_connections: int = int(
+        os.environ.get("OFFER_CLIENT_MAX_CONNECTIONS", 100)
+    )
+    offer_client_max_keepalive: int = int(
+        os.environ.get("OFFER_CLIENT_MAX_KEEPALIVE", 20)
+    )
+    offer_client_keepalive_expiry: float = float(
+        os.environ.get("OFFER_CLIENT_KEEPALIVE_EXPIRY", 30)
+    )
+    offer_client_timeout: float = float(os.environ.get("OFFER_CLIENT_TIMEOUT", 10))
+    offer_client_pool_timeout: float = float(
+        os.environ.get("OFFER_CLIENT_POOL_TIMEOUT", 5)
+    )
+    offer_client_http2: bool = os.environ.get("OFFER_CLIENT_HTTP2") == "True"
+    # Calls per second to the offer service, 0 disables the limit
+    offer_client_rate: float = float(os.environ.get("OFFER_CLIENT_RATE", 50))
+    offer_client_burst: int = int(os.environ.get("OFFER_CLIENT_BURST", 10))
+    offer_client_retries: int = int(os.environ.get("OFFER_CLIENT_RETRIES", 2))
+    offer_client_backoff_base: float = float(
+        os.environ.get("OFFER_CLIENT_BACKOFF_BASE", 0.2)
+    )
+    offer_client_backoff_max: float = float(
+        os.environ.get("OFFER_CLIENT_BACKOFF_MAX", 5)
+    )
+    offer_circuit_failures: int = int(os.environ.get("OFFER_CIRCUIT_FAILURES", 5))
+    offer_circuit_reset: float = float(os.environ.get("OFFER_CIRCUIT_RESET", 30))
+    offer_token_ttl: float = float(os.environ.get("OFFER_TOKEN_TTL", 300))
+    offer_token_refresh_margin: float = float(
+        os.environ.get("OFFER_TOKEN_REFRESH_MARGIN", 30)
+    )
     postgres_user: str = os.environ.get("POSTGRES_USER")
     postgres_password: str = os.environ.get("POSTGRES_PASSWORD")
     postgres_server: str = os.environ.get("POSTGRES_SERVER")
@@ -35,9 +65,57 @@ class Config(BaseConfig):
     db_echo_log: bool = True if os.environ.get("DEBUG") == "True" else False
     access_token: UUID = os.environ.get("ACCESS_TOKEN")
     offer_job_period: int = int(os.environ.get("REFRESH_OFFER_JOB"))
+    offer_job_concurrency: int = int(os.environ.get("OFFER_JOB_CONCURRENCY", 10))
+    offer_job_retries: int = int(os.environ.get("OFFER_JOB_RETRIES", 3))
+    offer_job_retry_delay: float = float(os.environ.get("OFFER_JOB_RETRY_DELAY", 1))
+    # "leader", "sharded" or "none", see app.jobs.coordination
+    offer_job_coordination: str = os.environ.get("OFFER_JOB_COORDINATION", "leader")
+    offer_job_max_replicas: int = int(os.environ.get("OFFER_JOB_MAX_REPLICAS", 64))
+    # "sweep" polls the whole catalog every offer_job_period, "adaptive"
+    # schedules every product on its own interval, see app.jobs.scheduler
+    offer_job_schedule: str = os.environ.get("OFFER_JOB_SCHEDULE", "sweep")
+    offer_schedule_min_interval: float = float(
+        os.environ.get("OFFER_SCHEDULE_MIN_INTERVAL", 60)
+    )
+    offer_schedule_max_interval: float = float(
+        os.environ.get("OFFER_SCHEDULE_MAX_INTERVAL", 3600)
+    )
+    # Products fetched per second at most by all replicas of the adaptive
+    # schedule, 0 disables the limit
+    offer_schedule_budget: float = float(os.environ.get("OFFER_SCHEDULE_BUDGET", 10))
+    offer_schedule_sync_period: float = float(
+        os.environ.get("OFFER_SCHEDULE_SYNC_PERIOD", 60)
+    )
+    offer_ingest_batch_size: int = int(os.environ.get("OFFER_INGEST_BATCH_SIZE", 1000))
+    offer_ingest_flush_interval: float = float(
+        os.environ.get("OFFER_INGEST_FLUSH_INTERVAL", 1)
+    )
+    # "full" keeps every snapshot, "changes" only rows where price or stock changed
+    offer_history_mode: str = os.environ.get("OFFER_HISTORY_MODE", "full")
+    offer_partition_months: int = int(os.environ.get("OFFER_PARTITION_MONTHS", 1))
+    offer_partition_premake: int = int(os.environ.get("OFFER_PARTITION_PREMAKE", 3))
+    offer_partition_check_period: int = int(
+        os.environ.get("OFFER_PARTITION_CHECK_PERIOD", 3600)
+    )
+    # 0 keeps history forever, older partitions are dropped or downsampled
+    offer_retention_months: int = int(os.environ.get("OFFER_RETENTION_MONTHS", 0))
+    offer_retention_mode: str = os.environ.get("OFFER_RETENTION_MODE", "drop")
+    bulk_create_concurrency: int = int(os.environ.get("BULK_CREATE_CONCURRENCY", 10))
+    bulk_create_max_items: int = int(os.environ.get("BULK_CREATE_MAX_ITEMS", 20000))
+    products_page_size: int = int(os.environ.get("PRODUCTS_PAGE_SIZE", 100))
+    products_page_size_max: int = int(os.environ.get("PRODUCTS_PAGE_SIZE_MAX", 1000))
+    # orjson responses, and response models built from rows skip validation
+    fast_responses: bool = os.environ.get("FAST_RESPONSES", "True") == "True"
+    product_cache_size: int = int(os.environ.get("PRODUCT_CACHE_SIZE", 1024))
+    product_cache_ttl: float = float(os.environ.get("PRODUCT_CACHE_TTL", 60))
+    metrics_enabled: bool = os.environ.get("METRICS_ENABLED", "True") == "True"
+    # Per request statement counts, Server-Timing header and N+1 warnings
+    sql_instrumentation: bool = os.environ.get("SQL_INSTRUMENTATION") == "True"
+    sql_repeat_threshold: int = int(os.environ.get("SQL_REPEAT_THRESHOLD", 10))
     jwt_secret: str = os.environ.get("JWT_SECRET")
     jwt_algorithm: str = os.environ.get("JWT_ALGORITHM")
     jwt_expire: int = int(os.environ.get("JWT_EXPIRE"))
+    jwt_cache_size: int = int(os.environ.get("JWT_CACHE_SIZE", 10000))
 
     @property
     def sync_database_url(self) -> str:
@@ -0,0 +1,182 @@
+# Load generator driving a running app.
+#
+#   python -m loadtest.load --base-url http://localhost:8000 --duration 60 \
+#       --concurrency 50 --mix products=5,product=3,history=1,trend=1,create=0.2
+#
+# Seeds --seed-products products through the API, then lets --concurrency
+# workers pick endpoints by the weighted mix until --duration runs out.
+# Reports throughput and p50/p95/p99 latency per endpoint, and the duration
+# of the last offer refresh sweep from /stats/refresh.
+
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+ENDPOINTS = ("products", "product", "history", "trend", "candles", "create")
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint <{name}>")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(timings: List[float], fraction: float) -> float:
+    if not timings:
+        return 0.0
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+class LoadRun:
+    def __init__(self, client: httpx.AsyncClient, prefix: str):
+        self.client = client
+        self.prefix = prefix
+        self.product_ids: List[str] = []
+        self.offer_ids: List[str] = []
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def _call(self, name: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, self.prefix + url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.timings[name].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+    async def create(self):
+        response = await self._call(
+            "create",
+            "POST",
+            "/product",
+            json={"name": "load-product", "description": "load test"},
+        )
+        if response is not None and response.status_code == 201:
+            self.product_ids.append(response.json()["id"])
+
+    async def products(self):
+        await self._call("products", "GET", "/products")
+
+    async def product(self):
+        if not self.product_ids:
+            return await self.create()
+        response = await self._call(
+            "product", "GET", f"/product/{random.choice(self.product_ids)}"
+        )
+        if response is not None and response.status_code == 200:
+            for offer in response.json().get("offers", []):
+                if offer["offer_id"] not in self.offer_ids:
+                    self.offer_ids.append(offer["offer_id"])
+
+    async def history(self):
+        if not self.offer_ids:
+            return await self.product()
+        await self._call(
+            "history", "GET", f"/offer/{random.choice(self.offer_ids)}/history/10/0"
+        )
+
+    async def trend(self):
+        if not self.offer_ids:
+            return await self.product()
+        await self._call(
+            "trend",
+            "GET",
+            f"/offer/{random.choice(self.offer_ids)}/trend",
+            params={
+                "start_time": "2000-01-01T00:00:00",
+                "end_time": "2100-01-01T00:00:00",
+            },
+        )
+
+    async def candles(self):
+        if not self.offer_ids:
+            return await self.product()
+        await self._call(
+            "candles", "GET", f"/offer/{random.choice(self.offer_ids)}/candles"
+        )
+
+    async def worker(self, mix: Dict[str, float], deadline: float):
+        names, weights = list(mix), list(mix.values())
+        while time.monotonic() < deadline:
+            name = random.choices(names, weights)[0]
+            await getattr(self, name)()
+
+    def report(self, elapsed: float):
+        total = sum(len(timings) for timings in self.timings.values())
+        print(
+            f"{'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for name in sorted(self.timings):
+            timings = sorted(self.timings[name])
+            print(
+                f"{name:<10} {len(timings):>9} {self.errors[name]:>7} "
+                f"{len(timings) / elapsed:>8.1f} "
+                f"{percentile(timings, 0.50) * 1000:>8.1f} "
+                f"{percentile(timings, 0.95) * 1000:>8.1f} "
+                f"{percentile(timings, 0.99) * 1000:>8.1f}"
+            )
+        print(f"total {total} requests in {elapsed:.1f}s, {total / elapsed:.1f} req/s")
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+        token = await client.post(
+            args.prefix + "/token", json={"email": "load@test.com"}
+        )
+        client.headers["Authorization"] = f"Bearer {token.json()['access_token']}"
+
+        load = LoadRun(client, args.prefix)
+        await asyncio.gather(*(load.create() for _ in range(args.seed_products)))
+        load.timings.clear()
+        load.errors.clear()
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(
+            *(load.worker(args.mix, deadline) for _ in range(args.concurrency))
+        )
+        load.report(time.monotonic() - started)
+
+        sweep = (await client.get("/stats/refresh")).json()
+        if sweep:
+            print(
+                f"last refresh sweep: {sweep['duration']:.2f}s, "
+                f"{sweep['products']} products, {sweep['throughput']:.1f} products/s, "
+                f"{sweep['failed']} failed"
+            )
+        else:
+            print("no refresh sweep finished yet")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the app with a request mix.")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--prefix", default="/api")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seed-products", type=int, default=20)
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix("products=5,product=3,history=1,trend=1,candles=1"),
+        help="weighted endpoints: " + ",".join(ENDPOINTS),
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
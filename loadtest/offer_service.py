@@ -0,0 +1,133 @@
+# Local stand-in for the external offer service.
+#
+#   python -m loadtest.offer_service --port 9000 --latency-ms 50 --error-rate 0.01
+#
+# then point the app at it with OFFER_MS_URL=http://localhost:9000/ and any
+# OFFER_REFRESH_TOKEN. Implements auth, products/register and
+# products/{id}/offers with configurable latency, error rate, access token
+# lifetime (expired tokens get 401) and offers per product.
+
+import argparse
+import asyncio
+import random
+import time
+from uuid import UUID, uuid4, uuid5
+
+import uvicorn
+from fastapi import FastAPI, Header, Request, status
+from fastapi.responses import JSONResponse
+
+
+class StubConfig:
+    latency_ms: float = 20
+    latency_jitter_ms: float = 10
+    error_rate: float = 0.0
+    token_ttl: float = 300
+    offers_per_product: int = 3
+
+
+config = StubConfig()
+tokens = {}
+app = FastAPI(title="offer-service-stub")
+
+
+async def _delay():
+    latency = config.latency_ms + random.uniform(
+        -config.latency_jitter_ms, config.latency_jitter_ms
+    )
+    if latency > 0:
+        await asyncio.sleep(latency / 1000)
+
+
+def _failure():
+    if random.random() < config.error_rate:
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": "Injected failure."},
+        )
+    return None
+
+
+def _authorized(token):
+    expires_at = tokens.get(token)
+    return expires_at is not None and expires_at >= time.monotonic()
+
+
+@app.post("/auth")
+async def auth(bearer: str = Header(default=None)):
+    await _delay()
+    if not bearer:
+        return JSONResponse(
+            status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "No token."}
+        )
+    access_token = str(uuid4())
+    tokens[access_token] = time.monotonic() + config.token_ttl
+    return JSONResponse(
+        status_code=status.HTTP_201_CREATED, content={"access_token": access_token}
+    )
+
+
+@app.post("/products/register")
+async def register(request: Request, bearer: str = Header(default=None)):
+    await _delay()
+    if not _authorized(bearer):
+        return JSONResponse(
+            status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Expired."}
+        )
+    failure = _failure()
+    if failure:
+        return failure
+    product = await request.json()
+    return JSONResponse(
+        status_code=status.HTTP_201_CREATED, content={"id": product["id"]}
+    )
+
+
+@app.get("/products/{product_id}/offers")
+async def offers(product_id: UUID, bearer: str = Header(default=None)):
+    await _delay()
+    if not _authorized(bearer):
+        return JSONResponse(
+            status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Expired."}
+        )
+    failure = _failure()
+    if failure:
+        return failure
+    # Stable offer ids per product, prices and stock drift between calls
+    return [
+        {
+            "id": str(uuid5(product_id, str(index))),
+            "price": 1000 + index * 100 + random.randint(-5, 5),
+            "items_in_stock": random.randint(0, 50),
+        }
+        for index in range(config.offers_per_product)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in offer service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument(
+        "--latency-jitter-ms", type=float, default=config.latency_jitter_ms
+    )
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    parser.add_argument(
+        "--token-ttl", type=float, default=config.token_ttl, help="seconds"
+    )
+    parser.add_argument(
+        "--offers-per-product", type=int, default=config.offers_per_product
+    )
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.latency_jitter_ms = args.latency_jitter_ms
+    config.error_rate = args.error_rate
+    config.token_ttl = args.token_ttl
+    config.offers_per_product = args.offers_per_product
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
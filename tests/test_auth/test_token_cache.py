@@ -0,0 +1,38 @@
+import time
+
+from app.auth.jwt_handler import decodeJWT, signJWT
+from app.auth.token_cache import VerifiedTokenCache, verified_tokens
+
+
+def test_cache_returns_payload_until_expire():
+    cache = VerifiedTokenCache(maxsize=2)
+    cache.set("token", {"email": "test@test.com", "expire": time.time() + 60})
+
+    assert cache.get("token")["email"] == "test@test.com"
+
+
+def test_cache_drops_expired_payload():
+    cache = VerifiedTokenCache(maxsize=2)
+    cache.set("token", {"email": "test@test.com", "expire": time.time() - 1})
+
+    assert cache.get("token") is None
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = VerifiedTokenCache(maxsize=2)
+    expire = time.time() + 60
+    cache.set("a", {"expire": expire})
+    cache.set("b", {"expire": expire})
+    cache.get("a")
+    cache.set("c", {"expire": expire})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+
+def test_decode_caches_verified_token():
+    token = signJWT(email="test@test.com").get("access_token")
+
+    assert decodeJWT(token)["email"] == "test@test.com"
+    assert verified_tokens.get(token)["email"] == "test@test.com"
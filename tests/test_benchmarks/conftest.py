@@ -0,0 +1,158 @@
+# Microbenchmarks for the data access and serialization layer.
+#
+# Skipped unless RUN_BENCHMARKS=1. Catalog size is set with BENCH_PRODUCTS,
+# BENCH_OFFERS (per product) and BENCH_SNAPSHOTS (per offer). Results are
+# written as JSON to BENCH_OUTPUT. When BENCH_BASELINE points at an earlier
+# results file, operations that got slower than BENCH_TOLERANCE are reported
+# in the terminal summary and fail the run.
+# Query budgets are asserted with the query_budget fixture.
+
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert
+
+from app.db.offer_ingest import insert_offer_rows
+from app.metrics import query_stats
+from app.db.tables.products import Product
+
+BENCH_PRODUCTS = int(os.environ.get("BENCH_PRODUCTS", 100))
+BENCH_OFFERS = int(os.environ.get("BENCH_OFFERS", 3))
+BENCH_SNAPSHOTS = int(os.environ.get("BENCH_SNAPSHOTS", 50))
+BENCH_REPEAT = int(os.environ.get("BENCH_REPEAT", 20))
+BENCH_OUTPUT = os.environ.get("BENCH_OUTPUT", "bench_results.json")
+BENCH_BASELINE = os.environ.get("BENCH_BASELINE")
+BENCH_TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", 0.2))
+
+results = {}
+regressions = []
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("RUN_BENCHMARKS") == "1":
+        return
+    skip = pytest.mark.skip(reason="set RUN_BENCHMARKS=1 to run benchmarks")
+    for item in items:
+        if "test_benchmarks" in str(item.fspath):
+            item.add_marker(skip)
+
+
+class Bench:
+    async def measure(self, name: str, operation, repeat: int = BENCH_REPEAT):
+        """Await ``operation()`` ``repeat`` times and record the timings."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await operation()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        results[name] = {
+            "repeat": repeat,
+            "min": timings[0],
+            "median": statistics.median(timings),
+            "mean": statistics.fmean(timings),
+            "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        }
+        return results[name]
+
+
+@pytest.fixture()
+def bench():
+    return Bench()
+
+
+@pytest.fixture()
+def query_budget(db_session):
+    """``with query_budget(statements=2, repeats=1):`` fails the test when the
+    block runs more statements, or one statement shape too often."""
+    query_stats.instrument_queries(db_session.bind)
+    return query_stats.query_budget
+
+
+@pytest.fixture(scope="session", autouse=True)
+def bench_report():
+    yield
+    if not results:
+        return
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "catalog": {
+            "products": BENCH_PRODUCTS,
+            "offers_per_product": BENCH_OFFERS,
+            "snapshots_per_offer": BENCH_SNAPSHOTS,
+        },
+        "results": results,
+    }
+    with open(BENCH_OUTPUT, "w") as output:
+        json.dump(report, output, indent=2)
+
+    if BENCH_BASELINE and os.path.exists(BENCH_BASELINE):
+        with open(BENCH_BASELINE) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        for name, timing in results.items():
+            before = baseline.get(name)
+            if before and timing["median"] > before["median"] * (1 + BENCH_TOLERANCE):
+                regressions.append(
+                    f"{name}: median {before['median'] * 1000:.2f}ms "
+                    f"-> {timing['median'] * 1000:.2f}ms"
+                )
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if regressions and exitstatus == pytest.ExitCode.OK:
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    if not results:
+        return
+    terminalreporter.section("benchmarks")
+    terminalreporter.write_line(f"Results written to {BENCH_OUTPUT}")
+    for regression in regressions:
+        terminalreporter.write_line(f"REGRESSION {regression}", red=True)
+
+
+@pytest_asyncio.fixture()
+async def seeded_catalog(db_session):
+    """Seed products x offers x snapshots and return (product ids, offer ids)."""
+    product_ids = [uuid4() for _ in range(BENCH_PRODUCTS)]
+    await db_session.execute(
+        insert(Product).values(
+            [
+                {
+                    "id": product_id,
+                    "name": f"bench-{index}",
+                    "description": "bench",
+                    "is_deleted": False,
+                }
+                for index, product_id in enumerate(product_ids)
+            ]
+        )
+    )
+
+    offer_ids = []
+    start = datetime.utcnow() - timedelta(minutes=5 * BENCH_SNAPSHOTS)
+    for product_id in product_ids:
+        rows = []
+        for _ in range(BENCH_OFFERS):
+            offer_id = uuid4()
+            offer_ids.append(offer_id)
+            for snapshot in range(BENCH_SNAPSHOTS):
+                rows.append(
+                    {
+                        "product_id": product_id,
+                        "offer_id": offer_id,
+                        "price": 1000 + snapshot % 17,
+                        "items_in_stock": snapshot % 5,
+                        "created_at": start + timedelta(minutes=5 * snapshot),
+                    }
+                )
+        await insert_offer_rows(db_session, rows)
+    await db_session.flush()
+    return product_ids, offer_ids
@@ -0,0 +1,94 @@
+import pytest
+
+from app.auth.jwt_handler import decodeJWT, signJWT
+from app.auth.token_cache import verified_tokens
+from app.db.product_database import ProductDatabase
+from app.internal_models.encoding import dumps
+
+
+@pytest.mark.asyncio
+async def test_bench_get(bench, db_session, seeded_catalog):
+    product_ids, _ = seeded_catalog
+    database = ProductDatabase(db_session)
+
+    await bench.measure("product_get", lambda: database.get(product_ids[0]))
+
+
+@pytest.mark.asyncio
+async def test_bench_get_all(bench, db_session, seeded_catalog):
+    product_ids, _ = seeded_catalog
+    database = ProductDatabase(db_session)
+
+    await bench.measure(
+        "product_get_all", lambda: database.get_all(limit=len(product_ids))
+    )
+
+
+@pytest.mark.asyncio
+async def test_product_query_budgets(db_session, seeded_catalog, query_budget):
+    product_ids, _ = seeded_catalog
+    database = ProductDatabase(db_session)
+
+    # Product plus its current offers, independent of the page size
+    with query_budget(statements=2, repeats=1):
+        await database.get(product_ids[0])
+    with query_budget(statements=2, repeats=1):
+        await database.get_all(limit=len(product_ids))
+
+
+@pytest.mark.asyncio
+async def test_bench_offer_history(bench, db_session, seeded_catalog):
+    _, offer_ids = seeded_catalog
+    database = ProductDatabase(db_session)
+
+    await bench.measure(
+        "offer_history_first_page",
+        lambda: database._get_offer_history(offer_id=offer_ids[0], limit=10),
+    )
+    await bench.measure(
+        "offer_history_full",
+        lambda: database._get_offer_history(
+            offer_id=offer_ids[0], calc_percentage_change=True
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_bench_offer_trend(bench, db_session, seeded_catalog):
+    _, offer_ids = seeded_catalog
+    database = ProductDatabase(db_session)
+
+    await bench.measure(
+        "offer_trend", lambda: database._get_offer_trend(offer_id=offer_ids[0])
+    )
+
+
+@pytest.mark.asyncio
+async def test_bench_jwt_decode(bench):
+    token = signJWT(email="bench@test.com").get("access_token")
+
+    async def decode_uncached():
+        verified_tokens._entries.clear()
+        decodeJWT(token)
+
+    async def decode_cached():
+        decodeJWT(token)
+
+    await bench.measure("jwt_decode_uncached", decode_uncached, repeat=1000)
+    await bench.measure("jwt_decode_cached", decode_cached, repeat=1000)
+
+
+@pytest.mark.asyncio
+async def test_bench_serialization(bench, db_session, seeded_catalog):
+    product_ids, _ = seeded_catalog
+    database = ProductDatabase(db_session)
+    catalog = await database.get_all(limit=len(product_ids))
+
+    async def serialize():
+        dumps(catalog)
+
+    async def serialize_pydantic():
+        catalog.json()
+
+    await bench.measure("serialize_catalog_fast", serialize)
+    await bench.measure("serialize_catalog_pydantic", serialize_pydantic)
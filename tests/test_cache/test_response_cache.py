@@ -0,0 +1,61 @@
+from app.cache.response_cache import ResponseCache
+
+
+def test_cache_hit_and_miss():
+    cache = ResponseCache(maxsize=2, ttl=60)
+
+    assert cache.get(("product", 1), "v1") is None
+    cache.set(("product", 1), b"{}", cache.generation, "v1")
+
+    assert cache.get(("product", 1), "v1") == b"{}"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ResponseCache(maxsize=2, ttl=60)
+    cache.set("a", b"a", cache.generation, "v1")
+    cache.set("b", b"b", cache.generation, "v1")
+    cache.get("a", "v1")
+    cache.set("c", b"c", cache.generation, "v1")
+
+    assert cache.get("b", "v1") is None
+    assert cache.get("a", "v1") == b"a"
+    assert cache.get("c", "v1") == b"c"
+
+
+def test_cache_expires_entries():
+    cache = ResponseCache(maxsize=2, ttl=-1)
+    cache.set("a", b"a", cache.generation, "v1")
+
+    assert cache.get("a", "v1") is None
+
+
+def test_cache_skips_bodies_computed_before_invalidation():
+    cache = ResponseCache(maxsize=2, ttl=60)
+    generation = cache.generation
+    cache.invalidate(lambda key: True)
+    cache.set("a", b"a", generation, "v1")
+
+    assert cache.get("a", "v1") is None
+
+
+def test_cache_misses_on_another_data_version():
+    cache = ResponseCache(maxsize=2, ttl=60)
+    cache.set("a", b"a", cache.generation, "v1")
+
+    assert cache.get("a", "v2") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_replace_keeps_expiry_and_skips_missing_entries():
+    cache = ResponseCache(maxsize=2, ttl=60)
+    cache.set("a", b"a", cache.generation, "v1")
+    expires = cache._entries["a"][0]
+
+    cache.replace("a", b"a2", cache.generation, "v2")
+    cache.replace("b", b"b", cache.generation, "v1")
+
+    assert cache._entries["a"][0] == expires
+    assert cache.get("a", "v2") == b"a2"
+    assert cache.keys() == ["a"]
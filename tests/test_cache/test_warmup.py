@@ -0,0 +1,44 @@
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.cache import warmup
+from app.cache.response_cache import ResponseCache
+from app.db.err import EntityDoesNotExist
+
+
+class FakeDatabase:
+    versions = {"fresh": "v2", "same": "v1"}
+
+    def __init__(self, session):
+        self.session = session
+
+    async def product_version(self, product_id):
+        return self.versions.get(product_id)
+
+    async def get(self, product_id):
+        if product_id not in self.versions:
+            raise EntityDoesNotExist
+        return {"id": product_id}
+
+
+@asynccontextmanager
+async def fake_session():
+    yield None
+
+
+@pytest.mark.asyncio
+async def test_rewarm_rebuilds_changed_entries_only(monkeypatch):
+    cache = ResponseCache(maxsize=8, ttl=60)
+    for product_id in ("fresh", "same", "gone"):
+        cache.set(("product", product_id), b"old", cache.generation, "v1")
+    monkeypatch.setattr(warmup, "product_cache", cache)
+    monkeypatch.setattr(warmup, "ProductDatabase", FakeDatabase)
+    monkeypatch.setattr(warmup, "async_session", fake_session)
+    monkeypatch.setattr(warmup, "dumps", lambda response: repr(response).encode())
+
+    await warmup.rewarm(cache.keys())
+
+    assert cache.get(("product", "fresh"), "v2") == b"{'id': 'fresh'}"
+    assert cache.get(("product", "same"), "v1") == b"old"
+    assert ("product", "gone") not in cache.keys()
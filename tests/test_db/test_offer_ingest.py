@@ -0,0 +1,212 @@
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import insert, select
+
+from app.db import offer_ingest
+from app.db.offer_ingest import OfferIngestor, insert_offer_rows
+from app.db.product_database import ProductDatabase
+from app.db.tables.offers import Offer
+from app.db.tables.products import Product
+from app.settings.conf import settings
+
+
+def snapshot(product_id, offer_id, created_at, price, stock=1):
+    return {
+        "product_id": product_id,
+        "offer_id": offer_id,
+        "created_at": created_at,
+        "price": price,
+        "items_in_stock": stock,
+    }
+
+
+async def add_product(db_session):
+    product_id = uuid4()
+    await db_session.execute(
+        insert(Product).values(
+            id=product_id, name="p", description="d", is_deleted=False
+        )
+    )
+    return product_id
+
+
+async def history(db_session, offer_id):
+    result = await db_session.execute(
+        select(Offer).filter(Offer.offer_id == offer_id).order_by(Offer.created_at)
+    )
+    return result.scalars().all()
+
+
+@pytest.mark.asyncio
+async def test_changes_mode_collapses_identical_snapshots(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "offer_history_mode", "changes")
+    product_id, offer_id = await add_product(db_session), uuid4()
+
+    await insert_offer_rows(
+        db_session,
+        [
+            snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 0), 100),
+            snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 10), 100),
+        ],
+    )
+    await insert_offer_rows(
+        db_session,
+        [
+            snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 20), 100),
+            snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 30), 90),
+        ],
+    )
+
+    rows = await history(db_session, offer_id)
+    assert [(row.price, row.samples) for row in rows] == [(100, 3), (90, 1)]
+    assert rows[0].created_at == datetime(2024, 3, 5, 14, 0)
+    assert rows[0].last_confirmed_at == datetime(2024, 3, 5, 14, 20)
+
+
+@pytest.mark.asyncio
+async def test_changes_mode_starts_a_new_run_in_a_new_partition(
+    db_session, monkeypatch
+):
+    monkeypatch.setattr(settings, "offer_history_mode", "changes")
+    monkeypatch.setattr(settings, "offer_partition_months", 1)
+    product_id, offer_id = await add_product(db_session), uuid4()
+
+    await insert_offer_rows(
+        db_session,
+        [
+            snapshot(product_id, offer_id, datetime(2024, 3, 31, 23, 50), 100),
+            snapshot(product_id, offer_id, datetime(2024, 4, 1, 0, 10), 100),
+        ],
+    )
+
+    rows = await history(db_session, offer_id)
+    assert [row.samples for row in rows] == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_full_mode_keeps_every_snapshot(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "offer_history_mode", "full")
+    product_id, offer_id = await add_product(db_session), uuid4()
+
+    await insert_offer_rows(
+        db_session,
+        [
+            snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 0), 100),
+            snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 10), 100),
+        ],
+    )
+
+    rows = await history(db_session, offer_id)
+    assert [row.samples for row in rows] == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_trend_weights_runs_by_samples(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "offer_history_mode", "changes")
+    product_id, offer_id = await add_product(db_session), uuid4()
+
+    # 100 three times, then 40 once: the mean is 85, not the row mean of 70
+    await insert_offer_rows(
+        db_session,
+        [
+            snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, minute), price)
+            for minute, price in ((0, 100), (10, 100), (20, 100), (30, 40))
+        ],
+    )
+
+    trend = await ProductDatabase(db_session)._get_offer_trend(offer_id)
+
+    assert trend.samples == 4
+    assert (trend.first_price, trend.last_price) == (100, 40)
+    assert (trend.min_price, trend.max_price) == (40, 100)
+    assert trend.mean_price == pytest.approx(85)
+    assert trend.stddev_price == pytest.approx(30)
+
+
+class FakeEngine:
+    """Hands out a placeholder connection, the rows go to fake_insert."""
+
+    def begin(self):
+        return self
+
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+@pytest.fixture()
+def written_batches(monkeypatch):
+    """Batches passed to insert_offer_rows, a row with price -1 fails its batch."""
+    batches = []
+
+    async def fake_insert(conn, rows):
+        if any(row["price"] == -1 for row in rows):
+            raise ValueError("bad row")
+        batches.append(rows)
+
+    monkeypatch.setattr(offer_ingest, "async_engine", FakeEngine())
+    monkeypatch.setattr(offer_ingest, "insert_offer_rows", fake_insert)
+    return batches
+
+
+def offer_rows(product_id, count=1, price=100):
+    return [
+        {
+            "product_id": product_id,
+            "offer_id": uuid4(),
+            "price": price,
+            "items_in_stock": 1,
+        }
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_ingestor_flushes_full_batches_and_the_rest_on_exit(written_batches):
+    async with OfferIngestor(batch_size=3, flush_interval=0) as ingestor:
+        await ingestor.add(offer_rows(uuid4(), 2))
+        assert written_batches == []
+
+        await ingestor.add(offer_rows(uuid4(), 2))
+        assert [len(batch) for batch in written_batches] == [3]
+
+    assert [len(batch) for batch in written_batches] == [3, 1]
+    assert ingestor.written == 4
+
+
+@pytest.mark.asyncio
+async def test_ingestor_flushes_on_interval(written_batches):
+    async with OfferIngestor(batch_size=100, flush_interval=0.01) as ingestor:
+        await ingestor.add(offer_rows(uuid4(), 2))
+        await asyncio.sleep(0.05)
+
+        assert [len(batch) for batch in written_batches] == [2]
+
+
+@pytest.mark.asyncio
+async def test_ingestor_isolates_the_failing_product(written_batches):
+    bad = uuid4()
+    good = [uuid4() for _ in range(5)]
+    written, failed = [], []
+
+    async with OfferIngestor(
+        batch_size=100,
+        flush_interval=0,
+        on_written=written.extend,
+        on_error=lambda rows, exc: failed.extend(rows),
+    ) as ingestor:
+        for product_id in good[:2]:
+            await ingestor.add(offer_rows(product_id, 2))
+        await ingestor.add(offer_rows(bad, 2, price=-1))
+        for product_id in good[2:]:
+            await ingestor.add(offer_rows(product_id, 2))
+
+    assert {row["product_id"] for row in failed} == {bad}
+    assert len(failed) == 2
+    assert {row["product_id"] for row in written} == set(good)
+    assert ingestor.written == 10
@@ -0,0 +1,93 @@
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import insert, select
+
+from app.db.offer_rollups import _aggregate, bucket_start, upsert_offer_rollups
+from app.db.tables.offer_rollups import OfferRollup
+from app.db.tables.products import Product
+
+
+def snapshot(product_id, offer_id, created_at, price, stock=1):
+    return {
+        "product_id": product_id,
+        "offer_id": offer_id,
+        "created_at": created_at,
+        "price": price,
+        "items_in_stock": stock,
+    }
+
+
+def test_bucket_start_floors_to_bucket():
+    created_at = datetime(2024, 3, 5, 14, 37, 12)
+
+    assert bucket_start(created_at, "1h") == datetime(2024, 3, 5, 14)
+    assert bucket_start(created_at, "1d") == datetime(2024, 3, 5)
+
+
+def test_aggregate_orders_rows_before_folding():
+    product_id, offer_id = uuid4(), uuid4()
+    rows = [
+        snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 40), 120, stock=2),
+        snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 10), 100, stock=5),
+        snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 20), 90, stock=3),
+    ]
+
+    rollups = {rollup["bucket"]: rollup for rollup in _aggregate(rows)}
+
+    assert set(rollups) == {"1h", "1d"}
+    hour = rollups["1h"]
+    assert hour["bucket_start"] == datetime(2024, 3, 5, 14)
+    assert (hour["open_price"], hour["high_price"]) == (100, 120)
+    assert (hour["low_price"], hour["close_price"]) == (90, 120)
+    assert (hour["min_stock"], hour["max_stock"]) == (2, 5)
+    assert hour["samples"] == 3
+    assert hour["open_at"] == datetime(2024, 3, 5, 14, 10)
+    assert hour["close_at"] == datetime(2024, 3, 5, 14, 40)
+
+
+def test_aggregate_splits_buckets():
+    product_id, offer_id = uuid4(), uuid4()
+    rows = [
+        snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 59), 100),
+        snapshot(product_id, offer_id, datetime(2024, 3, 5, 15, 1), 110),
+    ]
+
+    hours = [rollup for rollup in _aggregate(rows) if rollup["bucket"] == "1h"]
+
+    assert len(hours) == 2
+
+
+@pytest.mark.asyncio
+async def test_late_rows_only_move_open_and_close_outwards(db_session):
+    product_id, offer_id = uuid4(), uuid4()
+    await db_session.execute(
+        insert(Product).values(
+            id=product_id, name="p", description="d", is_deleted=False
+        )
+    )
+    await upsert_offer_rollups(
+        db_session, [snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 30), 100)]
+    )
+    # A late row inside the bucket, one before the open and one after the close
+    await upsert_offer_rollups(
+        db_session,
+        [
+            snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 20), 80),
+            snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 50), 130),
+        ],
+    )
+    await upsert_offer_rollups(
+        db_session, [snapshot(product_id, offer_id, datetime(2024, 3, 5, 14, 40), 70)]
+    )
+
+    result = await db_session.execute(
+        select(OfferRollup).filter(
+            OfferRollup.offer_id == offer_id, OfferRollup.bucket == "1h"
+        )
+    )
+    rollup = result.scalars().one()
+    assert (rollup.open_price, rollup.close_price) == (80, 130)
+    assert (rollup.low_price, rollup.high_price) == (70, 130)
+    assert rollup.samples == 4
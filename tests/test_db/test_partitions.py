@@ -0,0 +1,110 @@
+from datetime import datetime
+
+import pytest
+
+from app.db.partitions import (DOWNSAMPLED, apply_retention, partition_name,
+                               partition_ranges, partition_start)
+from app.settings.conf import settings
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    """Lists the given partitions and records every other statement."""
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.statements = []
+
+    async def execute(self, statement):
+        sql = str(statement)
+        if "pg_inherits" in sql:
+            return FakeResult(self.partitions)
+        self.statements.append(" ".join(sql.split()))
+        return FakeResult([])
+
+
+def test_partition_start_floors_to_period(monkeypatch):
+    monkeypatch.setattr(settings, "offer_partition_months", 1)
+    assert partition_start(datetime(2024, 3, 31, 23, 59)) == datetime(2024, 3, 1)
+
+    monkeypatch.setattr(settings, "offer_partition_months", 3)
+    assert partition_start(datetime(2024, 3, 31)) == datetime(2024, 1, 1)
+    assert partition_start(datetime(2024, 4, 1)) == datetime(2024, 4, 1)
+    assert partition_start(datetime(2024, 12, 5)) == datetime(2024, 10, 1)
+
+
+def test_partition_ranges_cover_start_to_end(monkeypatch):
+    monkeypatch.setattr(settings, "offer_partition_months", 1)
+
+    ranges = list(partition_ranges(datetime(2024, 11, 15), datetime(2025, 1, 1)))
+
+    assert ranges == [
+        (datetime(2024, 11, 1), datetime(2024, 12, 1)),
+        (datetime(2024, 12, 1), datetime(2025, 1, 1)),
+        (datetime(2025, 1, 1), datetime(2025, 2, 1)),
+    ]
+    assert partition_name(ranges[0][0]) == "offers_p202411"
+
+
+def test_partition_ranges_with_multi_month_periods(monkeypatch):
+    monkeypatch.setattr(settings, "offer_partition_months", 6)
+
+    ranges = list(partition_ranges(datetime(2024, 8, 1), datetime(2025, 2, 1)))
+
+    assert ranges == [
+        (datetime(2024, 7, 1), datetime(2025, 1, 1)),
+        (datetime(2025, 1, 1), datetime(2025, 7, 1)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_retention_drops_partitions_past_the_cutoff(monkeypatch):
+    monkeypatch.setattr(settings, "offer_partition_months", 1)
+    monkeypatch.setattr(settings, "offer_retention_months", 2)
+    monkeypatch.setattr(settings, "offer_retention_mode", "drop")
+    conn = FakeConnection(
+        [
+            ("offers_p202401", None),
+            ("offers_p202402", None),
+            ("offers_p202403", None),
+            ("offers_default", None),
+        ]
+    )
+
+    changed = await apply_retention(conn, datetime(2024, 4, 10))
+
+    assert changed == 1
+    assert conn.statements == [
+        "ALTER TABLE offers DETACH PARTITION offers_p202401",
+        "DROP TABLE offers_p202401",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_retention_downsamples_each_partition_once(monkeypatch):
+    monkeypatch.setattr(settings, "offer_partition_months", 1)
+    monkeypatch.setattr(settings, "offer_retention_months", 1)
+    monkeypatch.setattr(settings, "offer_retention_mode", "downsample")
+    conn = FakeConnection([("offers_p202401", DOWNSAMPLED), ("offers_p202402", None)])
+
+    changed = await apply_retention(conn, datetime(2024, 4, 10))
+
+    assert changed == 1
+    assert conn.statements[0].startswith("DELETE FROM offers_p202402")
+    assert conn.statements[1] == f"COMMENT ON TABLE offers_p202402 IS '{DOWNSAMPLED}'"
+
+
+@pytest.mark.asyncio
+async def test_retention_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "offer_retention_months", 0)
+    conn = FakeConnection([("offers_p200001", None)])
+
+    assert await apply_retention(conn, datetime(2024, 3, 10)) == 0
+    assert conn.statements == []
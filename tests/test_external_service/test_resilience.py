@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.external_service import offer_handler
+from app.external_service.offer_handler import TokenManager
+from app.external_service.rate_limit import TokenBucket
+from app.external_service.resilience import (CLOSED, HALF_OPEN, OPEN,
+                                             CircuitBreaker, CircuitOpen,
+                                             backoff_delay)
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as exc_info:
+        breaker.before_call()
+    assert exc_info.value.status_code == 503
+    assert 0 < exc_info.value.retry_after <= 60
+
+
+def test_half_open_circuit_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == HALF_OPEN
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_opens_the_circuit_again():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.before_call()
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=0.1, cap=1) <= min(1, 0.1 * 2**attempt)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, burst=1)
+    started = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+
+    assert time.monotonic() - started >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_token_refreshes_collapse_into_one_call(monkeypatch):
+    calls = []
+
+    async def fake_call(endpoint, method, url, **kwargs):
+        calls.append(endpoint)
+        await asyncio.sleep(0.01)
+        return httpx.Response(201, json={"access_token": f"token-{len(calls)}"})
+
+    monkeypatch.setattr(offer_handler, "_call", fake_call)
+    tokens = TokenManager(ttl=300, refresh_margin=30)
+
+    results = await asyncio.gather(*(tokens.refresh() for _ in range(10)))
+
+    assert calls == ["auth"]
+    assert set(results) == {"token-1"}
+    # A request rejected with the old token does not refresh again
+    assert await tokens.refresh(stale="token-0") == "token-1"
+    assert calls == ["auth"]
+
+
+@pytest.mark.asyncio
+async def test_token_is_refreshed_in_background_before_expiry(monkeypatch):
+    async def fake_call(endpoint, method, url, **kwargs):
+        return httpx.Response(201, json={"access_token": "fresh", "expires_in": 300})
+
+    monkeypatch.setattr(offer_handler, "_call", fake_call)
+    tokens = TokenManager(ttl=300, refresh_margin=30)
+    tokens.token = "old"
+    tokens.expires_at = time.monotonic() + 10
+
+    assert await tokens.get() == "old"
+    await asyncio.sleep(0)
+
+    assert await tokens.get() == "fresh"
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_rate_can_be_changed():
+    bucket = TokenBucket(rate=1, burst=1)
+    await bucket.acquire()
+
+    bucket.set_rate(100)
+    started = time.monotonic()
+    await bucket.acquire()
+
+    assert time.monotonic() - started < 0.1
+
+
+@pytest.mark.asyncio
+async def test_token_expiring_while_circuit_open_does_not_block_the_probe(
+    monkeypatch,
+):
+    calls = []
+
+    async def fake_send(endpoint, method, url, **kwargs):
+        calls.append(endpoint)
+        if endpoint == "auth":
+            return httpx.Response(201, json={"access_token": "fresh"})
+        return httpx.Response(200, json=[])
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    tokens = TokenManager(ttl=300, refresh_margin=30)
+    tokens.token = "expired"
+    tokens.expires_at = time.monotonic()
+    monkeypatch.setattr(offer_handler, "_send", fake_send)
+    monkeypatch.setattr(offer_handler, "offer_circuit", breaker)
+    monkeypatch.setattr(offer_handler, "token_manager", tokens)
+    monkeypatch.setattr(offer_handler, "_limiter", TokenBucket(rate=0))
+    await asyncio.sleep(0.02)
+    assert breaker.state == HALF_OPEN
+
+    response = await offer_handler.get_product_offers(id="product")
+
+    assert response["status_code"] == 200
+    assert calls == ["auth", "offers"]
+    assert breaker.state == CLOSED
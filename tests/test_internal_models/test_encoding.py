@@ -0,0 +1,22 @@
+import pytest
+from pydantic import ValidationError
+
+from app.internal_models.encoding import build_model
+from app.internal_models.models import CursorPaging
+from app.settings.conf import settings
+
+
+def test_build_model_skips_validation_with_fast_responses(monkeypatch):
+    monkeypatch.setattr(settings, "fast_responses", True)
+
+    paging = build_model(CursorPaging, limit="not a number")
+
+    assert paging.limit == "not a number"
+
+
+def test_build_model_validates_without_fast_responses(monkeypatch):
+    monkeypatch.setattr(settings, "fast_responses", False)
+
+    assert build_model(CursorPaging, limit="10").limit == 10
+    with pytest.raises(ValidationError):
+        build_model(CursorPaging, limit="not a number")
@@ -0,0 +1,172 @@
+import pytest
+
+from app.jobs.coordination import (LEADER_LOCK_CLASS, OFFER_REFRESH_LEADER,
+                                   PARTITION_MAINTENANCE_LEADER,
+                                   SHARD_LOCK_CLASS, RefreshCoordinator, Shard)
+from app.settings.conf import settings
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def scalar(self):
+        return self.rows[0]
+
+    def scalars(self):
+        return iter(self.rows)
+
+
+class FakeDatabase:
+    """Session advisory locks shared by every connection, like pg_locks."""
+
+    def __init__(self):
+        self.locks = {}
+
+    def holders(self, class_id):
+        return sorted(
+            object_id
+            for (lock_class, object_id) in self.locks
+            if lock_class == class_id
+        )
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.broken = False
+
+    async def execution_options(self, **options):
+        return self
+
+    async def execute(self, statement, params=None):
+        if self.broken:
+            raise ConnectionError("connection lost")
+        sql = str(statement)
+        if "pg_try_advisory_lock" in sql:
+            key = (params["class_id"], params["object_id"])
+            holder = self.database.locks.setdefault(key, self)
+            return FakeResult([holder is self])
+        if "pg_locks" in sql:
+            return FakeResult(self.database.holders(params["class_id"]))
+        if "pg_advisory_unlock_all" in sql:
+            self._unlock_all()
+        return FakeResult([1])
+
+    def _unlock_all(self):
+        for key, holder in list(self.database.locks.items()):
+            if holder is self:
+                del self.database.locks[key]
+
+    def die(self):
+        # The backend is gone, Postgres releases its session locks
+        self.broken = True
+        self._unlock_all()
+
+    async def close(self):
+        self._unlock_all()
+
+    async def invalidate(self):
+        self._unlock_all()
+
+
+class FakeEngine:
+    def __init__(self, database):
+        self.database = database
+        self.connections = []
+
+    async def connect(self):
+        conn = FakeConnection(self.database)
+        self.connections.append(conn)
+        return conn
+
+
+@pytest.fixture()
+def database(monkeypatch):
+    monkeypatch.setattr(settings, "offer_job_max_replicas", 4)
+    return FakeDatabase()
+
+
+@pytest.mark.asyncio
+async def test_one_leader_until_it_releases(database):
+    first = RefreshCoordinator(FakeEngine(database), mode="leader")
+    second = RefreshCoordinator(FakeEngine(database), mode="leader")
+
+    assert await first.claim() == Shard()
+    assert await second.claim() is None
+    assert await first.claim() == Shard()
+
+    await first.release()
+
+    assert await second.claim() == Shard()
+    assert database.holders(LEADER_LOCK_CLASS) == [OFFER_REFRESH_LEADER]
+
+
+@pytest.mark.asyncio
+async def test_leader_ids_are_independent(database):
+    refresh = RefreshCoordinator(FakeEngine(database), mode="leader")
+    maintenance = RefreshCoordinator(
+        FakeEngine(database), mode="leader", leader_id=PARTITION_MAINTENANCE_LEADER
+    )
+
+    assert await refresh.claim() == Shard()
+    assert await maintenance.claim() == Shard()
+
+
+@pytest.mark.asyncio
+async def test_replicas_take_shards_from_live_slots(database):
+    replicas = [
+        RefreshCoordinator(FakeEngine(database), mode="sharded") for _ in range(3)
+    ]
+
+    for replica in replicas:
+        await replica.claim()
+    shards = [await replica.claim() for replica in replicas]
+
+    assert shards == [Shard(0, 3), Shard(1, 3), Shard(2, 3)]
+    assert database.holders(SHARD_LOCK_CLASS) == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_shards_rebalance_when_a_replica_dies(database):
+    engines = [FakeEngine(database) for _ in range(3)]
+    replicas = [RefreshCoordinator(engine, mode="sharded") for engine in engines]
+    for replica in replicas:
+        await replica.claim()
+
+    engines[1].connections[-1].die()
+
+    assert await replicas[0].claim() == Shard(0, 2)
+    assert await replicas[2].claim() == Shard(1, 2)
+
+    # The dead replica reconnects into the free slot
+    assert await replicas[1].claim() == Shard(1, 3)
+    assert await replicas[2].claim() == Shard(2, 3)
+
+
+@pytest.mark.asyncio
+async def test_replicas_past_the_slot_count_idle(database, monkeypatch):
+    monkeypatch.setattr(settings, "offer_job_max_replicas", 1)
+    first = RefreshCoordinator(FakeEngine(database), mode="sharded")
+    second = RefreshCoordinator(FakeEngine(database), mode="sharded")
+
+    assert await first.claim() == Shard(0, 1)
+    assert await second.claim() is None
+
+
+@pytest.mark.asyncio
+async def test_release_frees_the_slot(database):
+    async with RefreshCoordinator(FakeEngine(database), mode="sharded") as first:
+        await first.claim()
+        assert database.holders(SHARD_LOCK_CLASS) == [0]
+
+    assert database.holders(SHARD_LOCK_CLASS) == []
+    assert first.slot is None
+
+
+@pytest.mark.asyncio
+async def test_no_coordination_sweeps_everything(database):
+    engine = FakeEngine(database)
+
+    assert await RefreshCoordinator(engine, mode="none").claim() == Shard()
+    assert engine.connections == []
@@ -0,0 +1,116 @@
+from uuid import uuid4
+
+import httpx
+import pytest
+
+from app.external_service import offer_handler
+from app.external_service.offer_handler import TokenManager
+from app.external_service.rate_limit import TokenBucket
+from app.external_service.resilience import CircuitBreaker
+from app.jobs import offer_refresh
+from app.jobs.offer_refresh import refresh_offers
+from app.settings.conf import settings
+
+
+class FakeIngestor:
+    """Collects the rows of a sweep instead of writing them."""
+
+    instances = []
+
+    def __init__(self, on_error=None, on_written=None):
+        self.rows = []
+        self.written = 0
+        FakeIngestor.instances.append(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def add(self, rows):
+        self.rows.extend(rows)
+        self.written += len(rows)
+
+
+@pytest.fixture()
+def sweep(monkeypatch):
+    """Run a sweep over product_ids, answering offer calls from responses.
+
+    responses maps a product id to the status codes of its successive calls,
+    the last one repeats.
+    """
+    monkeypatch.setattr(settings, "offer_client_retries", 0)
+    monkeypatch.setattr(settings, "offer_job_retries", 1)
+    monkeypatch.setattr(settings, "offer_job_retry_delay", 0)
+    monkeypatch.setattr(settings, "offer_client_backoff_max", 0)
+    breaker = CircuitBreaker(failure_threshold=1000, reset_timeout=60)
+    monkeypatch.setattr(offer_handler, "offer_circuit", breaker)
+    monkeypatch.setattr(offer_handler, "_limiter", TokenBucket(rate=1000, burst=1000))
+    tokens = TokenManager(ttl=300, refresh_margin=30)
+    tokens.token = "token"
+    monkeypatch.setattr(offer_handler, "token_manager", tokens)
+    monkeypatch.setattr(offer_refresh, "OfferIngestor", FakeIngestor)
+    monkeypatch.setattr(offer_refresh, "schedule_rewarm", lambda keys: None)
+
+    async def _sweep(product_ids, responses):
+        calls = {product_id: 0 for product_id in product_ids}
+
+        async def fake_send(endpoint, method, url, **kwargs):
+            product_id = next(key for key in calls if str(key) in url)
+            codes = responses.get(product_id, [200])
+            code = codes[min(calls[product_id], len(codes) - 1)]
+            calls[product_id] += 1
+            offers = [{"id": str(uuid4()), "price": 100, "items_in_stock": 1}]
+            return httpx.Response(code, json=offers if code == 200 else {})
+
+        async def fake_batches(shard):
+            yield product_ids
+
+        monkeypatch.setattr(offer_handler, "_send", fake_send)
+        monkeypatch.setattr(offer_refresh, "product_id_batches", fake_batches)
+        FakeIngestor.instances.clear()
+        stats = await refresh_offers()
+        return stats, FakeIngestor.instances[0], calls
+
+    return _sweep
+
+
+@pytest.mark.asyncio
+async def test_failing_product_is_recorded_as_failed(sweep):
+    product_id = uuid4()
+
+    stats, ingestor, calls = await sweep([product_id], {product_id: [500]})
+
+    assert set(stats.failed) == {product_id}
+    assert stats.products == 0
+    assert stats.retries == 1
+    assert calls[product_id] == 2
+    assert ingestor.rows == []
+
+
+@pytest.mark.asyncio
+async def test_retry_that_succeeds_is_not_a_failure(sweep):
+    product_id = uuid4()
+
+    stats, ingestor, _ = await sweep([product_id], {product_id: [503, 200]})
+
+    assert stats.failed == {}
+    assert stats.retries == 1
+    assert stats.products == 1
+    assert [row["product_id"] for row in ingestor.rows] == [product_id]
+
+
+@pytest.mark.asyncio
+async def test_sweep_finishes_despite_failures(sweep):
+    failing = [uuid4() for _ in range(3)]
+    healthy = [uuid4() for _ in range(5)]
+
+    stats, ingestor, _ = await sweep(
+        failing + healthy, {product_id: [500] for product_id in failing}
+    )
+
+    assert set(stats.failed) == set(failing)
+    assert stats.products == len(healthy)
+    assert stats.finished_at is not None
+    assert {row["product_id"] for row in ingestor.rows} == set(healthy)
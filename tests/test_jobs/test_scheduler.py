@@ -0,0 +1,107 @@
+import asyncio
+import time
+from uuid import uuid4
+
+import pytest
+
+from app.external_service.rate_limit import TokenBucket
+from app.jobs.coordination import Shard
+from app.jobs.scheduler import RefreshScheduler
+from app.settings.conf import settings
+
+
+def offers(price: int):
+    return [{"id": "offer-1", "price": price, "items_in_stock": 1}]
+
+
+def test_due_products_are_popped_in_order():
+    scheduler = RefreshScheduler(min_interval=10, max_interval=100, initial_interval=20)
+    first, second = uuid4(), uuid4()
+    now = time.monotonic()
+    scheduler.add(second, due=now - 1)
+    scheduler.add(first, due=now - 2)
+
+    assert scheduler.pop_due(now) == first
+    assert scheduler.pop_due(now) == second
+    assert scheduler.pop_due(now) is None
+
+
+def test_interval_shrinks_on_change_and_grows_to_cap():
+    scheduler = RefreshScheduler(min_interval=10, max_interval=40, initial_interval=20)
+    product_id = uuid4()
+    scheduler.add(product_id, due=0)
+
+    # The first fetch only sets the baseline
+    for price, interval in [(100, 20), (100, 30), (100, 40), (100, 40), (90, 20)]:
+        scheduler.record(product_id, offers(price))
+        assert scheduler.products[product_id].interval == interval
+
+    for price in (80, 70, 60):
+        scheduler.record(product_id, offers(price))
+    assert scheduler.products[product_id].interval == 10
+
+
+def test_push_front_overtakes_due_products():
+    scheduler = RefreshScheduler(min_interval=10, max_interval=100, initial_interval=20)
+    due, pushed = uuid4(), uuid4()
+    now = time.monotonic()
+    scheduler.add(due, due=now - 5)
+    scheduler.add(pushed, due=now + 50)
+
+    scheduler.push_front(pushed)
+
+    assert scheduler.pop_due(now) == pushed
+    assert scheduler.pop_due(now) == due
+
+
+def test_push_front_while_in_flight_refreshes_again():
+    scheduler = RefreshScheduler(min_interval=10, max_interval=100, initial_interval=20)
+    product_id = uuid4()
+    now = time.monotonic()
+    scheduler.add(product_id, due=now - 1)
+    assert scheduler.pop_due(now) == product_id
+
+    scheduler.push_front(product_id)
+    assert scheduler.pop_due(now) is None
+    scheduler.record(product_id, offers(100))
+
+    assert scheduler.pop_due(time.monotonic()) == product_id
+
+
+@pytest.mark.asyncio
+async def test_request_before_wait_is_not_lost():
+    scheduler = RefreshScheduler(min_interval=10, max_interval=100, initial_interval=20)
+    scheduler._wakeup.clear()
+
+    # Arrives after the loop read _requested, before it started waiting
+    scheduler.request(uuid4())
+
+    await asyncio.wait_for(scheduler._wait(60), timeout=1)
+
+
+def test_sync_drops_products_of_other_shards():
+    scheduler = RefreshScheduler(min_interval=10, max_interval=100, initial_interval=20)
+    kept, dropped = uuid4(), uuid4()
+    scheduler.add(kept, due=0)
+    scheduler.add(dropped, due=0)
+
+    scheduler.sync({kept})
+
+    assert set(scheduler.products) == {kept}
+    assert scheduler.pop_due(time.monotonic()) == kept
+    assert scheduler.pop_due(time.monotonic()) is None
+
+
+def test_budget_is_split_across_shards_and_warns_when_short(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "offer_schedule_budget", 10)
+    scheduler = RefreshScheduler(min_interval=10, max_interval=100, initial_interval=20)
+    scheduler.sync({uuid4() for _ in range(300)})
+    budget = TokenBucket(rate=10)
+
+    scheduler._apply_budget(budget, Shard(index=0, count=2))
+    assert budget.rate == 5
+    assert "cannot refresh <300> products" not in caplog.text
+
+    scheduler._apply_budget(budget, Shard(index=0, count=4))
+    assert budget.rate == 2.5
+    assert "cannot refresh <300> products" in caplog.text
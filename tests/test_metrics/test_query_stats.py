@@ -0,0 +1,47 @@
+import pytest
+
+from app.metrics.query_stats import (QueryStats, query_budget, statement_shape,
+                                     track_queries)
+
+
+def test_statement_shape_ignores_values_and_in_list_length():
+    first = statement_shape("SELECT * FROM offers WHERE product_id IN ($1, $2)")
+    second = statement_shape("SELECT *\n FROM offers WHERE product_id IN ($1)")
+
+    assert first == second == "SELECT * FROM offers WHERE product_id IN (?)"
+
+
+def test_repeated_shapes_over_threshold():
+    stats = QueryStats()
+    for product_id in range(3):
+        stats.record(f"SELECT * FROM offers WHERE product_id = {product_id}", 0.001)
+    stats.record("SELECT * FROM products", 0.002)
+
+    assert stats.statements == 4
+    assert stats.slowest_statement == "SELECT * FROM products"
+    assert stats.repeated(2) == [("SELECT * FROM offers WHERE product_id = ?", 3)]
+    assert stats.repeated(3) == []
+
+
+def test_server_timing_header():
+    stats = QueryStats()
+    stats.record("SELECT 1", 0.004)
+
+    assert stats.server_timing() == 'db;dur=4.00;desc="1 queries", db-slowest;dur=4.00'
+
+
+def test_query_budget_fails_when_exceeded():
+    with pytest.raises(AssertionError):
+        with query_budget(statements=1) as stats:
+            stats.record("SELECT 1", 0.001)
+            stats.record("SELECT 2", 0.001)
+
+
+def test_track_queries_nests():
+    with track_queries() as outer:
+        with track_queries() as inner:
+            inner.record("SELECT 1", 0.001)
+        outer.record("SELECT 2", 0.001)
+
+    assert inner.statements == 1
+    assert outer.statements == 1
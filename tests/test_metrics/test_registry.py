@@ -0,0 +1,53 @@
+import pytest
+
+from app.metrics.registry import Registry
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram(
+        "latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0)
+    )
+    latency.labels("/product/{product_id}").observe(0.05)
+    latency.labels("/product/{product_id}").observe(0.5)
+    latency.labels("/product/{product_id}").observe(5)
+
+    output = registry.render()
+
+    assert "# TYPE latency_seconds histogram" in output
+    assert 'latency_seconds_bucket{route="/product/{product_id}",le="0.1"} 1' in output
+    assert 'latency_seconds_bucket{route="/product/{product_id}",le="1.0"} 2' in output
+    assert 'latency_seconds_bucket{route="/product/{product_id}",le="+Inf"} 3' in output
+    assert 'latency_seconds_count{route="/product/{product_id}"} 3' in output
+
+
+def test_unlabelled_counter_is_exported_at_zero():
+    registry = Registry()
+    registry.counter("retries", "Retries.")
+
+    assert "retries_total 0.0" in registry.render()
+
+
+def test_gauge_function_is_read_at_scrape_time():
+    registry = Registry()
+    value = {"lag": None}
+    registry.gauge("lag_seconds", "Lag.", function=lambda: value["lag"])
+
+    assert "\nlag_seconds " not in registry.render()
+    value["lag"] = 2.5
+    assert "lag_seconds 2.5" in registry.render()
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("calls", "Calls.", ("endpoint",)).labels('a"b').inc()
+
+    assert 'calls_total{endpoint="a\\"b"} 1.0' in registry.render()
+
+
+def test_wrong_label_count_is_rejected():
+    registry = Registry()
+    counter = registry.counter("calls", "Calls.", ("endpoint", "status"))
+
+    with pytest.raises(ValueError):
+        counter.labels("offers")
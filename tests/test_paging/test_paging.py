@@ -0,0 +1,31 @@
+from uuid import UUID
+
+import pytest
+
+from app.db.err import InvalidCursor
+from app.paging.paging import Pagination, decode_cursor, encode_cursor
+
+
+def test_pagination_pages():
+    paging = Pagination(total_items=25, offset=10, limit=10)
+
+    assert paging.page == 2
+    assert paging.total_pages == 3
+
+
+def test_cursor_round_trip():
+    offer_id = UUID("16be5a82-422a-88e2-7a75-9b7d9d41628f")
+    cursor = encode_cursor("2011-08-12T20:17:46.384000", offer_id)
+
+    assert decode_cursor(cursor) == ["2011-08-12T20:17:46.384000", str(offer_id)]
+
+
+def test_cursor_invalid():
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not-a-cursor")
+
+
+def test_cursor_with_non_string_values_is_invalid():
+    # "WzVd" is [5], UUID(5) would raise AttributeError
+    with pytest.raises(InvalidCursor):
+        decode_cursor("WzVd")
@@ -0,0 +1,138 @@
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from fastapi import status
+from sqlalchemy import insert
+
+from app.auth.jwt_handler import signJWT
+from app.db import export
+from app.db.offer_ingest import insert_offer_rows
+from app.db.tables.products import Product
+from app.settings.conf import settings
+
+
+class SessionEngine:
+    """Streams on the test session's connection, which holds the test data."""
+
+    def __init__(self, session):
+        self.session = session
+
+    @asynccontextmanager
+    async def connect(self):
+        yield await self.session.connection()
+
+
+@pytest.fixture()
+def headers(db_session, monkeypatch):
+    monkeypatch.setattr(export, "async_engine", SessionEngine(db_session))
+    token = signJWT(email="test@test.com").get("access_token")
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def add_product(db_session, name, is_deleted=False):
+    product_id = uuid4()
+    await db_session.execute(
+        insert(Product).values(
+            id=product_id, name=name, description="d", is_deleted=is_deleted
+        )
+    )
+    return product_id
+
+
+def snapshot(product_id, offer_id, created_at, price):
+    return {
+        "product_id": product_id,
+        "offer_id": offer_id,
+        "created_at": created_at,
+        "price": price,
+        "items_in_stock": 1,
+    }
+
+
+async def read_lines(async_client, url, headers, **kwargs):
+    async with async_client.stream("GET", url, headers=headers, **kwargs) as response:
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        return [json.loads(line) async for line in response.aiter_lines() if line]
+
+
+@pytest.mark.asyncio
+async def test_export_products_one_line_per_product(async_client, db_session, headers):
+    with_offers = await add_product(db_session, "a")
+    without_offers = await add_product(db_session, "b")
+    await add_product(db_session, "deleted", is_deleted=True)
+    offer_ids = sorted([uuid4(), uuid4()])
+    await insert_offer_rows(
+        db_session,
+        [
+            snapshot(with_offers, offer_id, datetime(2024, 3, 5, 14, 0), price)
+            for offer_id, price in zip(offer_ids, (100, 200))
+        ],
+    )
+
+    lines = await read_lines(async_client, "/api/export/products", headers)
+
+    by_id = {line["id"]: line for line in lines}
+    assert set(by_id) == {str(with_offers), str(without_offers)}
+    assert [offer["offer_id"] for offer in by_id[str(with_offers)]["offers"]] == [
+        str(offer_id) for offer_id in offer_ids
+    ]
+    assert by_id[str(with_offers)]["offers"][0]["price"] == 100
+    assert by_id[str(with_offers)]["offers"][0]["created_at"].startswith(
+        "2024-03-05T14:00:00"
+    )
+    assert by_id[str(without_offers)]["offers"] == []
+
+
+@pytest.mark.asyncio
+async def test_export_offer_history_filters_by_time(
+    async_client, db_session, headers, monkeypatch
+):
+    monkeypatch.setattr(settings, "offer_history_mode", "full")
+    product_id, offer_id = await add_product(db_session, "a"), uuid4()
+    await insert_offer_rows(
+        db_session,
+        [
+            snapshot(product_id, offer_id, datetime(2024, 3, 5, hour), 100 + hour)
+            for hour in (10, 11, 12, 13)
+        ],
+    )
+    url = f"/api/export/offer/{offer_id}/history"
+
+    lines = await read_lines(async_client, url, headers)
+    assert [line["price"] for line in lines] == [110, 111, 112, 113]
+    assert set(lines[0]) == {
+        "created_at",
+        "price",
+        "items_in_stock",
+        "last_confirmed_at",
+    }
+
+    lines = await read_lines(
+        async_client,
+        url,
+        headers,
+        params={"start_time": "2024-03-05T11:00:00", "end_time": "2024-03-05T12:00:00"},
+    )
+    assert [line["price"] for line in lines] == [111, 112]
+
+
+@pytest.mark.asyncio
+async def test_export_offer_history_rejects_inverted_window(async_client, headers):
+    response = await async_client.get(
+        f"/api/export/offer/{uuid4()}/history",
+        headers=headers,
+        params={"start_time": "2024-03-06T00:00:00", "end_time": "2024-03-05T00:00:00"},
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_export_requires_auth(async_client):
+    response = await async_client.get("/api/export/products")
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -1,10 +1,13 @@
+from datetime import datetime
 from uuid import UUID
 
 import pytest
 from fastapi import status
 
 from app.auth.jwt_handler import signJWT
+from app.db.offer_ingest import insert_offer_rows
 from app.internal_models.models import Token
+from app.settings.conf import settings
 import json
 from unittest.mock import patch
 
@@ -38,53 +41,263 @@ async def test_get_products_no_product(async_client):
     assert response.status_code == status.HTTP_404_NOT_FOUND
 
 
+def offer_service(offers):
+    """Stand-in for offer_handler._send answering register and offers calls."""
+
+    async def _send(endpoint, method, url, **kwargs):
+        if endpoint == "offers":
+            return httpx.Response(status.HTTP_200_OK, json=offers)
+        return httpx.Response(status.HTTP_201_CREATED, json={"access_token": "token"})
+
+    return patch("app.external_service.offer_handler._send", new=_send)
+
+
 @pytest.mark.asyncio
 async def test_get_products(async_client, create_product):
-    product_created_mock_response = {"id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"}
     offer_data_mock_response = [{"id": "16be5a82-422a-88e2-7a75-9b7d9d41628f", "price":1500, "items_in_stock": 5, "product_id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"},
                                 {"id": "16be5a82-422a-88e2-7a75-9b7d9d41627f", "price":1600, "items_in_stock": 6, "product_id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"}]
-    with patch('app.external_service.offer_handler.httpx.AsyncClient.post') as mock_post:
-        with patch('app.external_service.offer_handler.httpx.AsyncClient.get') as mock_get:
-            mock_post.return_value = httpx.Response(status.HTTP_201_CREATED, json=product_created_mock_response)
-            mock_get.return_value = httpx.Response(status.HTTP_200_OK, json=offer_data_mock_response)
-            
-            product = create_product()
-            token: Token = signJWT(email="test@test.com").get("access_token")
-            headers = {"Authorization": f"Bearer {token}"}
-
-            response_create = await async_client.post(
-                url="/api/product", data=json.dumps(product.dict(exclude={"id", "is_deleted"}), cls=CustomEncoder), headers=headers
-            )
-
-            response = await async_client.get("/api/products", headers=headers)
-
-            assert response.status_code == status.HTTP_200_OK
-            assert response.json()[0].get("id") == "16be5a82-422a-88e2-7a75-9b7d9d41628f"
-            assert response.json()[0].get("price") == 1500
-            assert response.json()[0].get("items_in_stock") == 5
-            assert response.json()[1].get("id") == "16be5a82-422a-88e2-7a75-9b7d9d41627f"
-            assert response.json()[1].get("price") == 1600
-            assert response.json()[1].get("items_in_stock") == 6
-            assert len(response.json()) == 2
+    with offer_service(offer_data_mock_response):
+        product = create_product()
+        token: Token = signJWT(email="test@test.com").get("access_token")
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response_create = await async_client.post(
+            url="/api/product", data=json.dumps(product.dict(exclude={"id", "is_deleted"}), cls=CustomEncoder), headers=headers
+        )
+
+        response = await async_client.get("/api/products", headers=headers)
+
+        assert response_create.status_code == status.HTTP_201_CREATED
+        assert response.status_code == status.HTTP_200_OK
+        products = response.json()["products"]
+        assert len(products) == 1
+        assert products[0].get("id") == response_create.json()["id"]
+        offers = sorted(products[0]["offers"], key=lambda offer: offer["price"])
+        assert offers[0].get("offer_id") == "16be5a82-422a-88e2-7a75-9b7d9d41628f"
+        assert offers[0].get("price") == 1500
+        assert offers[0].get("items_in_stock") == 5
+        assert offers[1].get("offer_id") == "16be5a82-422a-88e2-7a75-9b7d9d41627f"
+        assert offers[1].get("price") == 1600
+        assert offers[1].get("items_in_stock") == 6
+        assert len(offers) == 2
 
 
 @pytest.mark.asyncio
 async def test_get_product_by_id(async_client, create_product):
-    product_created_mock_response = {"id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"}
     offer_data_mock_response = [{"id": "16be5a82-422a-88e2-7a75-9b7d9d41628f", "price":1500, "items_in_stock": 5, "product_id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"}]
-    with patch('app.external_service.offer_handler.httpx.AsyncClient.post') as mock_post:
-        with patch('app.external_service.offer_handler.httpx.AsyncClient.get') as mock_get:
-            mock_post.return_value = httpx.Response(status.HTTP_201_CREATED, json=product_created_mock_response)
-            mock_get.return_value = httpx.Response(status.HTTP_200_OK, json=offer_data_mock_response)
-            product = create_product()
-            token: Token = signJWT(email="test@test.com").get("access_token")
-            headers = {"Authorization": f"Bearer {token}"}
-            response_create = await async_client.post(
-                        url="/api/product", data=json.dumps(product.dict(exclude={"id", "is_deleted"}), cls=CustomEncoder), headers=headers
-                    )
-            response = await async_client.get("/api/product/16be5a82-422a-88e2-7a75-9b7d9d41629f", headers=headers)
-            assert response.status_code == status.HTTP_200_OK
-            assert response.json()[0].get("id") == "16be5a82-422a-88e2-7a75-9b7d9d41628f"
-            assert response.json()[0].get("price") == 1500
-            assert response.json()[0].get("items_in_stock") == 5
-            assert len(response.json()) == 1
+    with offer_service(offer_data_mock_response):
+        product = create_product()
+        token: Token = signJWT(email="test@test.com").get("access_token")
+        headers = {"Authorization": f"Bearer {token}"}
+        response_create = await async_client.post(
+                    url="/api/product", data=json.dumps(product.dict(exclude={"id", "is_deleted"}), cls=CustomEncoder), headers=headers
+                )
+        product_id = response_create.json()["id"]
+        response = await async_client.get(f"/api/product/{product_id}", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        offers = response.json()["offers"]
+        assert offers[0].get("offer_id") == "16be5a82-422a-88e2-7a75-9b7d9d41628f"
+        assert offers[0].get("price") == 1500
+        assert offers[0].get("items_in_stock") == 5
+        assert len(offers) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_product_not_modified(async_client, create_product):
+    offer_data_mock_response = [{"id": "16be5a82-422a-88e2-7a75-9b7d9d41628f", "price":1500, "items_in_stock": 5, "product_id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"}]
+    with offer_service(offer_data_mock_response):
+        product = create_product()
+        token: Token = signJWT(email="test@test.com").get("access_token")
+        headers = {"Authorization": f"Bearer {token}"}
+        response_create = await async_client.post(
+            url="/api/product", data=json.dumps(product.dict(exclude={"id", "is_deleted"}), cls=CustomEncoder), headers=headers
+        )
+        product_id = response_create.json()["id"]
+        response = await async_client.get(f"/api/product/{product_id}", headers=headers)
+        etag = response.headers["ETag"]
+
+        response_cached = await async_client.get(
+            f"/api/product/{product_id}", headers={**headers, "If-None-Match": etag}
+        )
+        assert response_cached.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response_cached.headers["ETag"] == etag
+        assert response_cached.content == b""
+
+        await async_client.put(
+            url=f"/api/product/{product_id}", data=json.dumps({"name": "renamed", "description": "test-desc"}), headers=headers
+        )
+        response_changed = await async_client.get(
+            f"/api/product/{product_id}", headers={**headers, "If-None-Match": etag}
+        )
+        assert response_changed.status_code == status.HTTP_200_OK
+        assert response_changed.headers["ETag"] != etag
+        assert response_changed.json()["name"] == "renamed"
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_products_partial_failure(async_client):
+    offer_data_mock_response = [{"id": "16be5a82-422a-88e2-7a75-9b7d9d41628f", "price":1500, "items_in_stock": 5, "product_id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"}]
+
+    async def _send(endpoint, method, url, **kwargs):
+        if endpoint == "offers":
+            return httpx.Response(status.HTTP_200_OK, json=offer_data_mock_response)
+        if endpoint == "register" and "rejected" in kwargs.get("content", ""):
+            return httpx.Response(status.HTTP_400_BAD_REQUEST, json={})
+        return httpx.Response(status.HTTP_201_CREATED, json={"access_token": "token"})
+
+    with patch("app.external_service.offer_handler._send", new=_send):
+        token: Token = signJWT(email="test@test.com").get("access_token")
+        headers = {"Authorization": f"Bearer {token}"}
+        items = [
+            {"name": "first", "description": "test-desc"},
+            {"name": "rejected", "description": "test-desc"},
+            {"description": "no name"},
+        ]
+        response = await async_client.post(
+            url="/api/products/bulk", data=json.dumps(items), headers=headers
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        body = response.json()
+        assert (body["created"], body["failed"]) == (1, 2)
+        results = body["results"]
+        assert [result["index"] for result in results] == [0, 1, 2]
+        assert [result["status"] for result in results] == ["created", "failed", "failed"]
+        assert results[1]["detail"] == "Product registration in offer service failed."
+
+        response_products = await async_client.get("/api/products", headers=headers)
+        products = response_products.json()["products"]
+        assert [product["id"] for product in products] == [results[0]["id"]]
+        assert products[0]["offers"][0].get("price") == 1500
+
+
+@pytest.mark.asyncio
+async def test_product_etag_ignores_other_products(async_client, create_product):
+    offer_data_mock_response = [{"id": "16be5a82-422a-88e2-7a75-9b7d9d41628f", "price":1500, "items_in_stock": 5, "product_id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"}]
+    with offer_service(offer_data_mock_response):
+        token: Token = signJWT(email="test@test.com").get("access_token")
+        headers = {"Authorization": f"Bearer {token}"}
+        response_create = await async_client.post(
+            url="/api/product", data=json.dumps(create_product().dict(exclude={"id", "is_deleted"}), cls=CustomEncoder), headers=headers
+        )
+        product_id = response_create.json()["id"]
+        etag = (await async_client.get(f"/api/product/{product_id}", headers=headers)).headers["ETag"]
+
+        await async_client.post(
+            url="/api/product", data=json.dumps(create_product(name="other").dict(exclude={"id", "is_deleted"}), cls=CustomEncoder), headers=headers
+        )
+        response = await async_client.get(
+            f"/api/product/{product_id}", headers={**headers, "If-None-Match": etag}
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.asyncio
+async def test_get_missing_product_with_any_etag(async_client):
+    token: Token = signJWT(email="test@test.com").get("access_token")
+    headers = {"Authorization": f"Bearer {token}", "If-None-Match": "*"}
+    response = await async_client.get(
+        "/api/product/16be5a82-422a-88e2-7a75-9b7d9d41629f", headers=headers
+    )
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_get_offer_history_not_modified(async_client, create_product):
+    offer_id = "16be5a82-422a-88e2-7a75-9b7d9d41628f"
+    offer_data_mock_response = [{"id": offer_id, "price":1500, "items_in_stock": 5, "product_id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"}]
+    with offer_service(offer_data_mock_response):
+        token: Token = signJWT(email="test@test.com").get("access_token")
+        headers = {"Authorization": f"Bearer {token}"}
+        await async_client.post(
+            url="/api/product", data=json.dumps(create_product().dict(exclude={"id", "is_deleted"}), cls=CustomEncoder), headers=headers
+        )
+        response = await async_client.get(f"/api/offer/{offer_id}/history/10/0", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        etag = response.headers["ETag"]
+
+        response_cached = await async_client.get(
+            f"/api/offer/{offer_id}/history/10/0", headers={**headers, "If-None-Match": etag}
+        )
+        assert response_cached.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.asyncio
+async def test_get_offer_history_offset_and_cursor_pages(
+    async_client, db_session, create_product, monkeypatch
+):
+    monkeypatch.setattr(settings, "offer_history_mode", "full")
+    offer_id = "16be5a82-422a-88e2-7a75-9b7d9d41628f"
+    offer_data_mock_response = [{"id": offer_id, "price": 1500, "items_in_stock": 5, "product_id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"}]
+    token: Token = signJWT(email="test@test.com").get("access_token")
+    headers = {"Authorization": f"Bearer {token}"}
+    with offer_service(offer_data_mock_response):
+        response_create = await async_client.post(
+            url="/api/product", data=json.dumps(create_product().dict(exclude={"id", "is_deleted"}), cls=CustomEncoder), headers=headers
+        )
+    # Four older snapshots before the one taken on create
+    await insert_offer_rows(
+        db_session,
+        [
+            {
+                "product_id": UUID(response_create.json()["id"]),
+                "offer_id": UUID(offer_id),
+                "created_at": datetime(2024, 3, 5, 14, minute),
+                "price": 1000 + minute,
+                "items_in_stock": 1,
+            }
+            for minute in range(4)
+        ],
+    )
+
+    response = await async_client.get(f"/api/offer/{offer_id}/history/2/0", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    paging = response.json()["paging"]
+    assert (paging["page"], paging["offset"], paging["total_pages"]) == (1, 0, 3)
+    assert [item["price"] for item in response.json()["history"]] == [1000, 1001]
+
+    response = await async_client.get(f"/api/offer/{offer_id}/history/2/2", headers=headers)
+    assert response.json()["paging"]["page"] == 2
+    assert [item["price"] for item in response.json()["history"]] == [1002, 1003]
+
+    # The cursor page continues where the first one stopped, without a count
+    response = await async_client.get(
+        f"/api/offer/{offer_id}/history/2/0", headers=headers, params={"cursor": paging["next_cursor"]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    paging = response.json()["paging"]
+    assert (paging["page"], paging["offset"], paging["total_pages"]) == (None, None, None)
+    assert [item["price"] for item in response.json()["history"]] == [1002, 1003]
+
+    response = await async_client.get(
+        f"/api/offer/{offer_id}/history/2/0", headers=headers, params={"cursor": paging["next_cursor"]}
+    )
+    assert [item["price"] for item in response.json()["history"]] == [1500]
+    assert response.json()["paging"]["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_get_offer_history_empty_pages(async_client, create_product):
+    offer_id = "16be5a82-422a-88e2-7a75-9b7d9d41628f"
+    offer_data_mock_response = [{"id": offer_id, "price": 1500, "items_in_stock": 5, "product_id": "16be5a82-422a-88e2-7a75-9b7d9d41629f"}]
+    token: Token = signJWT(email="test@test.com").get("access_token")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = await async_client.get(f"/api/offer/{offer_id}/history/1/0", headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    with offer_service(offer_data_mock_response):
+        await async_client.post(
+            url="/api/product", data=json.dumps(create_product().dict(exclude={"id", "is_deleted"}), cls=CustomEncoder), headers=headers
+        )
+    response = await async_client.get(f"/api/offer/{offer_id}/history/1/0", headers=headers)
+    next_cursor = response.json()["paging"]["next_cursor"]
+
+    # Past the last snapshot the cursor page is empty rather than missing
+    response = await async_client.get(
+        f"/api/offer/{offer_id}/history/1/0", headers=headers, params={"cursor": next_cursor}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["history"] == []
+    assert response.json()["paging"]["next_cursor"] is None